@@ -1,6 +1,8 @@
+import os
+import uuid
 from fastapi import FastAPI, HTTPException, status
 from pydantic import BaseModel
-from typing import Literal
+from typing import Literal, Optional
 from trading_system.trading_system import TradingSystem
 from trading_system.order_book import Order
 from trading_system.portfolio import Position
@@ -8,10 +10,20 @@ from trading_system.portfolio import Position
 
 class OrderRequest(BaseModel):
     ticker: str
-    side: str
-    order_price: float
+    side: Literal["bid", "ask"]
     quantity: int
-    order_kind: str = "limit"
+    order_price: Optional[float] = None
+    order_kind: Literal["market", "limit", "stop", "stop_limit"] = "limit"
+    order_id: Optional[str] = None
+    stop_price: Optional[float] = None
+    time_in_force: Literal["GTC", "IOC", "FOK", "GTD", "DAY"] = "GTC"
+    post_only: bool = False
+    expire_ns: Optional[int] = None
+
+
+class ModifyOrderRequest(BaseModel):
+    quantity: Optional[int] = None
+    order_price: Optional[float] = None
 
 
 class TradeRequest(BaseModel):
@@ -24,7 +36,9 @@ class TradeRequest(BaseModel):
 
 
 app = FastAPI(title="Trading system")
-trading_system = TradingSystem()
+# Repository is chosen per deployment: memory by default, redis, redis_incremental or file
+trading_system = TradingSystem(repository=os.environ.get("TRADING_SYSTEM_REPOSITORY", "memory"),
+                               warm_load=os.environ.get("TRADING_SYSTEM_WARM_LOAD") == "1")
 
 
 @app.get("/portfolio/{portfolio_id}")
@@ -56,14 +70,134 @@ def get_order_book(ticker: str):
 
     return {
         "ticker": ticker,
-        "best_bid": best_bid.order_price if best_bid else None,
-        "best_ask": best_ask.order_price if best_ask else None,
+        "best_bid": order_book.from_ticks(best_bid.order_price) if best_bid else None,
+        "best_ask": order_book.from_ticks(best_ask.order_price) if best_ask else None,
         "spread": order_book.get_spread(),
         "total_orders": len(order_book.order_id_map),
         "trades_executed": len(order_book.trades)
     }
 
 
+@app.get("/orderbook/{ticker}/depth")
+def get_order_book_depth(ticker: str, levels: int = 10):
+    if levels <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="LEVELS MUST BE POSITIVE")
+
+    order_book = trading_system.order_book_manager.load_order_book(ticker=ticker)
+
+    return {
+        "ticker": ticker,
+        "levels": levels,
+        **order_book.get_depth(levels=levels)
+    }
+
+
+@app.get("/orderbook/{ticker}/estimate")
+def estimate_fill(ticker: str, side: Literal["bid", "ask"], quantity: int, limit_price: Optional[float] = None):
+    order_book = trading_system.order_book_manager.load_order_book(ticker=ticker)
+
+    try:
+        estimate = order_book.estimate_fill(side=side, quantity=quantity, limit_price=limit_price)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"FAILED TO ESTIMATE FILL: {e}")
+
+    return {
+        "ticker": ticker,
+        **estimate
+    }
+
+
+@app.patch("/orderbook/{ticker}/orders/{order_id}")
+def modify_order(ticker: str, order_id: str, modify_request: ModifyOrderRequest):
+    order_book = trading_system.order_book_manager.load_order_book(ticker=ticker)
+
+    if order_id not in order_book.order_id_map:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"ORDER {order_id} NOT FOUND")
+
+    try:
+        # A new price that crosses the spread is matched before the remainder rests
+        order = trading_system.trade_processor.matching_engine.modify_order(order_id=order_id,
+                                                                            order_book=order_book,
+                                                                            new_qty=modify_request.quantity,
+                                                                            new_price=modify_request.order_price)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"FAILED TO MODIFY ORDER: {e}")
+
+    return {
+        "ticker": ticker,
+        "order_id": order_id,
+        "order_price": order_book.from_ticks(order.order_price),
+        "quantity": order.quantity,
+        "resting": order_id in order_book.order_id_map
+    }
+
+
+@app.post("/portfolio/{portfolio_id}/orders")
+def submit_order(portfolio_id: str, order_request: OrderRequest):
+    if order_request.quantity <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="QUANTITY MUST BE POSITIVE")
+
+    if order_request.order_kind in ("limit", "stop_limit") and order_request.order_price is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="LIMIT ORDER REQUIRES A PRICE")
+
+    order_book = trading_system.order_book_manager.load_order_book(ticker=order_request.ticker)
+    order_id = order_request.order_id or uuid.uuid4().hex
+
+    if order_id in order_book.order_id_map or order_id in order_book.stops.order_id_map:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"ORDER {order_id} ALREADY EXISTS")
+
+    try:
+        order = Order(order_id=order_id,
+                      portfolio_id=portfolio_id,
+                      side=order_request.side,
+                      order_kind=order_request.order_kind,
+                      order_price=order_request.order_price,
+                      quantity=order_request.quantity,
+                      ticker=order_request.ticker,
+                      stop_price=order_request.stop_price,
+                      time_in_force=order_request.time_in_force,
+                      post_only=order_request.post_only,
+                      expire_ns=order_request.expire_ns)
+
+        accepted = trading_system.trade_processor.matching_engine.process_order(order=order, order_book=order_book)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"FAILED TO SUBMIT ORDER: {e}")
+
+    # Rejected post-only and FOK orders keep their quantity, IOC and market remainders are cancelled
+    if not accepted:
+        order_status = "rejected"
+    elif order_id in order_book.stops.order_id_map:
+        order_status = "waiting_for_trigger"
+    elif order_id in order_book.order_id_map:
+        order_status = "resting"
+    elif order.quantity == 0:
+        order_status = "filled"
+    else:
+        order_status = "cancelled"
+
+    return {
+        "ticker": order_request.ticker,
+        "order_id": order_id,
+        "status": order_status,
+        "filled_quantity": order_request.quantity - order.quantity if accepted else 0,
+        "remaining_quantity": order.quantity
+    }
+
+
+@app.delete("/portfolio/{portfolio_id}/orders")
+def cancel_portfolio_orders(portfolio_id: str, ticker: Optional[str] = None):
+    cancelled = trading_system.order_book_manager.cancel_all(portfolio_id=portfolio_id, ticker=ticker)
+
+    for book_ticker in cancelled:
+        trading_system.order_book_manager.save_order_book(ticker=book_ticker)
+
+    return {
+        "portfolio_id": portfolio_id,
+        "cancelled_orders": cancelled,
+        "total_cancelled": sum(len(order_ids) for order_ids in cancelled.values())
+    }
+
+
 @app.post("/portfolio/{portfolio_id}/trade-requests")
 def portfolio_trade_request(portfolio_id: str, trade_request: TradeRequest):
     try:
@@ -175,6 +309,7 @@ def create_sample_order_book(ticker: str, num_orders: int = 10000):
 
     order_book = trading_system.order_book_manager.load_order_book(ticker=ticker)
     base_price = 100
+    orders = []
 
     for i in range(num_orders):
         side = "bid"
@@ -190,7 +325,7 @@ def create_sample_order_book(ticker: str, num_orders: int = 10000):
             order_kind="limit"
         )
 
-        order_book.add_order(order)
+        orders.append(order)
 
     for i in range(num_orders):
         side = "ask"
@@ -206,6 +341,8 @@ def create_sample_order_book(ticker: str, num_orders: int = 10000):
             order_kind="limit"
         )
 
-        order_book.add_order(order)
+        orders.append(order)
+
+    order_book.add_orders(orders)
 
     return {"message": f"ADDED {2 * num_orders} ORDERS TO {ticker}"}
@@ -1,13 +1,33 @@
+import gc
+import sys
 import time
+import pickle
+import tempfile
+import tracemalloc
 import threading
 import yfinance as yf
 import numpy as np
+from pathlib import Path
+
+# Run as a script from any directory, trading_system and src are imported from the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
 from trading_system import TradingSystem
 from trading_system.order_book import Order, OrderBook
+from trading_system.matching_engine import MatchingEngine
+from trading_system.auction import CallAuction
+from trading_system.journal import Journal, read_journal, replay
+from trading_system import snapshot
+from trading_system.repository import create_repository
+from trading_system.portfolio import Portfolio
+from src.replay import generate_events, compare_variants
 
 class Benchmark:
-    def __init__(self):
-        self.ts = TradingSystem()
+    def __init__(self, repository="memory"):
+        """
+        :param repository: Repository of the trading system, in memory by default so no redis server is needed
+        """
+        self.ts = TradingSystem(repository=repository)
 
     def benchmark_processing(self, total_orders=200000):
         """
@@ -41,6 +61,55 @@ class Benchmark:
             "total_orders": total_orders
         }
 
+    def benchmark_bulk_insert(self, total_orders=200000, warm_orders=100000):
+        """
+        Compare loading orders one at a time with add_order against the bulk add_orders path,
+        into a new book and into a book that already holds orders
+        """
+        prices = np.round(100 + np.random.uniform(-2.5, 2.5, total_orders + warm_orders), 2).tolist()
+
+        def make_orders(start, count):
+            return [Order(order_id=f"bulk_{i}",
+                          portfolio_id="benchmark",
+                          side="bid" if i % 2 == 0 else "ask",
+                          order_kind="limit",
+                          order_price=prices[i] - 2.5 if i % 2 == 0 else prices[i] + 2.5,
+                          quantity=100,
+                          ticker="BENCHMARK") for i in range(start, start + count)]
+
+        results = {}
+
+        for book_state in ("new", "warm"):
+            for method in ("add_order", "add_orders"):
+                order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+
+                if book_state == "warm":
+                    order_book.add_orders(make_orders(total_orders, warm_orders))
+
+                orders = make_orders(0, total_orders)
+
+                gc.disable()
+                start_time = time.perf_counter()
+
+                if method == "add_orders":
+                    order_book.add_orders(orders)
+                else:
+                    for order in orders:
+                        order_book.add_order(order)
+
+                end_time = time.perf_counter()
+                gc.enable()
+
+                results[f"{book_state}_{method}"] = {
+                    "throughput": total_orders / (end_time - start_time),
+                    "total_time": end_time - start_time
+                }
+
+            results[f"{book_state}_speedup"] = (results[f"{book_state}_add_order"]["total_time"] /
+                                                results[f"{book_state}_add_orders"]["total_time"])
+
+        return results
+
     def test_concurrent_simulators(self):
         simulators = []
         threads = []
@@ -142,6 +211,719 @@ class Benchmark:
             "match_rate": matched_orders / total_orders
         }
 
+    def benchmark_deep_book_matching(self, price_levels=10000, total_orders=4000):
+        """
+        Compare matching throughput on a book with many price levels with the cached
+        best price pointers against walking the tree from the root on every read
+        """
+        return {
+            "cached": self.run_deep_book_matching(price_levels, total_orders, cached=True),
+            "uncached": self.run_deep_book_matching(price_levels, total_orders, cached=False)
+        }
+
+    def run_deep_book_matching(self, price_levels, total_orders, cached=True):
+        order_book = OrderBook(ticker="BENCHMARK")
+        base_price = 100
+        tick = 0.01
+
+        for i in range(price_levels):
+            order_book.add_order(Order(order_id=f"deep_bid_{i}",
+                                       portfolio_id="market_maker",
+                                       side="bid",
+                                       order_kind="limit",
+                                       order_price=round(base_price - (i + 1) * tick, 2),
+                                       quantity=100,
+                                       ticker="BENCHMARK"))
+            order_book.add_order(Order(order_id=f"deep_ask_{i}",
+                                       portfolio_id="market_maker",
+                                       side="ask",
+                                       order_kind="limit",
+                                       order_price=round(base_price + (i + 1) * tick, 2),
+                                       quantity=100,
+                                       ticker="BENCHMARK"))
+
+        if not cached:
+            # Every top of book read walks down from the root and past emptied levels
+            for tree in (order_book.bids, order_book.asks):
+                tree.get_best_order = lambda tree=tree: next(iter(tree.find_best_node().values.values()))
+
+        orders = [Order(order_id=f"deep_test_{i}",
+                        portfolio_id="trader",
+                        side="bid" if i % 2 == 0 else "ask",
+                        order_kind="limit",
+                        order_price=base_price * 2 if i % 2 == 0 else 0,
+                        quantity=250,
+                        ticker="BENCHMARK") for i in range(total_orders)]
+
+        engine = MatchingEngine()
+        start_time = time.time()
+
+        for order in orders:
+            engine.process_order(order, order_book=order_book)
+
+        end_time = time.time()
+
+        return {
+            "mean_latency": (end_time - start_time) / total_orders,
+            "throughput": total_orders / (end_time - start_time),
+            "total_time": end_time - start_time,
+            "total_orders": total_orders,
+            "price_levels": price_levels,
+            "trades": len(order_book.trades)
+        }
+
+    def benchmark_soak(self, cycles=2000000, resting_orders=10000, checkpoints=10, reads=1000):
+        """
+        Run add/cancel cycles with random prices and record the tree size and best price
+        latency at regular checkpoints. Both should stay flat as empty levels are removed.
+        """
+        order_book = OrderBook(ticker="BENCHMARK")
+        base_price = 100
+        live_orders = []
+        results = []
+        chunk = cycles // checkpoints
+        order_number = 0
+        start_time = time.time()
+
+        for checkpoint in range(checkpoints):
+            prices = np.round(base_price + np.random.uniform(-5, 5, chunk + resting_orders), 2)
+            cancel_positions = np.random.random(chunk)
+
+            for i in range(chunk + (resting_orders if checkpoint == 0 else 0)):
+                side = "bid" if order_number % 2 == 0 else "ask"
+                order = Order(order_id=f"soak_{order_number}",
+                              portfolio_id="soak",
+                              side=side,
+                              order_kind="limit",
+                              order_price=prices[i] - 5 if side == "bid" else prices[i] + 5,
+                              quantity=100,
+                              ticker="BENCHMARK")
+                order_book.add_order(order)
+                live_orders.append(order.order_id)
+                order_number += 1
+
+                if len(live_orders) > resting_orders:
+                    # Swap a random live order to the end so removal is O(1)
+                    position = int(cancel_positions[i % chunk] * len(live_orders))
+                    live_orders[position], live_orders[-1] = live_orders[-1], live_orders[position]
+                    order_book.cancel_order(order_id=live_orders.pop())
+
+            read_start = time.perf_counter()
+            for _ in range(reads):
+                order_book.get_best_bid()
+                order_book.get_best_ask()
+            read_end = time.perf_counter()
+
+            results.append({
+                "cycles": (checkpoint + 1) * chunk,
+                "bid_levels": order_book.bids.node_count,
+                "ask_levels": order_book.asks.node_count,
+                "best_price_latency": (read_end - read_start) / (2 * reads)
+            })
+
+        end_time = time.time()
+
+        return {
+            "total_time": end_time - start_time,
+            "cycles": cycles,
+            "resting_orders": len(order_book.order_id_map),
+            "checkpoints": results
+        }
+
+    def benchmark_backends(self, total_orders=100000, tick_size=0.01):
+        """
+        Compare add, cancel and match throughput of the tree and ladder order book backends
+        on the same pregenerated order flow concentrated around the mid price
+        """
+        base_price = 100
+        sides = ["bid" if i % 2 == 0 else "ask" for i in range(total_orders)]
+        offsets = np.round(np.random.uniform(0.01, 2.0, total_orders), 2)
+        quantities = np.random.randint(1, 200, total_orders)
+        cancel_ids = [f"backend_{i}" for i in np.random.permutation(total_orders)[:total_orders // 2]]
+        results = {}
+
+        for backend in ("tree", "ladder"):
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=tick_size, backend=backend)
+            orders = [Order(order_id=f"backend_{i}",
+                            portfolio_id="benchmark",
+                            side=sides[i],
+                            order_kind="limit",
+                            order_price=base_price - offsets[i] if sides[i] == "bid" else base_price + offsets[i],
+                            quantity=int(quantities[i]),
+                            ticker="BENCHMARK") for i in range(total_orders)]
+
+            start_time = time.time()
+            for order in orders:
+                order_book.add_order(order)
+            add_time = time.time() - start_time
+
+            start_time = time.time()
+            for order_id in cancel_ids:
+                order_book.cancel_order(order_id=order_id)
+            cancel_time = time.time() - start_time
+
+            aggressive_orders = [Order(order_id=f"backend_aggressive_{i}",
+                                       portfolio_id="benchmark",
+                                       side=sides[i],
+                                       order_kind="limit",
+                                       order_price=base_price + 2 if sides[i] == "bid" else base_price - 2,
+                                       quantity=int(quantities[i]),
+                                       ticker="BENCHMARK") for i in range(total_orders // 4)]
+
+            engine = MatchingEngine()
+            start_time = time.time()
+            for order in aggressive_orders:
+                engine.process_order(order, order_book=order_book)
+            match_time = time.time() - start_time
+
+            results[backend] = {
+                "add_throughput": total_orders / add_time,
+                "cancel_throughput": len(cancel_ids) / cancel_time,
+                "match_throughput": len(aggressive_orders) / match_time,
+                "trades": len(order_book.trades)
+            }
+
+        return results
+
+    def benchmark_memory(self, resting_orders=200000, total_trades=100000):
+        """
+        Measure memory used per resting order and per trade with tracemalloc
+        """
+        tracemalloc.start()
+
+        snapshot_start = tracemalloc.take_snapshot()
+        order_book = OrderBook(ticker="BENCHMARK")
+
+        for i in range(resting_orders):
+            order_book.add_order(Order(order_id=f"memory_{i}",
+                                       portfolio_id="benchmark",
+                                       side="bid" if i % 2 == 0 else "ask",
+                                       order_kind="limit",
+                                       order_price=round(100 - 0.01 * (i % 500) - 0.01, 2) if i % 2 == 0
+                                       else round(100 + 0.01 * (i % 500) + 0.01, 2),
+                                       quantity=total_trades,
+                                       ticker="BENCHMARK"))
+
+        snapshot_orders = tracemalloc.take_snapshot()
+        engine = MatchingEngine()
+
+        # Each aggressive order fills one unit against the best resting order
+        for i in range(total_trades):
+            order = Order(order_id=f"memory_aggressive_{i}",
+                          portfolio_id="benchmark",
+                          side="bid" if i % 2 == 0 else "ask",
+                          order_kind="limit",
+                          order_price=200 if i % 2 == 0 else 0,
+                          quantity=1,
+                          ticker="BENCHMARK")
+            engine.process_order(order, order_book=order_book)
+            del order
+
+        snapshot_trades = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        order_bytes = sum(stat.size_diff for stat in snapshot_orders.compare_to(snapshot_start, "filename"))
+        trade_bytes = sum(stat.size_diff for stat in snapshot_trades.compare_to(snapshot_orders, "filename"))
+
+        return {
+            "resting_orders": resting_orders,
+            "bytes_per_order": order_bytes / resting_orders,
+            "total_trades": len(order_book.trades),
+            "bytes_per_trade": trade_bytes / len(order_book.trades)
+        }
+
+    def benchmark_sweep(self, price_levels=200, orders_per_level=50, total_orders=2000):
+        """
+        Compare the level sweeping matcher with matching one resting order per iteration
+        when each aggressive order takes a whole price level of small resting orders
+        """
+        results = {}
+
+        for sweep in (False, True):
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+            engine = MatchingEngine(sweep=sweep)
+            order_number = 0
+
+            def add_resting_level(side, price):
+                nonlocal order_number
+                for _ in range(orders_per_level):
+                    order_book.add_order(Order(order_id=f"sweep_resting_{order_number}",
+                                               portfolio_id="market_maker",
+                                               side=side,
+                                               order_kind="limit",
+                                               order_price=price,
+                                               quantity=10,
+                                               ticker="BENCHMARK"))
+                    order_number += 1
+
+            for level in range(price_levels):
+                add_resting_level("bid", round(99.99 - level * 0.01, 2))
+                add_resting_level("ask", round(100.01 + level * 0.01, 2))
+
+            aggressive_orders = [Order(order_id=f"sweep_aggressive_{i}",
+                                       portfolio_id="trader",
+                                       side="bid" if i % 2 == 0 else "ask",
+                                       order_kind="limit",
+                                       order_price=200 if i % 2 == 0 else 0,
+                                       quantity=10 * orders_per_level,
+                                       ticker="BENCHMARK") for i in range(total_orders)]
+
+            elapsed = 0
+            for i, order in enumerate(aggressive_orders):
+                # Garbage collection is paused while timing, like timeit does
+                gc.disable()
+                start_time = time.perf_counter()
+                engine.process_order(order, order_book=order_book)
+                elapsed += time.perf_counter() - start_time
+                gc.enable()
+
+                # Replace the level that was taken so the book keeps its depth
+                add_resting_level(order.side == "bid" and "ask" or "bid",
+                                  round(100.01 + (price_levels + i) * 0.01, 2) if order.side == "bid"
+                                  else round(99.99 - (price_levels + i) * 0.01, 2))
+
+            results["sweep" if sweep else "single"] = {
+                "mean_latency": elapsed / total_orders,
+                "throughput": total_orders / elapsed,
+                "fills_per_second": len(order_book.trades) / elapsed,
+                "trades": len(order_book.trades)
+            }
+
+        return results
+
+    def benchmark_batch_matching(self, total_orders=100000, batch_size=500):
+        """
+        Compare matching orders one call at a time with MatchingEngine.process_orders batches
+        on the same pregenerated order flow
+        """
+        aggressive = np.random.random(total_orders) < 0.3
+        offsets = np.random.uniform(0.5, 2.0, total_orders)
+        results = {}
+
+        for method in ("process_order", "process_orders"):
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+            engine = MatchingEngine()
+            orders = []
+
+            for i in range(total_orders):
+                side = "bid" if i % 2 == 0 else "ask"
+                crosses = aggressive[i]
+                if side == "bid":
+                    price = 100 + offsets[i] if crosses else 100 - offsets[i]
+                else:
+                    price = 100 - offsets[i] if crosses else 100 + offsets[i]
+
+                orders.append(Order(order_id=f"batch_{i}",
+                                    portfolio_id="trader",
+                                    side=side,
+                                    order_kind="limit",
+                                    order_price=price,
+                                    quantity=100,
+                                    ticker="BENCHMARK"))
+
+            gc.disable()
+            start_time = time.perf_counter()
+
+            if method == "process_orders":
+                for start in range(0, total_orders, batch_size):
+                    engine.process_orders(orders[start:start + batch_size], order_book=order_book)
+            else:
+                for order in orders:
+                    self.ts.trade_processor.match_order(order, order_book=order_book)
+
+            end_time = time.perf_counter()
+            gc.enable()
+
+            results[method] = {
+                "mean_latency": (end_time - start_time) / total_orders,
+                "throughput": total_orders / (end_time - start_time),
+                "trades": len(order_book.trades)
+            }
+
+        return results
+
+    def benchmark_auction(self, total_orders=100000, batch_size=500):
+        """
+        Compare continuous matching with a call auction that uncrosses once per batch
+        on the same pregenerated order flow
+        """
+        aggressive = np.random.random(total_orders) < 0.3
+        offsets = np.random.uniform(0.5, 2.0, total_orders)
+        results = {}
+
+        for mode in ("continuous", "auction"):
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+            engine = MatchingEngine()
+            auction = CallAuction(interval=0)
+            orders = []
+
+            for i in range(total_orders):
+                side = "bid" if i % 2 == 0 else "ask"
+                crosses = aggressive[i]
+                if side == "bid":
+                    price = 100 + offsets[i] if crosses else 100 - offsets[i]
+                else:
+                    price = 100 - offsets[i] if crosses else 100 + offsets[i]
+
+                orders.append(Order(order_id=f"auction_{i}",
+                                    portfolio_id="trader",
+                                    side=side,
+                                    order_kind="limit",
+                                    order_price=price,
+                                    quantity=100,
+                                    ticker="BENCHMARK"))
+
+            volume = 0
+            gc.disable()
+            start_time = time.perf_counter()
+
+            if mode == "auction":
+                for start in range(0, total_orders, batch_size):
+                    volume += auction.submit_orders(orders[start:start + batch_size], order_book=order_book)["volume"]
+            else:
+                for order in orders:
+                    engine.process_order(order, order_book=order_book)
+                volume = int(order_book.trades.last(len(order_book.trades))["quantity"].sum())
+
+            end_time = time.perf_counter()
+            gc.enable()
+
+            results[mode] = {
+                "mean_latency": (end_time - start_time) / total_orders,
+                "throughput": total_orders / (end_time - start_time),
+                "trades": len(order_book.trades),
+                "volume": volume
+            }
+
+        return results
+
+    def benchmark_stops(self, total_orders=50000, stop_populations=(0, 10000, 100000)):
+        """
+        Compare matching throughput on the same order flow with growing numbers of resting stops
+        Throughput should stay flat as only triggered stop prices are visited after each trade
+        """
+        aggressive = np.random.random(total_orders) < 0.3
+        offsets = np.random.uniform(0.5, 2.0, total_orders)
+        results = {}
+
+        for stop_count in stop_populations:
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+            engine = MatchingEngine()
+            stop_offsets = np.random.uniform(1.0, 20.0, stop_count)
+
+            # Stops sit above and below the market, the nearest ones trigger during the run
+            order_book.add_orders([Order(order_id=f"stop_{i}",
+                                         portfolio_id="stop_trader",
+                                         side="bid" if i % 2 == 0 else "ask",
+                                         order_kind="stop",
+                                         order_price=None,
+                                         quantity=10,
+                                         ticker="BENCHMARK",
+                                         stop_price=100 + stop_offsets[i] if i % 2 == 0 else 100 - stop_offsets[i])
+                                   for i in range(stop_count)])
+
+            orders = []
+
+            for i in range(total_orders):
+                side = "bid" if i % 2 == 0 else "ask"
+                crosses = aggressive[i]
+                if side == "bid":
+                    price = 100 + offsets[i] if crosses else 100 - offsets[i]
+                else:
+                    price = 100 - offsets[i] if crosses else 100 + offsets[i]
+
+                orders.append(Order(order_id=f"stops_{i}",
+                                    portfolio_id="trader",
+                                    side=side,
+                                    order_kind="limit",
+                                    order_price=price,
+                                    quantity=100,
+                                    ticker="BENCHMARK"))
+
+            gc.disable()
+            start_time = time.perf_counter()
+
+            for order in orders:
+                engine.process_order(order, order_book=order_book)
+
+            end_time = time.perf_counter()
+            gc.enable()
+
+            results[stop_count] = {
+                "mean_latency": (end_time - start_time) / total_orders,
+                "throughput": total_orders / (end_time - start_time),
+                "trades": len(order_book.trades),
+                "triggered": stop_count - len(order_book.stops)
+            }
+
+        return results
+
+    def benchmark_expiry(self, day_orders=100000, gtc_orders=100000):
+        """
+        Time expiring every DAY order at the session close through the timer wheel
+        against scanning order_id_map for expired orders
+        """
+        results = {}
+
+        for method in ("timer_wheel", "scan"):
+            close = time.time_ns() + 6 * 3600 * 10 ** 9
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01, session_close_ns=close)
+            prices = np.round(100 + np.random.uniform(0.01, 5, day_orders + gtc_orders), 2).tolist()
+
+            order_book.add_orders([Order(order_id=f"expiry_{i}",
+                                         portfolio_id="benchmark",
+                                         side="bid" if i % 2 == 0 else "ask",
+                                         order_kind="limit",
+                                         order_price=prices[i] - 5 if i % 2 == 0 else prices[i],
+                                         quantity=100,
+                                         ticker="BENCHMARK",
+                                         time_in_force="DAY" if i < day_orders else "GTC")
+                                   for i in range(day_orders + gtc_orders)])
+
+            gc.disable()
+            start_time = time.perf_counter()
+
+            if method == "timer_wheel":
+                expired = len(order_book.expire_orders(close))
+            else:
+                expired_ids = [order_id for order_id, price_node in order_book.order_id_map.items()
+                               if price_node.values[order_id].time_in_force == "DAY"]
+                for order_id in expired_ids:
+                    order_book.cancel_order(order_id)
+                expired = len(expired_ids)
+
+            end_time = time.perf_counter()
+            gc.enable()
+
+            results[method] = {
+                "total_time_ms": (end_time - start_time) * 1000,
+                "expired": expired,
+                "remaining": len(order_book.order_id_map)
+            }
+
+        return results
+
+    def benchmark_journal(self, total_orders=500000, cancel_rate=0.2, journal_dir=None):
+        """
+        Measure the cost of journaling an add, submit and cancel flow with group commit,
+        then the replay throughput of the journal into an empty book
+        """
+        journal_dir = Path(journal_dir or tempfile.mkdtemp())
+        aggressive = np.random.random(total_orders) < 0.3
+        cancels = np.random.random(total_orders) < cancel_rate
+        offsets = np.random.uniform(0.5, 2.0, total_orders)
+        results = {}
+
+        for mode in ("no_journal", "journal"):
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+            engine = MatchingEngine()
+            path = journal_dir / "BENCHMARK.journal"
+
+            if mode == "journal":
+                path.unlink(missing_ok=True)
+                order_book.attach_journal(Journal(path))
+
+            orders = []
+
+            for i in range(total_orders):
+                side = "bid" if i % 2 == 0 else "ask"
+                if side == "bid":
+                    price = 100 + offsets[i] if aggressive[i] else 100 - offsets[i]
+                else:
+                    price = 100 - offsets[i] if aggressive[i] else 100 + offsets[i]
+
+                orders.append(Order(order_id=f"journal_{i}",
+                                    portfolio_id="trader",
+                                    side=side,
+                                    order_kind="limit",
+                                    order_price=price,
+                                    quantity=100,
+                                    ticker="BENCHMARK"))
+
+            gc.disable()
+            start_time = time.perf_counter()
+
+            for i, order in enumerate(orders):
+                if i % 2 == 0:
+                    order_book.add_order(order)
+                else:
+                    engine.process_order(order, order_book=order_book)
+
+                if cancels[i] and order.order_id in order_book.order_id_map:
+                    order_book.cancel_order(order.order_id)
+
+            if order_book.journal is not None:
+                order_book.journal.close()
+
+            end_time = time.perf_counter()
+            gc.enable()
+
+            results[mode] = {
+                "throughput": total_orders / (end_time - start_time),
+                "total_time": end_time - start_time
+            }
+
+        records = read_journal(journal_dir / "BENCHMARK.journal")
+        replayed_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+
+        gc.disable()
+        start_time = time.perf_counter()
+        replay(replayed_book, records)
+        end_time = time.perf_counter()
+        gc.enable()
+
+        results["replay"] = {
+            "events": len(records),
+            "events_per_second": len(records) / (end_time - start_time),
+            "total_time": end_time - start_time,
+            "projected_10m_seconds": 10000000 / (len(records) / (end_time - start_time)),
+            "matches_live_book": len(replayed_book.order_id_map) == len(order_book.order_id_map)
+        }
+
+        return results
+
+    def benchmark_snapshot(self, sizes=(100000, 1000000), levels=2000):
+        """
+        Compare encode time, decode time and payload size of binary snapshots against pickle
+        for books of a given number of resting orders
+        """
+        results = {}
+
+        for total_orders in sizes:
+            order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+            offsets = np.random.randint(1, levels // 2 + 1, total_orders) * 0.01
+            order_book.add_orders([Order(order_id=f"snapshot_{i}",
+                                         portfolio_id=f"trader_{i % 100}",
+                                         side="bid" if i % 2 == 0 else "ask",
+                                         order_kind="limit",
+                                         order_price=100 - offsets[i] if i % 2 == 0 else 100 + offsets[i],
+                                         quantity=100,
+                                         ticker="BENCHMARK") for i in range(total_orders)])
+
+            results[total_orders] = {}
+
+            for codec, dumps, loads in (("pickle", pickle.dumps, pickle.loads),
+                                        ("snapshot", snapshot.dumps, snapshot.loads)):
+                gc.disable()
+                start_time = time.perf_counter()
+                data = dumps(order_book)
+                encoded_time = time.perf_counter()
+                loaded = loads(data)
+                end_time = time.perf_counter()
+                gc.enable()
+
+                results[total_orders][codec] = {
+                    "encode_time": encoded_time - start_time,
+                    "decode_time": end_time - encoded_time,
+                    "payload_bytes": len(data),
+                    "resting_orders": len(loaded.order_id_map)
+                }
+
+        return results
+
+    def benchmark_redis_io(self, total_portfolios=1000, requests_per_portfolio=20, redis_url="redis://localhost:6379"):
+        """
+        Compare serial save and load against pipelined save_many and load_many for many portfolios
+        Needs a running redis-server, keys are written under benchmark_portfolio:
+        """
+        # Imported here so the other benchmarks run without the redis client
+        from trading_system.redis import RedisRepository
+
+        repository = RedisRepository(redis_url=redis_url)
+        portfolios = {}
+
+        for i in range(total_portfolios):
+            portfolio = Portfolio(portfolio_id=f"benchmark_{i}")
+            portfolio.cash = 100000
+            for j in range(requests_per_portfolio):
+                portfolio.request_trade(ticker="BENCHMARK", position_type="long", close_open="open",
+                                        quantity=10, price=100 + j, commission=1)
+            portfolios[f"benchmark_portfolio:{i}"] = portfolio
+
+        results = {}
+
+        for mode in ("serial", "batched"):
+            repository.round_trips = 0
+            start_time = time.perf_counter()
+
+            if mode == "serial":
+                for key, portfolio in portfolios.items():
+                    repository.save(key=key, data=portfolio)
+            else:
+                repository.save_many(items=portfolios)
+
+            saved_time = time.perf_counter()
+            save_round_trips = repository.round_trips
+
+            if mode == "serial":
+                loaded = dict((key, repository.load(key=key)) for key in portfolios)
+            else:
+                loaded = repository.load_many(keys=list(portfolios))
+
+            end_time = time.perf_counter()
+
+            results[mode] = {
+                "save_time": saved_time - start_time,
+                "load_time": end_time - saved_time,
+                "save_round_trips": save_round_trips,
+                "load_round_trips": repository.round_trips - save_round_trips,
+                "loaded": sum(portfolio is not None for portfolio in loaded.values())
+            }
+
+        repository.redis.delete(*portfolios)
+
+        return results
+
+    def benchmark_repositories(self, total_portfolios=1000, total_orders=100000, data_dir=None):
+        """
+        Compare save_many and load_many of the in-process and file repositories
+        for many small portfolios and one large order book
+        """
+        data_dir = Path(data_dir or tempfile.mkdtemp())
+        order_book = OrderBook(ticker="BENCHMARK", tick_size=0.01)
+        offsets = np.random.randint(1, 1001, total_orders) * 0.01
+        order_book.add_orders([Order(order_id=f"repository_{i}",
+                                     portfolio_id="trader",
+                                     side="bid" if i % 2 == 0 else "ask",
+                                     order_kind="limit",
+                                     order_price=100 - offsets[i] if i % 2 == 0 else 100 + offsets[i],
+                                     quantity=100,
+                                     ticker="BENCHMARK") for i in range(total_orders)])
+
+        items = dict((f"portfolio:benchmark_{i}", Portfolio(portfolio_id=f"benchmark_{i}"))
+                     for i in range(total_portfolios))
+        items["orderbook:BENCHMARK"] = order_book
+        results = {}
+
+        for name, options in (("memory", {}), ("file", {"path": data_dir / "repository.dat"})):
+            repository = create_repository(name, **options)
+
+            start_time = time.perf_counter()
+            repository.save_many(items=items)
+            saved_time = time.perf_counter()
+            loaded = repository.load_many(keys=list(items))
+            end_time = time.perf_counter()
+
+            results[name] = {
+                "save_time": saved_time - start_time,
+                "load_time": end_time - saved_time,
+                "loaded": sum(value is not None for value in loaded.values())
+            }
+
+        return results
+
+    def benchmark_replay(self, total_events=1000000, seed=42, event_file=None):
+        """
+        Replay a recorded event file through each engine variant, orders are built outside the timed loop
+        and every variant should end with the same book and trades checksum
+        """
+        event_file = Path(event_file) if event_file else Path(tempfile.mkdtemp()) / "replay.events"
+
+        if not event_file.exists():
+            generate_events(event_file, total_events=total_events, seed=seed)
+
+        return compare_variants(event_file)
+
 def check_if_blocked():
     ticker = yf.Ticker("AAPL")
     try:
@@ -162,7 +944,22 @@ def check_if_blocked():
         print(f"BLOCKED OR ERROR: {e}")
 
 if __name__ == "__main__":
-    # benchmark = Benchmark()
+    benchmark = Benchmark()
     # print(f"PROCESSING: {benchmark.benchmark_processing()}")
+    # print(f"BULK INSERT: {benchmark.benchmark_bulk_insert()}")
     # print(f"MATCHING: {benchmark.benchmark_matching()}")
+    # print(f"DEEP BOOK MATCHING: {benchmark.benchmark_deep_book_matching()}")
+    # print(f"SOAK: {benchmark.benchmark_soak()}")
+    # print(f"BACKENDS: {benchmark.benchmark_backends()}")
+    # print(f"MEMORY: {benchmark.benchmark_memory()}")
+    # print(f"SWEEP: {benchmark.benchmark_sweep()}")
+    # print(f"BATCH MATCHING: {benchmark.benchmark_batch_matching()}")
+    # print(f"AUCTION: {benchmark.benchmark_auction()}")
+    # print(f"STOPS: {benchmark.benchmark_stops()}")
+    # print(f"EXPIRY: {benchmark.benchmark_expiry()}")
+    # print(f"JOURNAL: {benchmark.benchmark_journal()}")
+    print(f"REPLAY: {benchmark.benchmark_replay()}")
+    # print(f"SNAPSHOT: {benchmark.benchmark_snapshot()}")
+    # print(f"REDIS IO: {benchmark.benchmark_redis_io()}")
+    # print(f"REPOSITORIES: {benchmark.benchmark_repositories()}")
     # check_if_blocked()
\ No newline at end of file
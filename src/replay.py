@@ -0,0 +1,178 @@
+import gc
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+import numpy as np
+from trading_system.order_book import Order, OrderBook
+from trading_system.matching_engine import MatchingEngine
+from trading_system.journal import (RECORD_DTYPE, EVENT_ADD, EVENT_SUBMIT, EVENT_CANCEL, SIDES, read_journal)
+
+
+def generate_events(path, total_events=1000000, seed=42, add_rate=0.6, cancel_rate=0.2, base_price=100.0):
+    """
+    Writes a reproducible order event file in the journal record format
+    Adds rest away from the mid, marketable orders cross it and cancels target earlier adds
+    """
+    rng = np.random.default_rng(seed)
+    kinds = rng.random(total_events)
+    sides = rng.integers(0, 2, total_events)
+    offsets = np.round(rng.uniform(0.01, 1.0, total_events), 2)
+    quantities = rng.integers(1, 10, total_events) * 10
+
+    events = np.where(kinds < add_rate, EVENT_ADD, np.where(kinds < add_rate + cancel_rate, EVENT_CANCEL, EVENT_SUBMIT))
+    add_positions = np.flatnonzero(events == EVENT_ADD)
+
+    # Adds rest on their own side of the mid, marketable orders cross to the other side
+    passive = np.where(sides == 0, base_price - offsets, base_price + offsets)
+    marketable = np.where(sides == 0, base_price + offsets, base_price - offsets)
+
+    records = np.zeros(total_events, dtype=RECORD_DTYPE)
+    records["lsn"] = np.arange(1, total_events + 1)
+    records["event"] = events
+    records["side"] = sides
+    records["order_kind"] = 1  # limit
+    records["price"] = np.where(events == EVENT_ADD, passive, marketable)
+    records["stop_price"] = np.nan
+    records["quantity"] = quantities
+    records["order_id"] = [f"order_{i}".encode() for i in range(total_events)]
+    records["portfolio_id"] = b"replay"
+
+    # Each cancel targets a random add made before it
+    cancel_positions = np.flatnonzero(events == EVENT_CANCEL)
+    earlier_adds = np.searchsorted(add_positions, cancel_positions)
+    has_target = earlier_adds > 0
+    targets = add_positions[(rng.random(len(cancel_positions)) * earlier_adds).astype(np.int64)[has_target]]
+    records["order_id"][cancel_positions[has_target]] = records["order_id"][targets]
+
+    # Cancels with nothing to cancel become adds, resting on their own side like every other add
+    no_target = cancel_positions[~has_target]
+    records["event"][no_target] = EVENT_ADD
+    records["price"][no_target] = passive[no_target]
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    records.tofile(path)
+
+    return path
+
+
+def decode_events(records, ticker="REPLAY"):
+    """
+    Builds the (event, Order or order id) list of an event file ahead of the timed run
+    """
+    events = []
+
+    for event, side, price, quantity, order_id in zip(records["event"].tolist(),
+                                                      records["side"].tolist(),
+                                                      records["price"].tolist(),
+                                                      records["quantity"].tolist(),
+                                                      records["order_id"].tolist()):
+        order_id = order_id.decode()
+
+        if event == EVENT_CANCEL:
+            events.append((event, order_id))
+        else:
+            events.append((event, Order(order_id=order_id,
+                                        portfolio_id="replay",
+                                        side=SIDES[side],
+                                        order_kind="limit",
+                                        order_price=price,
+                                        quantity=quantity,
+                                        ticker=ticker)))
+
+    return events
+
+
+def book_checksum(order_book):
+    """
+    Digest of the resting orders in price-time order and of the trades held in memory
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    for side in (order_book.bids, order_book.asks):
+        for price, price_node in side.best_levels():
+            digest.update(f"{side.type}:{price}:{price_node.quantity}".encode())
+            for order_id, order in price_node.values.items():
+                digest.update(f"{order_id}:{order.quantity}".encode())
+
+    trades = order_book.trades.last(len(order_book.trades))
+    digest.update(trades["price"].tobytes())
+    digest.update(trades["quantity"].tobytes())
+    digest.update("|".join(trades["buyer_order_id"].tolist()).encode())
+    digest.update("|".join(trades["seller_order_id"].tolist()).encode())
+
+    return digest.hexdigest()
+
+
+def run_replay(path, backend="tree", sweep=True, tick_size=0.01):
+    """
+    Streams an event file through an OrderBook and MatchingEngine
+    Orders are built before timing, each event is timed on its own
+    :return: Throughput, latency percentiles in nanoseconds and the checksum of the final book
+    """
+    events = decode_events(read_journal(path))
+    order_book = OrderBook(ticker="REPLAY", tick_size=tick_size, backend=backend, record_time=False)
+    engine = MatchingEngine(sweep=sweep)
+    latencies = np.zeros(len(events), dtype=np.int64)
+    missed_cancels = 0
+
+    add_order = order_book.add_order
+    cancel_order = order_book.cancel_order
+    process_order = engine.process_order
+    order_id_map = order_book.order_id_map
+    clock = time.perf_counter_ns
+
+    gc.disable()
+    start_time = time.perf_counter()
+
+    for i, (event, payload) in enumerate(events):
+        event_start = clock()
+
+        if event == EVENT_ADD:
+            add_order(payload)
+        elif event == EVENT_SUBMIT:
+            process_order(payload, order_book)
+        elif payload in order_id_map:
+            cancel_order(payload)
+        else:
+            missed_cancels += 1
+
+        latencies[i] = clock() - event_start
+
+    end_time = time.perf_counter()
+    gc.enable()
+
+    percentiles = np.percentile(latencies, [50, 90, 99, 99.9])
+
+    return {
+        "events": len(events),
+        "throughput": len(events) / (end_time - start_time),
+        "total_time": end_time - start_time,
+        "p50_ns": int(percentiles[0]),
+        "p90_ns": int(percentiles[1]),
+        "p99_ns": int(percentiles[2]),
+        "p999_ns": int(percentiles[3]),
+        "max_ns": int(latencies.max()) if len(latencies) else 0,
+        "trades": len(order_book.trades),
+        "resting_orders": len(order_book.order_id_map),
+        "missed_cancels": missed_cancels,
+        "checksum": book_checksum(order_book)
+    }
+
+
+def compare_variants(path, variants=(("tree", True), ("tree", False), ("ladder", True))):
+    """
+    Replays the same event file through each (backend, sweep) variant
+    All variants should end with the same checksum
+    """
+    results = dict((f"{backend}_{'sweep' if sweep else 'single'}", run_replay(path, backend=backend, sweep=sweep))
+                   for backend, sweep in variants)
+    results["checksums_match"] = len(set(result["checksum"] for result in results.values())) == 1
+
+    return results
+
+
+if __name__ == "__main__":
+    event_file = generate_events(Path(tempfile.mkdtemp()) / "replay.events", total_events=1000000)
+    print(f"REPLAY: {compare_variants(event_file)}")
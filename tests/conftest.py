@@ -0,0 +1,16 @@
+from trading_system.order_book import Order
+
+
+def make_order(order_id, side, price, quantity=10, order_kind="limit", portfolio_id="TEST", ticker="TEST", **kwargs):
+    """
+    Order factory shared by the tests, a limit order unless order_kind says otherwise
+    :param kwargs: Other Order arguments, e.g. stop_price, time_in_force or post_only
+    """
+    return Order(order_id=order_id,
+                 portfolio_id=portfolio_id,
+                 side=side,
+                 order_kind=order_kind,
+                 order_price=price,
+                 quantity=quantity,
+                 ticker=ticker,
+                 **kwargs)
@@ -0,0 +1,73 @@
+from trading_system.auction import CallAuction
+from trading_system.order_book import OrderBook
+from tests.conftest import make_order
+import pytest
+
+
+@pytest.mark.parametrize("backend", ["tree", "ladder"])
+def test_uncross_maximises_volume(backend):
+    auction = CallAuction(interval=3600)
+    order_book = OrderBook(ticker="TEST", tick_size=1, backend=backend)
+
+    # Demand at 100: 30, 101: 20, 102: 10. Supply at 100: 10, 101: 25, 102: 40
+    order_book.add_orders([make_order("bid_102", "bid", 102, 10),
+                           make_order("bid_101", "bid", 101, 10),
+                           make_order("bid_100", "bid", 100, 10),
+                           make_order("ask_100", "ask", 100, 10),
+                           make_order("ask_101", "ask", 101, 15),
+                           make_order("ask_102", "ask", 102, 15)])
+
+    assert auction.clearing_price(order_book) == (101, 20)
+
+    result = auction.uncross(order_book)
+
+    assert result == {"price": 101, "volume": 20, "trades": 2}
+    assert set(order_book.trades.last(2)["price"].tolist()) == {101}
+    assert order_book.get_best_bid().order_id == "bid_100"
+    assert order_book.get_best_ask().order_id == "ask_101"
+    assert order_book.get_best_ask().quantity == 5
+    assert order_book.asks.get_best_node().quantity == 5
+    assert order_book.get_best_bid().order_price < order_book.get_best_ask().order_price
+
+
+def test_uncross_without_cross():
+    auction = CallAuction()
+    order_book = OrderBook(ticker="TEST")
+    order_book.add_orders([make_order("bid", "bid", 99, 10), make_order("ask", "ask", 100, 10)])
+
+    assert auction.uncross(order_book) == {"price": None, "volume": 0, "trades": 0}
+    assert len(order_book.order_id_map) == 2
+
+
+def test_submit_collects_until_interval():
+    auction = CallAuction(interval=3600)
+    order_book = OrderBook(ticker="TEST")
+
+    assert auction.submit(make_order("bid", "bid", 101, 10), order_book) is None
+    assert auction.submit(make_order("ask", "ask", 100, 10), order_book) is None
+    assert len(order_book.trades) == 0
+
+    auction.interval = 0
+    result = auction.submit_orders([], order_book)
+
+    assert result["volume"] == 10
+    assert len(order_book.order_id_map) == 0
+
+
+def test_uncross_releases_triggered_stops():
+    auction = CallAuction(interval=3600)
+    order_book = OrderBook(ticker="TEST", tick_size=1)
+
+    order_book.add_orders([make_order("bid_101", "bid", 101, 10),
+                           make_order("ask_100", "ask", 100, 10),
+                           make_order("ask_103", "ask", 103, 5)])
+    order_book.add_order(make_order("buy_stop", "bid", None, 5, order_kind="stop", stop_price=100))
+    order_book.add_order(make_order("far_stop", "bid", None, 5, order_kind="stop", stop_price=110))
+
+    result = auction.uncross(order_book)
+
+    assert result["trades"] == 1
+    assert order_book.trades.last(2)["buyer_order_id"].tolist() == ["bid_101", "buy_stop"]
+    assert order_book.trades.last(1)["price"].tolist() == [103]
+    assert list(order_book.stops.order_id_map) == ["far_stop"]
+    assert order_book.get_best_ask() is None
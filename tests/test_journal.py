@@ -0,0 +1,183 @@
+from trading_system.journal import Journal, read_journal, replay, RECORD, RECORD_DTYPE, EVENT_TRADE, EVENT_CANCEL
+from trading_system.matching_engine import MatchingEngine
+from trading_system.order_book import OrderBook, Order
+from trading_system.auction import CallAuction
+from tests.conftest import make_order
+import pickle
+import random
+import struct
+import threading
+import time
+import pytest
+
+
+def book_state(order_book):
+    return (sorted((order_id, price_node.price, price_node.values[order_id].quantity, price_node.quantity)
+                   for order_id, price_node in order_book.order_id_map.items()),
+            sorted(order_book.stops.order_id_map),
+            order_book.trades.last(len(order_book.trades))["quantity"].tolist())
+
+
+def run_session(order_book, engine, start, count):
+    random.seed(start)
+
+    for i in range(start, start + count):
+        side = random.choice(["bid", "ask"])
+        price = round(100 + random.uniform(-1, 1), 2)
+        action = random.random()
+
+        if action < 0.2:
+            order_book.add_order(Order(order_id=f"add_{i}", portfolio_id="TEST", side=side, order_kind="limit",
+                                       order_price=price, quantity=random.randint(1, 50), ticker="TEST"))
+        elif action < 0.3:
+            order_book.add_orders([Order(order_id=f"bulk_{i}_{j}", portfolio_id="TEST", side=side,
+                                         order_kind="limit", order_price=price, quantity=10, ticker="TEST")
+                                   for j in range(3)])
+        elif action < 0.35:
+            engine.process_order(Order(order_id=f"stop_{i}", portfolio_id="TEST", side=side, order_kind="stop",
+                                       order_price=None, quantity=5, ticker="TEST",
+                                       stop_price=price + (0.5 if side == "bid" else -0.5)), order_book)
+        elif action < 0.45 and order_book.order_id_map:
+            order_book.cancel_order(random.choice(sorted(order_book.order_id_map)))
+        elif action < 0.5 and order_book.order_id_map:
+            order_book.modify_order(random.choice(sorted(order_book.order_id_map)), new_qty=random.randint(1, 50))
+        elif action < 0.52:
+            CallAuction(interval=0).uncross(order_book)
+        else:
+            engine.process_order(Order(order_id=f"submit_{i}", portfolio_id="TEST", side=side, order_kind="limit",
+                                       order_price=price, quantity=random.randint(1, 50), ticker="TEST",
+                                       time_in_force="IOC" if action > 0.95 else "GTC"), order_book)
+
+
+def test_journal_replay_rebuilds_book(tmp_path):
+    path = tmp_path / "TEST.journal"
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", tick_size=0.01, record_time=False)
+    order_book.attach_journal(Journal(path, group_size=64))
+
+    run_session(order_book, engine, start=0, count=500)
+    snapshot = pickle.dumps(order_book)
+    run_session(order_book, engine, start=500, count=500)
+    order_book.journal.close()
+
+    records = read_journal(path)
+    assert len(records) == order_book.journal.count
+    assert records["lsn"].tolist() == list(range(1, len(records) + 1))
+    assert (records["event"] == EVENT_TRADE).sum() == len(order_book.trades)
+
+    # Replay everything into an empty book
+    rebuilt = OrderBook(ticker="TEST", tick_size=0.01, record_time=False)
+    replay(rebuilt, records)
+    assert book_state(rebuilt) == book_state(order_book)
+
+    # Replay the tail after a snapshot
+    recovered = pickle.loads(snapshot)
+    assert recovered.journal is None
+    replay(recovered, read_journal(path, start_lsn=recovered.journal_lsn))
+    assert book_state(recovered) == book_state(order_book)
+    assert recovered.journal_lsn == len(records)
+
+
+def test_journal_truncates_partial_record(tmp_path):
+    path = tmp_path / "TEST.journal"
+    journal = Journal(path)
+    journal.cancel("a")
+    journal.cancel("b")
+    journal.close()
+
+    with open(path, "ab") as file:
+        file.write(b"\x00" * (RECORD.size // 2))
+
+    journal = Journal(path)
+    assert journal.count == 2
+    assert journal.cancel("c") == 3
+    journal.close()
+
+    records = read_journal(path, start_lsn=1)
+    assert RECORD.size == RECORD_DTYPE.itemsize
+    assert records["order_id"].tolist() == [b"b", b"c"]
+
+
+def test_journal_long_ids(tmp_path):
+    path = tmp_path / "TEST.journal"
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", tick_size=0.01, record_time=False)
+    order_book.attach_journal(Journal(path))
+    portfolio_id = "P" * 40
+
+    # Ids over the 32 byte field, and over the 96 bytes of one long id record
+    for i, order_id in enumerate([f"{portfolio_id}_T1", "x" * 200, f"{portfolio_id}_T3"]):
+        order_book.add_order(Order(order_id=order_id, portfolio_id=portfolio_id, side="bid", order_kind="limit",
+                                   order_price=99 + i, quantity=10, ticker="TEST"))
+
+    order_book.cancel_order(f"{portfolio_id}_T3")
+    engine.process_order(Order(order_id="y" * 50, portfolio_id="TEST", side="ask", order_kind="limit",
+                               order_price=99, quantity=15, ticker="TEST"), order_book)
+    order_book.journal.close()
+
+    rebuilt = OrderBook(ticker="TEST", tick_size=0.01, record_time=False)
+    replay(rebuilt, read_journal(path))
+    assert book_state(rebuilt) == book_state(order_book)
+    assert rebuilt.trades.last(2)["buyer_order_id"].tolist() == ["x" * 200, f"{portfolio_id}_T1"]
+    assert rebuilt.order_id_map[f"{portfolio_id}_T1"].values[f"{portfolio_id}_T1"].portfolio_id == portfolio_id
+
+
+def test_journal_commits_after_a_quiet_period(tmp_path):
+    path = tmp_path / "TEST.journal"
+    journal = Journal(path, group_size=1000, sync_interval=0.01)
+    journal.cancel("a")
+    journal.cancel("b")
+
+    # No further write comes, the flusher commits the buffered records
+    deadline = time.monotonic() + 5
+    while path.stat().st_size < 2 * RECORD.size and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert path.stat().st_size == 2 * RECORD.size
+    journal.close()
+
+    # Every journal shares one flusher thread
+    journals = [Journal(tmp_path / f"TEST_{i}.journal", sync_interval=0.01) for i in range(10)]
+    for journal in journals:
+        journal.cancel("a")
+    assert [thread.name for thread in threading.enumerate()].count("journal-flusher") == 1
+    for journal in journals:
+        journal.close()
+
+
+def test_record_that_fails_to_pack_uses_no_lsn(tmp_path):
+    path = tmp_path / "TEST.journal"
+    journal = Journal(path)
+    journal.cancel("a")
+
+    with pytest.raises(struct.error):
+        journal.write(EVENT_CANCEL, expire_ns=1 << 63, order_id=b"b")
+    with pytest.raises(struct.error):
+        journal.submit_batch([make_order("c", "bid", 99), make_order("d", "bid", 99, 1 << 63)])
+
+    assert journal.cancel("e") == 2
+    journal.close()
+
+    records = read_journal(path)
+    assert records["lsn"].tolist() == [1, 2]
+    assert records["order_id"].tolist() == [b"a", b"e"]
+
+
+def test_rejected_order_is_not_journaled(tmp_path):
+    path = tmp_path / "TEST.journal"
+    order_book = OrderBook(ticker="TEST", tick_size=0.01, record_time=False)
+    order_book.attach_journal(Journal(path))
+
+    def day_order(order_id):
+        return make_order(order_id, "bid", 99, time_in_force="DAY")
+
+    with pytest.raises(ValueError):
+        order_book.add_order(day_order("day"))
+    with pytest.raises(ValueError):
+        MatchingEngine().process_order(day_order("day"), order_book)
+    with pytest.raises(ValueError):
+        order_book.add_orders([make_order("gtc", "bid", 99), day_order("day")])
+
+    assert order_book.journal.count == 0
+    assert not order_book.order_id_map
+    order_book.journal.close()
@@ -0,0 +1,79 @@
+from trading_system.managers import OrderBookManager, PortfolioManager
+from trading_system.matching_engine import MatchingEngine
+from trading_system.services import PortfolioService
+from trading_system.repository import MemoryRepository
+from tests.conftest import make_order
+
+
+class RecordingRepository(MemoryRepository):
+    def __init__(self):
+        super().__init__()
+        self.saves = []
+
+    def save(self, key, data):
+        self.saves.append(key)
+        return super().save(key, data)
+
+
+def test_order_book_save_all_only_saves_changed_books():
+    repository = RecordingRepository()
+    manager = OrderBookManager(repository, tick_sizes={"A": 0.01, "B": 0.01})
+    books = dict((ticker, manager.load_order_book(ticker)) for ticker in ("A", "B"))
+
+    # New books have never been saved
+    assert manager.save_all() == ["A", "B"]
+    assert manager.save_all() == []
+
+    books["A"].add_order(make_order("a1", "bid", 100))
+    assert manager.save_all() == ["A"]
+
+    # Matching, modifying and cancelling all change the version
+    MatchingEngine().process_order(make_order("b1", "ask", 99, quantity=4), books["A"])
+    assert manager.save_all() == ["A"]
+    books["A"].modify_order("a1", new_qty=3)
+    assert manager.save_all() == ["A"]
+    books["A"].cancel_order("a1")
+    assert manager.save_all() == ["A"]
+
+    # A book loaded from the repository starts clean
+    manager = OrderBookManager(repository)
+    assert manager.load_order_book("A").version == books["A"].version
+    assert manager.save_all() == []
+    assert repository.saves.count("orderbook:A") == 5
+
+
+def test_portfolio_save_all_only_saves_changed_portfolios():
+    repository = RecordingRepository()
+    manager = PortfolioManager(repository)
+    portfolio = manager.load_portfolio("P1")
+    manager.load_portfolio("P2")
+
+    assert manager.save_all() == ["P1", "P2"]
+    assert manager.save_all() == []
+
+    portfolio.cash = 10000
+    portfolio.request_trade(ticker="TEST", position_type="long", close_open="open", quantity=10, price=100,
+                            commission=0)
+    assert manager.save_all() == ["P1"]
+
+    PortfolioService().open_position(portfolio, portfolio.trade_requests.popleft())
+    assert manager.save_all() == ["P1"]
+    assert manager.save_all() == []
+
+
+def test_load_many_warm_loads_saved_state():
+    repository = RecordingRepository()
+    manager = OrderBookManager(repository, tick_sizes={"A": 0.01})
+    manager.load_order_book("A").add_order(make_order("a1", "bid", 100))
+    manager.load_order_book("B")
+    manager.save_all()
+
+    manager = OrderBookManager(repository)
+    order_books = manager.load_order_books()
+    assert sorted(order_books) == ["A", "B"]
+    assert "a1" in order_books["A"].order_id_map
+    assert manager.save_all() == []
+
+    # Books not in redis are created
+    assert manager.load_order_books(["A", "C"])["C"].ticker == "C"
+    assert manager.save_all() == ["C"]
@@ -1,5 +1,7 @@
 from trading_system.matching_engine import MatchingEngine
 from trading_system.order_book import OrderBook, Order
+from tests.conftest import make_order
+import random
 import pytest
 
 
@@ -82,6 +84,258 @@ def test_partial_fill():
     print("PASS")
 
 
+def test_tick_size_match():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", tick_size=0.05)
+
+    sell = Order(ticker="TEST",
+                 order_id="sell_tick",
+                 order_price=100.05,
+                 quantity=5,
+                 order_kind="limit",
+                 side="ask",
+                 portfolio_id="SELLER")
+
+    buy = Order(ticker="TEST",
+                order_id="buy_tick",
+                order_price=100.0500000001,
+                quantity=5,
+                order_kind="limit",
+                side="bid",
+                portfolio_id="BUYER")
+
+    order_book.add_order(sell)
+    engine.process_order(buy, order_book)
+
+    assert len(order_book.trades) == 1
+    assert order_book.from_ticks(order_book.trades[0].price) == 100.05
+    assert len(order_book.order_id_map) == 0
+
+
+def test_resting_order_sets_trade_price():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", record_time=False)
+
+    resting_bid = Order(ticker="TEST",
+                        order_id="resting_bid",
+                        order_price=101,
+                        quantity=5,
+                        order_kind="limit",
+                        side="bid",
+                        portfolio_id="BUYER")
+
+    incoming_ask = Order(ticker="TEST",
+                         order_id="incoming_ask",
+                         order_price=100,
+                         quantity=5,
+                         order_kind="limit",
+                         side="ask",
+                         portfolio_id="SELLER")
+
+    order_book.add_order(resting_bid)
+    engine.process_order(incoming_ask, order_book)
+
+    assert resting_bid.sequence < incoming_ask.sequence
+    assert order_book.trades[0].price == 101
+    assert order_book.trades[0].sequence > incoming_ask.sequence
+    assert order_book.trades[0].timestamp is None
+
+
+def book_state(order_book):
+    return sorted((order_id, price_node.price, price_node.values[order_id].quantity, price_node.quantity)
+                  for order_id, price_node in order_book.order_id_map.items())
+
+
+@pytest.mark.parametrize("backend", ["tree", "ladder"])
+def test_sweep_matches_single_order_engine(backend):
+    random.seed(7)
+    engines = [MatchingEngine(sweep=False), MatchingEngine(sweep=True)]
+    books = [OrderBook(ticker="TEST", tick_size=0.01, backend=backend, record_time=False) for _ in engines]
+    live_orders = []
+
+    for i in range(5000):
+        if live_orders and random.random() < 0.2:
+            order_id = live_orders.pop(random.randrange(len(live_orders)))
+            for order_book in books:
+                if order_id in order_book.order_id_map:
+                    order_book.cancel_order(order_id=order_id)
+            continue
+
+        side = random.choice(["bid", "ask"])
+        order_kind = "market" if random.random() < 0.05 else "limit"
+        price = round(100 + random.uniform(-1, 1), 2)
+        quantity = random.randint(1, 300) if random.random() < 0.1 else random.randint(1, 20)
+
+        for engine, order_book in zip(engines, books):
+            engine.process_order(Order(ticker="TEST",
+                                       order_id=f"order_{i}",
+                                       order_price=price,
+                                       quantity=quantity,
+                                       order_kind=order_kind,
+                                       side=side,
+                                       portfolio_id="TEST"), order_book)
+        live_orders.append(f"order_{i}")
+
+    single_book, sweep_book = books
+    assert len(single_book.trades) > 1000
+    assert [(t.trade_id, t.buyer_order_id, t.seller_order_id, t.price, t.quantity, t.sequence)
+            for t in single_book.trades] == \
+           [(t.trade_id, t.buyer_order_id, t.seller_order_id, t.price, t.quantity, t.sequence)
+            for t in sweep_book.trades]
+    assert book_state(single_book) == book_state(sweep_book)
+    assert single_book.bids.node_count == sweep_book.bids.node_count
+    assert single_book.asks.node_count == sweep_book.asks.node_count
+
+
+def test_process_orders_batch():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST")
+
+    order_book.add_order(Order(ticker="TEST",
+                               order_id="resting_ask",
+                               order_price=100,
+                               quantity=10,
+                               order_kind="limit",
+                               side="ask",
+                               portfolio_id="SELLER"))
+
+    orders = [Order(ticker="TEST",
+                    order_id=f"buy_{i}",
+                    order_price=price,
+                    quantity=quantity,
+                    order_kind="limit",
+                    side="bid",
+                    portfolio_id="BUYER") for i, (price, quantity) in enumerate([(100, 4), (99, 5), (101, 8)])]
+
+    result = engine.process_orders(orders, order_book)
+
+    assert result["filled"].tolist() == [4, 0, 6]
+    assert result["trades"]["buyer_order_id"].tolist() == ["buy_0", "buy_2"]
+    assert result["trades"]["quantity"].tolist() == [4, 6]
+    assert result["trades"]["trade_id"].tolist() == [0, 1]
+    assert order_book.get_best_bid().order_id == "buy_2"
+
+
+def test_process_orders_shares_the_batch_work(tmp_path):
+    from trading_system.journal import Journal, read_journal, replay, EVENT_BATCH, EVENT_SUBMIT
+
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", record_time=False)
+    order_book.attach_journal(Journal(tmp_path / "TEST.journal", group_size=1000, sync_interval=60))
+    order_book.add_orders([make_order("ask_100", "ask", 100, 5), make_order("ask_101", "ask", 101, 5)])
+
+    # An invalid order rejects the whole batch before anything is journaled or matched
+    with pytest.raises(ValueError):
+        engine.process_orders([make_order("buy", "bid", 100, 5),
+                               make_order("day", "bid", 100, 5, time_in_force="DAY")], order_book)
+    assert order_book.journal.count == 2
+    assert order_book.get_best_ask().quantity == 5
+
+    # The stop triggered by the first buy fills before the next order, as with process_order,
+    # and its fill is reported. The FOK order is rejected and reported as such
+    def batch():
+        return [make_order("stop", "bid", None, 5, order_kind="stop", stop_price=100),
+                make_order("buy_0", "bid", 100, 5),
+                make_order("fok", "bid", 101, 3, time_in_force="FOK")]
+
+    sequential = OrderBook(ticker="TEST", record_time=False)
+    sequential.add_orders([make_order("ask_100", "ask", 100, 5), make_order("ask_101", "ask", 101, 5)])
+    assert [engine.process_order(o, sequential) for o in batch()] == [True, True, False]
+
+    result = engine.process_orders(batch(), order_book)
+    assert result["filled"].tolist() == [5, 5, 0]
+    assert result["accepted"].tolist() == [True, True, False]
+    assert result["trades"]["buyer_order_id"].tolist() == ["buy_0", "stop"]
+    assert result["trades"]["price"].tolist() == [100, 101]
+    assert order_book.trades.last(2)["price"].tolist() == sequential.trades.last(2)["price"].tolist()
+    assert order_book.get_depth() == sequential.get_depth()
+    assert not order_book.stops.order_id_map
+
+    # The batch is journaled as one header and its submits
+    order_book.journal.close()
+    records = read_journal(tmp_path / "TEST.journal")
+    assert records["event"].tolist()[2:6] == [EVENT_BATCH, EVENT_SUBMIT, EVENT_SUBMIT, EVENT_SUBMIT]
+    assert records["quantity"][2] == 3
+
+    rebuilt = OrderBook(ticker="TEST", record_time=False)
+    replay(rebuilt, records)
+    assert rebuilt.trades.last(2)["buyer_order_id"].tolist() == ["buy_0", "stop"]
+    assert rebuilt.get_depth() == order_book.get_depth()
+
+
+def test_time_in_force():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST")
+
+    order_book.add_orders([Order(ticker="TEST",
+                                 order_id=f"ask_{price}",
+                                 order_price=price,
+                                 quantity=10,
+                                 order_kind="limit",
+                                 side="ask",
+                                 portfolio_id="SELLER") for price in (100, 101)])
+
+    def buy(order_id, price, quantity, **kwargs):
+        return make_order(order_id, "bid", price, quantity, portfolio_id="BUYER", **kwargs)
+
+    # FOK needs 15 at or below 100 but only 10 is there, so nothing changes
+    fok = buy("fok", 100, 15, time_in_force="FOK")
+    assert engine.process_order(fok, order_book) is False
+    assert fok.quantity == 15
+    assert len(order_book.trades) == 0
+    assert order_book.asks.get_best_node().quantity == 10
+
+    # Post-only orders that would trade are rejected
+    assert engine.process_order(buy("post", 100, 5, post_only=True), order_book) is False
+    assert engine.process_order(buy("post_passive", 99, 5, post_only=True), order_book) is True
+    assert order_book.get_best_bid().order_id == "post_passive"
+
+    # IOC fills what it can and cancels the rest
+    ioc = buy("ioc", 100, 15, time_in_force="IOC")
+    assert engine.process_order(ioc, order_book) is True
+    assert ioc.quantity == 5
+    assert "ioc" not in order_book.order_id_map
+
+    # FOK across two levels
+    fok = buy("fok_2", 101, 10, time_in_force="FOK")
+    assert engine.process_order(fok, order_book) is True
+    assert fok.quantity == 0
+    assert order_book.get_best_ask() is None
+
+
 if __name__ == "__main__":
 
     test_single_buy_sell_match()
+
+
+def test_modify_order_crossing_the_spread(tmp_path):
+    from trading_system.journal import Journal, read_journal, replay
+
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", tick_size=0.01, record_time=False)
+    order_book.attach_journal(Journal(tmp_path / "TEST.journal"))
+    order_book.add_orders([make_order("bid", "bid", 99.5, 10),
+                           make_order("post_only", "bid", 99, 10, post_only=True),
+                           make_order("ask", "ask", 100, 5)])
+
+    with pytest.raises(ValueError):
+        order_book.modify_order("bid", new_price=100.5)
+    with pytest.raises(ValueError):
+        engine.modify_order("post_only", order_book, new_price=100)
+
+    # The amended bid trades with the ask at the ask's price and the remainder rests at its new price
+    order = engine.modify_order("bid", order_book, new_price=100.5)
+    assert order_book.trades.last(1)["price"].tolist() == [10000]
+    assert order.quantity == 5
+    assert order_book.get_best_bid().order_id == "bid"
+    assert order_book.get_best_ask() is None
+
+    # Amends that do not cross stay in the book
+    engine.modify_order("post_only", order_book, new_price=99.1, new_qty=3)
+    assert order_book.order_id_map["post_only"].quantity == 3
+
+    order_book.journal.close()
+    rebuilt = OrderBook(ticker="TEST", tick_size=0.01, record_time=False)
+    replay(rebuilt, read_journal(tmp_path / "TEST.journal"))
+    assert rebuilt.get_depth() == order_book.get_depth()
+    assert len(rebuilt.trades) == 1
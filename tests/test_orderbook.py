@@ -1,5 +1,10 @@
+import time
+import pickle
+import random
 import pytest
 from trading_system.order_book import OrderBook, Order
+from trading_system.matching_engine import MatchingEngine
+from tests.conftest import make_order
 
 
 def test_add_order():
@@ -118,9 +123,393 @@ def test_empty_order_book():
     assert spread is None
 
 
+def test_tick_size_merges_price_levels():
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01)
+
+    bid1 = Order(portfolio_id="test_orderbook",
+                 side="bid",
+                 order_kind="limit",
+                 order_id="bid1",
+                 order_price=100.1,
+                 quantity=2,
+                 ticker="TEST_ORDERBOOK")
+
+    bid2 = Order(portfolio_id="test_orderbook",
+                 side="bid",
+                 order_kind="limit",
+                 order_id="bid2",
+                 order_price=100.10000000001,
+                 quantity=3,
+                 ticker="TEST_ORDERBOOK")
+
+    ask = Order(portfolio_id="test_orderbook",
+                side="ask",
+                order_kind="limit",
+                order_id="ask",
+                order_price=100.15,
+                quantity=3,
+                ticker="TEST_ORDERBOOK")
+
+    order_book.add_order(order=bid1)
+    order_book.add_order(order=bid2)
+    order_book.add_order(order=ask)
+
+    assert order_book.bids.node_count == 1
+    assert order_book.get_best_bid().order_price == 10010
+    assert order_book.from_ticks(order_book.get_best_bid().order_price) == 100.1
+    assert order_book.from_ticks(order_book.get_best_ask().order_price) == 100.15
+    assert order_book.get_spread() == 0.05
+
+
+def test_off_tick_prices_round_to_the_passive_side():
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.05)
+
+    order_book.add_order(make_order("bid", "bid", 100.09))
+    order_book.add_orders([make_order("ask", "ask", 100.11), make_order("on_tick", "ask", 100.15)])
+    order_book.add_order(make_order("stop", "bid", None, order_kind="stop", stop_price=101.01))
+
+    assert order_book.from_ticks(order_book.get_best_bid().order_price) == 100.05
+    assert order_book.from_ticks(order_book.get_best_ask().order_price) == 100.15
+    assert order_book.asks.node_count == 1
+    assert order_book.from_ticks(order_book.stops.order_id_map["stop"].price) == 101.05
+
+    order_book.modify_order("bid", new_price=100.14)
+    assert order_book.from_ticks(order_book.get_best_bid().order_price) == 100.1
+    assert order_book.estimate_fill("bid", 10, limit_price=100.19)["fillable_quantity"] == 10
+
+
+def test_pickle_round_trip():
+    order_book = OrderBook(ticker="TEST_ORDERBOOK")
+
+    for i, (side, price) in enumerate([("bid", 99), ("bid", 98), ("ask", 101), ("ask", 101)]):
+        order_book.add_order(order=Order(portfolio_id="test_orderbook",
+                                         side=side,
+                                         order_kind="limit",
+                                         order_id=str(i),
+                                         order_price=price,
+                                         quantity=i + 1,
+                                         ticker="TEST_ORDERBOOK"))
+
+    loaded = pickle.loads(pickle.dumps(order_book))
+
+    assert loaded.get_best_bid().order_id == "0"
+    assert loaded.get_best_ask().order_id == "2"
+    assert loaded.asks.best_node.quantity == 7
+    assert loaded.order_id_map["3"] is loaded.asks.best_node
+    assert not hasattr(loaded.get_best_bid(), "__dict__")
+
+
+@pytest.mark.parametrize("backend", ["tree", "ladder"])
+def test_get_depth(backend):
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01, backend=backend)
+    engine = MatchingEngine()
+
+    orders = [("bid", 99.98, 5), ("bid", 99.99, 2), ("bid", 99.99, 3), ("bid", 99.95, 1),
+              ("ask", 100.01, 4), ("ask", 100.03, 6), ("ask", 100.01, 1)]
+
+    for i, (side, price, quantity) in enumerate(orders):
+        order_book.add_order(order=Order(portfolio_id="test_orderbook",
+                                         side=side,
+                                         order_kind="limit",
+                                         order_id=str(i),
+                                         order_price=price,
+                                         quantity=quantity,
+                                         ticker="TEST_ORDERBOOK"))
+
+    depth = order_book.get_depth(levels=2)
+    assert depth["bids"] == [{"price": 99.99, "quantity": 5, "orders": 2},
+                             {"price": 99.98, "quantity": 5, "orders": 1}]
+    assert depth["asks"] == [{"price": 100.01, "quantity": 5, "orders": 2},
+                             {"price": 100.03, "quantity": 6, "orders": 1}]
+
+    # Partially fill the best ask level and cancel a bid
+    engine.process_order(Order(portfolio_id="test_orderbook",
+                               side="bid",
+                               order_kind="limit",
+                               order_id="taker",
+                               order_price=100.01,
+                               quantity=4,
+                               ticker="TEST_ORDERBOOK"), order_book)
+    order_book.cancel_order(order_id="1")
+
+    depth = order_book.get_depth(levels=5)
+    assert depth["bids"] == [{"price": 99.99, "quantity": 3, "orders": 1},
+                             {"price": 99.98, "quantity": 5, "orders": 1},
+                             {"price": 99.95, "quantity": 1, "orders": 1}]
+    assert depth["asks"] == [{"price": 100.01, "quantity": 1, "orders": 1},
+                             {"price": 100.03, "quantity": 6, "orders": 1}]
+
+
+def test_add_orders_matches_add_order():
+    random.seed(4)
+    orders = [(f"order_{i}", random.choice(["bid", "ask"]), round(100 + random.uniform(-1, 1), 2),
+               random.randint(1, 10)) for i in range(2000)]
+
+    def make_orders():
+        return [make_order(order_id, side, price, quantity) for order_id, side, price, quantity in orders]
+
+    single_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01)
+    bulk_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01)
+
+    # Both books already hold orders at some of the same levels
+    for order_book in (single_book, bulk_book):
+        order_book.add_order(order=Order(portfolio_id="test_orderbook",
+                                         side="bid",
+                                         order_kind="limit",
+                                         order_id="warm",
+                                         order_price=99.5,
+                                         quantity=1,
+                                         ticker="TEST_ORDERBOOK"))
+
+    for order in make_orders():
+        single_book.add_order(order=order)
+    bulk_book.add_orders(orders=make_orders())
+
+    for side in ("bids", "asks"):
+        single_levels = [(price, list(node.values), node.quantity)
+                         for price, node in getattr(single_book, side).best_levels()]
+        bulk_levels = [(price, list(node.values), node.quantity)
+                       for price, node in getattr(bulk_book, side).best_levels()]
+        assert single_levels == bulk_levels
+
+    assert single_book.order_id_map.keys() == bulk_book.order_id_map.keys()
+    assert bulk_book.sequence == single_book.sequence
+    assert all(bulk_book.order_id_map[order_id] is bulk_book.bids.search_price(bulk_book.to_ticks(price))
+               for order_id, side, price, _ in orders if side == "bid")
+
+
+def test_modify_order():
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01)
+
+    for order_id, price in (("bid1", 99.5), ("bid2", 99.5), ("bid3", 99.5)):
+        order_book.add_order(order=Order(portfolio_id="test_orderbook",
+                                         side="bid",
+                                         order_kind="limit",
+                                         order_id=order_id,
+                                         order_price=price,
+                                         quantity=10,
+                                         ticker="TEST_ORDERBOOK"))
+
+    level = order_book.order_id_map["bid1"]
+
+    # Reducing quantity keeps priority
+    order_book.modify_order(order_id="bid1", new_qty=4)
+    assert list(level.values) == ["bid1", "bid2", "bid3"]
+    assert level.quantity == 24
+
+    # Increasing quantity loses priority
+    order_book.modify_order(order_id="bid1", new_qty=12)
+    assert list(level.values) == ["bid2", "bid3", "bid1"]
+    assert level.quantity == 32
+
+    # Changing price moves the order to the new level
+    order_book.modify_order(order_id="bid2", new_price=99.6)
+    assert order_book.get_best_bid().order_id == "bid2"
+    assert order_book.get_depth(levels=2)["bids"] == [{"price": 99.6, "quantity": 10, "orders": 1},
+                                                      {"price": 99.5, "quantity": 22, "orders": 2}]
+
+    # Moving the last order off a level removes the level
+    order_book.modify_order(order_id="bid2", new_price=99.4, new_qty=1)
+    assert order_book.bids.search_price(order_book.to_ticks(99.6)) is None
+    assert order_book.get_best_bid().order_id == "bid3"
+
+    with pytest.raises(ValueError):
+        order_book.modify_order(order_id="missing", new_qty=1)
+    with pytest.raises(ValueError):
+        order_book.modify_order(order_id="bid3", new_qty=0)
+
+
+def test_cancel_orders():
+    order_book = OrderBook(ticker="TEST_ORDERBOOK")
+    order_book.add_orders([Order(order_id=f"bid_{i}",
+                                 portfolio_id="TEST",
+                                 side="bid",
+                                 order_kind="limit",
+                                 order_price=99 + i % 2,
+                                 quantity=10,
+                                 ticker="TEST_ORDERBOOK") for i in range(4)])
+
+    with pytest.raises(ValueError):
+        order_book.cancel_orders(["bid_0", "missing"])
+    assert len(order_book.order_id_map) == 4
+
+    # Repeated ids are cancelled once
+    order_book.cancel_orders(["bid_1", "bid_3", "bid_0", "bid_1"])
+
+    assert list(order_book.order_id_map) == ["bid_2"]
+    assert order_book.bids.node_count == 1
+    assert order_book.get_depth()["bids"] == [{"price": 99, "quantity": 10, "orders": 1}]
+
+
+def test_portfolio_orders_index():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST_ORDERBOOK")
+
+    def order(order_id, portfolio_id, side, price, **kwargs):
+        return make_order(order_id, side, price, portfolio_id=portfolio_id, **kwargs)
+
+    order_book.add_orders([order("mm_bid", "MM", "bid", 99), order("mm_ask", "MM", "ask", 101)])
+    order_book.add_order(order("mm_stop", "MM", "ask", 95, order_kind="stop", stop_price=96))
+    order_book.add_order(order("other_bid", "OTHER", "bid", 98))
+    engine.process_order(order("mm_ask_2", "MM", "ask", 102), order_book)
+
+    assert list(order_book.portfolio_orders["MM"]) == ["mm_bid", "mm_ask", "mm_stop", "mm_ask_2"]
+
+    # Filled and cancelled orders leave the index
+    engine.process_order(order("taker", "OTHER", "bid", 101), order_book)
+    order_book.cancel_order("other_bid")
+    assert list(order_book.portfolio_orders["MM"]) == ["mm_bid", "mm_stop", "mm_ask_2"]
+    assert "OTHER" not in order_book.portfolio_orders
+
+    assert order_book.cancel_portfolio_orders("MM") == ["mm_bid", "mm_stop", "mm_ask_2"]
+    assert len(order_book.order_id_map) == 0
+    assert len(order_book.stops) == 0
+    assert "MM" not in order_book.portfolio_orders
+    assert order_book.cancel_portfolio_orders("MM") == []
+
+
+@pytest.mark.parametrize("backend", ["tree", "ladder"])
+def test_estimate_fill(backend):
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01, backend=backend)
+    order_book.add_orders([Order(order_id=f"ask_{i}",
+                                 portfolio_id="TEST",
+                                 side="ask",
+                                 order_kind="limit",
+                                 order_price=price,
+                                 quantity=quantity,
+                                 ticker="TEST_ORDERBOOK") for i, (price, quantity) in
+                           enumerate([(100.0, 10), (100.01, 20), (100.02, 30)])])
+
+    estimate = order_book.estimate_fill(side="bid", quantity=40)
+    assert estimate["fillable_quantity"] == 40
+    assert estimate["vwap"] == pytest.approx((100.0 * 10 + 100.01 * 20 + 100.02 * 10) / 40)
+    assert estimate["best_price"] == 100.0
+    assert estimate["worst_price"] == 100.02
+    assert estimate["slippage"] == pytest.approx(estimate["vwap"] - 100.0)
+    assert estimate["levels"] == 3
+
+    limited = order_book.estimate_fill(side="bid", quantity=100, limit_price=100.01)
+    assert limited["fillable_quantity"] == 30
+    assert limited["worst_price"] == 100.01
+
+    assert order_book.estimate_fill(side="ask", quantity=10)["vwap"] is None
+
+    # The book is unchanged and an actual sweep fills at the estimated VWAP
+    assert len(order_book.order_id_map) == 3
+    MatchingEngine().process_order(Order(order_id="buy",
+                                         portfolio_id="TEST",
+                                         side="bid",
+                                         order_kind="limit",
+                                         order_price=101,
+                                         quantity=40,
+                                         ticker="TEST_ORDERBOOK"), order_book)
+    trades = order_book.trades.last(3)
+    vwap = (trades["price"] * trades["quantity"]).sum() / trades["quantity"].sum() * 0.01
+    assert vwap == pytest.approx(estimate["vwap"])
+
+
+def test_expire_orders():
+    start = time.time_ns()
+    close = start + 60 * 10 ** 9
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", session_close_ns=close)
+
+    orders = [Order(order_id=f"day_{i}",
+                    portfolio_id="TEST",
+                    side="bid",
+                    order_kind="limit",
+                    order_price=99 + i,
+                    quantity=10,
+                    ticker="TEST_ORDERBOOK",
+                    time_in_force="DAY") for i in range(3)]
+    orders.append(Order(order_id="gtd",
+                        portfolio_id="TEST",
+                        side="ask",
+                        order_kind="limit",
+                        order_price=110,
+                        quantity=10,
+                        ticker="TEST_ORDERBOOK",
+                        time_in_force="GTD",
+                        expire_ns=start + 10 ** 9))
+    orders.append(Order(order_id="gtc",
+                        portfolio_id="TEST",
+                        side="ask",
+                        order_kind="limit",
+                        order_price=111,
+                        quantity=10,
+                        ticker="TEST_ORDERBOOK"))
+
+    order_book.add_orders(orders[:2])
+    for order in orders[2:]:
+        order_book.add_order(order)
+
+    order_book.cancel_order("day_0")
+    assert len(order_book.expiries) == 3
+
+    assert order_book.expire_orders(start + 2 * 10 ** 9) == ["gtd"]
+    assert order_book.get_best_ask().order_id == "gtc"
+
+    assert sorted(order_book.expire_orders(close)) == ["day_1", "day_2"]
+    assert list(order_book.order_id_map) == ["gtc"]
+    assert order_book.get_best_bid() is None
+
+    with pytest.raises(ValueError):
+        OrderBook(ticker="TEST_ORDERBOOK").add_order(Order(order_id="day",
+                                                           portfolio_id="TEST",
+                                                           side="bid",
+                                                           order_kind="limit",
+                                                           order_price=99,
+                                                           quantity=10,
+                                                           ticker="TEST_ORDERBOOK",
+                                                           time_in_force="DAY"))
+
+
 if __name__ == "__main__":
     test_add_order()
     test_cancel_order()
     test_best_bid_ask_spread()
     test_multiple_orders_same_side()
-    test_empty_order_book()
\ No newline at end of file
+    test_empty_order_book()
+
+def test_track_changes():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01)
+
+    order_book.add_order(make_order("untracked", "bid", 98))
+    assert order_book.changed_orders is None
+
+    order_book.track_changes()
+    order_book.add_orders([make_order("bid_1", "bid", 99), make_order("bid_2", "bid", 99)])
+    order_book.add_order(make_order("stop", "bid", None, order_kind="stop", stop_price=99, time_in_force="IOC"))
+    order_book.modify_order("bid_1", new_qty=5)
+    order_book.cancel_order("untracked")
+    assert list(order_book.changed_orders) == ["bid_1", "bid_2", "stop", "untracked"]
+
+    # Fills are left to the trades, a triggered stop is recorded when it leaves the trigger book
+    order_book.track_changes()
+    engine.process_order(make_order("sell", "ask", 99, quantity=15), order_book)
+    assert list(order_book.changed_orders) == ["stop"]
+    assert order_book.trades.last(2)["buyer_order_id"].tolist() == ["bid_1", "bid_2"]
+    assert len(order_book.stops) == 0
+
+    # A failed cancel leaves the book unchanged
+    order_book.track_changes()
+    version = order_book.version
+    with pytest.raises(ValueError):
+        order_book.cancel_order("missing")
+    with pytest.raises(ValueError):
+        order_book.remove_order("bid_1")
+    assert order_book.version == version
+    assert order_book.changed_orders == {}
+
+    assert pickle.loads(pickle.dumps(order_book)).changed_orders is None
+
+
+def test_track_changes_add_orders_generator():
+    order_book = OrderBook(ticker="TEST_ORDERBOOK", tick_size=0.01)
+    order_book.track_changes()
+
+    order_book.add_orders(Order(order_id=f"bid_{i}", portfolio_id="TEST", side="bid", order_kind="limit",
+                                order_price=99 + i, quantity=10, ticker="TEST_ORDERBOOK") for i in range(3))
+
+    assert len(order_book.order_id_map) == 3
+    assert list(order_book.changed_orders) == ["bid_0", "bid_1", "bid_2"]
@@ -0,0 +1,126 @@
+import random
+import pytest
+from trading_system.matching_engine import MatchingEngine
+from trading_system.order_book import OrderBook
+from trading_system.price_ladder import PriceLadder
+from tests.conftest import make_order
+
+
+def test_ladder_requires_tick_size():
+    with pytest.raises(ValueError):
+        OrderBook(ticker="TEST_LADDER", backend="ladder")
+
+
+def test_ladder_recenters_when_price_drifts():
+    order_book = OrderBook(ticker="TEST_LADDER", tick_size=0.01, backend="ladder")
+
+    order_book.add_order(make_order("bid_1", "bid", 100.00, 1))
+    order_book.add_order(make_order("bid_2", "bid", 150.00, 1))
+    order_book.add_order(make_order("bid_3", "bid", 50.00, 1))
+
+    assert order_book.bids.size >= 10001
+    assert order_book.from_ticks(order_book.get_best_bid().order_price) == 150.00
+
+    order_book.cancel_order(order_id="bid_2")
+    assert order_book.from_ticks(order_book.get_best_bid().order_price) == 100.00
+    assert order_book.bids.search_price(order_book.to_ticks(150.00)) is None
+
+
+def test_ladder_keeps_outliers_in_overflow():
+    order_book = OrderBook(ticker="TEST_LADDER", tick_size=0.01, backend="ladder")
+
+    order_book.add_order(make_order("bid_1", "bid", 100.00, 1))
+    order_book.add_order(make_order("outlier", "bid", 1e6, 1))
+    order_book.add_order(make_order("bid_2", "bid", 101.00, 1))
+
+    assert order_book.bids.size <= order_book.bids.max_size
+    assert order_book.bids.node_count == 3
+    assert order_book.get_best_bid().order_id == "outlier"
+    assert [price for price, level in order_book.bids.best_levels()] == [100000000, 10100, 10000]
+
+    MatchingEngine().process_order(make_order("ask", "ask", 101.00, quantity=2), order_book)
+    assert [t.buyer_order_id for t in order_book.trades] == ["outlier", "bid_2"]
+    assert order_book.bids.node_count == 1
+    assert order_book.bids.overflow.root is None
+
+
+def test_ladder_outliers_are_checked_against_occupied_bounds():
+    class CountingList(list):
+        iterations = 0
+
+        def __iter__(self):
+            CountingList.iterations += 1
+            return super().__iter__()
+
+    ladder = PriceLadder(type="bids", size=1024, max_size=2048)
+    for price in (10000, 10010, 10500):
+        ladder.adjust_quantity(ladder.add_price(price), 10)
+    ladder.levels = CountingList(ladder.levels)
+
+    # Outliers go to the overflow tree without walking the window
+    for i in range(100):
+        ladder.adjust_quantity(ladder.add_price(10 ** 6 + i), 10)
+    assert CountingList.iterations == 0
+    assert ladder.overflow.node_count == 100
+    assert (ladder.low_index + ladder.base, ladder.high_index + ladder.base) == (10000, 10500)
+
+    # Loose bounds left by a removal are tightened before the next recenter
+    ladder.remove_node(ladder.search_price(10000))
+    ladder.adjust_quantity(ladder.add_price(9600), 10)
+    assert (ladder.low_index + ladder.base, ladder.high_index + ladder.base) == (9600, 10500)
+    assert all(ladder.in_window(ladder.search_price(price)) for price in (9600, 10010, 10500))
+    assert ladder.sizes.sum() == 30
+
+
+@pytest.mark.parametrize("max_size", [1 << 18, 64])
+def test_ladder_matches_tree_backend(max_size):
+    random.seed(3)
+    books = [OrderBook(ticker="TEST_LADDER", tick_size=0.01, backend=backend) for backend in ("tree", "ladder")]
+
+    # A small max_size keeps most levels in the overflow tree and moves them in and out of the window
+    books[1].bids = PriceLadder(type="bids", size=16, max_size=max_size)
+    books[1].asks = PriceLadder(type="asks", size=16, max_size=max_size)
+    engines = [MatchingEngine(), MatchingEngine()]
+    live_orders = []
+
+    for i in range(3000):
+        action = random.random()
+
+        if live_orders and action < 0.3:
+            order_id = live_orders.pop(random.randrange(len(live_orders)))
+            for order_book in books:
+                if order_id in order_book.order_id_map:
+                    order_book.cancel_order(order_id=order_id)
+        else:
+            side = random.choice(["bid", "ask"])
+            price = round(100 + random.uniform(-2, 2), 2)
+            quantity = random.randint(1, 50)
+
+            for engine, order_book in zip(engines, books):
+                engine.process_order(make_order(f"order_{i}", side, price, quantity), order_book)
+            live_orders.append(f"order_{i}")
+
+        tree_book, ladder_book = books
+        for getter in ("get_best_bid", "get_best_ask"):
+            tree_best = getattr(tree_book, getter)()
+            ladder_best = getattr(ladder_book, getter)()
+            assert (tree_best and tree_best.order_id) == (ladder_best and ladder_best.order_id)
+
+    tree_book, ladder_book = books
+    assert [(t.buyer_order_id, t.seller_order_id, t.price, t.quantity) for t in tree_book.trades] == \
+           [(t.buyer_order_id, t.seller_order_id, t.price, t.quantity) for t in ladder_book.trades]
+
+    for order_book in books:
+        for price_node in order_book.order_id_map.values():
+            assert price_node.quantity == sum(order.quantity for order in price_node.values.values())
+
+    for order_id, price_node in ladder_book.order_id_map.items():
+        side = ladder_book.bids if price_node.values[order_id].side == "bid" else ladder_book.asks
+        if side.in_window(price_node):
+            assert side.sizes[price_node.price - side.base] == price_node.quantity
+        else:
+            assert side.overflow.search_price(price_node.price) is price_node
+
+    assert tree_book.bids.node_count == ladder_book.bids.node_count
+    assert tree_book.asks.node_count == ladder_book.asks.node_count
+    assert tree_book.get_depth(levels=1000) == ladder_book.get_depth(levels=1000)
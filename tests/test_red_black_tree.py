@@ -0,0 +1,135 @@
+import random
+import pytest
+from trading_system.order_book import OrderBook
+from tests.conftest import make_order
+
+
+def test_cached_best_matches_full_walk():
+    random.seed(1)
+    order_book = OrderBook(ticker="TEST_TREE")
+    live_orders = []
+
+    for i in range(2000):
+        if live_orders and random.random() < 0.45:
+            order_id = live_orders.pop(random.randrange(len(live_orders)))
+            order_book.cancel_order(order_id=order_id)
+        else:
+            side = random.choice(["bid", "ask"])
+            order_id = f"{side}_{i}"
+            order_book.add_order(make_order(order_id, side, random.randint(90, 110), 1))
+            live_orders.append(order_id)
+
+        for tree, best in ((order_book.bids, order_book.get_best_bid()),
+                           (order_book.asks, order_book.get_best_ask())):
+            best_node = tree.find_best_node()
+            if best_node is None:
+                assert best is None
+            else:
+                assert best is next(iter(best_node.values.values()))
+
+
+def check_red_black(tree):
+    """
+    Check tree ordering, parent links and red-black properties
+    Returns the number of nodes in the tree
+    """
+    def check(node, low, high):
+        if node is None:
+            return 1, 0
+
+        assert low is None or node.price > low
+        assert high is None or node.price < high
+        assert node.values
+
+        if node.colour == "red":
+            assert tree.is_black(node.left) and tree.is_black(node.right)
+
+        for child in (node.left, node.right):
+            if child is not None:
+                assert child.parent is node
+
+        left_height, left_count = check(node.left, low, node.price)
+        right_height, right_count = check(node.right, node.price, high)
+        assert left_height == right_height
+
+        return left_height + (node.colour == "black"), left_count + right_count + 1
+
+    if tree.root is not None:
+        assert tree.root.colour == "black"
+        assert tree.root.parent is None
+
+    return check(tree.root, None, None)[1]
+
+
+def test_best_moves_to_better_level():
+    order_book = OrderBook(ticker="TEST_TREE")
+
+    order_book.add_order(make_order("ask_1", "ask", 101, 1))
+    order_book.add_order(make_order("ask_2", "ask", 102, 1))
+    order_book.cancel_order(order_id="ask_1")
+
+    assert order_book.get_best_ask().order_id == "ask_2"
+    assert order_book.asks.search_price(101) is None
+
+    order_book.add_order(make_order("ask_3", "ask", 101, 1))
+    assert order_book.get_best_ask().order_id == "ask_3"
+
+
+def test_empty_levels_are_removed():
+    random.seed(2)
+    order_book = OrderBook(ticker="TEST_TREE")
+    live_orders = []
+
+    for i in range(5000):
+        if live_orders and random.random() < 0.5:
+            order_id = live_orders.pop(random.randrange(len(live_orders)))
+            order_book.cancel_order(order_id=order_id)
+        else:
+            side = random.choice(["bid", "ask"])
+            order_id = f"{side}_{i}"
+            order_book.add_order(make_order(order_id, side, random.randint(0, 300), 1))
+            live_orders.append(order_id)
+
+        if i % 50 == 0:
+            for tree in (order_book.bids, order_book.asks):
+                assert check_red_black(tree) == tree.node_count
+
+    for order_id in live_orders:
+        order_book.cancel_order(order_id=order_id)
+
+    for tree in (order_book.bids, order_book.asks):
+        assert tree.root is None
+        assert tree.best_node is None
+        assert tree.node_count == 0
+
+
+@pytest.mark.parametrize("backend", ["tree", "ladder"])
+def test_level_iterators(backend):
+    order_book = OrderBook(ticker="TEST_TREE", tick_size=1, backend=backend)
+    prices = [105, 101, 110, 103, 99, 120, 107]
+
+    for i, price in enumerate(prices):
+        order_book.add_order(make_order(f"bid_{i}", "bid", price, 1))
+        order_book.add_order(make_order(f"ask_{i}", "ask", price + 100, 1))
+
+    # Create a level without orders on each side
+    order_book.bids.add_price(104)
+    order_book.asks.add_price(204)
+
+    bids = order_book.bids
+    asks = order_book.asks
+
+    assert [price for price, _ in bids.best_levels()] == sorted(prices, reverse=True)
+    assert [price for price, _ in asks.best_levels()] == sorted(price + 100 for price in prices)
+    assert [price for price, _ in bids.ascending_levels()] == sorted(prices)
+    assert [price for price, _ in bids.ascending_levels(start_price=104)] == [105, 107, 110, 120]
+    assert [price for price, _ in bids.descending_levels(start_price=104)] == [103, 101, 99]
+    assert [price for price, _ in asks.descending_levels(start_price=207)] == [207, 205, 203, 201, 199]
+    assert list(bids.ascending_levels(start_price=121)) == []
+
+    # Levels can be removed while iterating
+    for price, level in bids.best_levels():
+        for order_id in list(level.values):
+            order_book.cancel_order(order_id=order_id)
+
+    assert order_book.get_best_bid() is None
@@ -0,0 +1,22 @@
+from src.replay import generate_events, read_journal, run_replay, compare_variants, EVENT_ADD
+import numpy as np
+
+
+def test_generated_adds_rest_on_their_own_side(tmp_path):
+    # Rare adds leave many early cancels without a target, which are turned into adds
+    records = read_journal(generate_events(tmp_path / "replay.events", total_events=5000, seed=3,
+                                           add_rate=0.01, cancel_rate=0.9))
+    adds = records[records["event"] == EVENT_ADD]
+
+    assert len(adds) > 0.01 * len(records)
+    assert np.all(np.where(adds["side"] == 0, adds["price"] < 100, adds["price"] > 100))
+
+
+def test_variants_end_with_the_same_checksum(tmp_path):
+    path = generate_events(tmp_path / "replay.events", total_events=20000, seed=7)
+    results = compare_variants(path)
+
+    assert results["checksums_match"]
+    assert results["tree_sweep"]["trades"] > 1000
+    assert results["tree_sweep"]["resting_orders"] > 0
+    assert run_replay(path)["checksum"] == results["ladder_sweep"]["checksum"]
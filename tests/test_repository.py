@@ -0,0 +1,68 @@
+from trading_system.repository import MemoryRepository, FileRepository, RECORD_HEADER, create_repository
+from trading_system.trading_system import TradingSystem
+from trading_system.order_book import OrderBook, Order
+from trading_system.portfolio import Portfolio
+import pytest
+
+
+def make_book(ticker, orders=3):
+    order_book = OrderBook(ticker=ticker, tick_size=0.01)
+    order_book.add_orders([Order(order_id=f"{ticker}_{i}", portfolio_id="TEST", side="bid", order_kind="limit",
+                                 order_price=99 + i, quantity=10, ticker=ticker) for i in range(orders)])
+    return order_book
+
+
+@pytest.mark.parametrize("name", ["memory", "file"])
+def test_repository_round_trip(name, tmp_path):
+    repository = create_repository(name, **({"path": tmp_path / "data.dat"} if name == "file" else {}))
+
+    assert repository.load("orderbook:A") is None
+    assert repository.save("orderbook:A", make_book("A"))
+    assert repository.save_many({"orderbook:B": make_book("B", orders=5), "portfolio:P": Portfolio("P")}) == \
+           ["orderbook:B", "portfolio:P"]
+
+    loaded = repository.load_many(["orderbook:A", "orderbook:B", "orderbook:C"])
+    assert sorted(loaded["orderbook:B"].order_id_map) == [f"B_{i}" for i in range(5)]
+    assert loaded["orderbook:C"] is None
+    assert sorted(repository.keys("orderbook:")) == ["orderbook:A", "orderbook:B"]
+    assert repository.load("portfolio:P").portfolio_id == "P"
+
+
+def test_file_repository_reopens_and_compacts(tmp_path):
+    path = tmp_path / "data.dat"
+    repository = FileRepository(path, sync=False, compact_ratio=2)
+
+    for orders in range(1, 5):
+        repository.save("orderbook:A", make_book("A", orders=orders))
+        repository.save("portfolio:P", Portfolio("P"))
+
+    # Superseded records are dropped once they outweigh the live ones
+    assert path.stat().st_size < 4 * repository.live_bytes
+    repository.close()
+
+    with open(path, "ab") as file:
+        file.write(RECORD_HEADER.pack(11, 1000) + b"orderbook:B")
+
+    repository = FileRepository(path)
+    assert len(repository.load("orderbook:A").order_id_map) == 4
+    assert repository.keys("") == ["orderbook:A", "portfolio:P"]
+    assert path.stat().st_size == repository.size
+
+    repository.save("orderbook:B", make_book("B"))
+    assert len(repository.load("orderbook:B").order_id_map) == 3
+    repository.close()
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning")
+def test_trading_system_without_redis():
+    trading_system = TradingSystem(repository="memory")
+    portfolio = trading_system.portfolio_manager.load_portfolio("P")
+    portfolio.cash = 1000
+    trading_system.order_book_manager.load_order_book("TEST")
+
+    assert isinstance(trading_system.repository, MemoryRepository)
+    assert trading_system.save_all() == {"order_books": ["TEST"], "portfolios": ["P"]}
+    assert trading_system.save_all() == {"order_books": [], "portfolios": []}
+
+    with pytest.raises(ValueError):
+        TradingSystem(repository="missing")
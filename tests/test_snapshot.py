@@ -0,0 +1,101 @@
+from trading_system.snapshot import dumps, loads, SnapshotReader, HEADER, MAGIC
+from trading_system.matching_engine import MatchingEngine
+from trading_system.order_book import OrderBook, Order
+from trading_system.portfolio import Portfolio
+from tests.test_journal import run_session, book_state
+from pathlib import Path
+import pickle
+import pytest
+import time
+
+
+@pytest.mark.parametrize("tick_size, backend", [(None, "tree"), (0.01, "tree"), (0.01, "ladder")])
+def test_order_book_snapshot_round_trip(tick_size, backend):
+    order_book = OrderBook(ticker="TEST", tick_size=tick_size, backend=backend,
+                           session_close_ns=time.time_ns() + 10 ** 12)
+    run_session(order_book, MatchingEngine(), start=0, count=1000)
+    order_book.add_order(Order(order_id="gtd", portfolio_id="TEST", side="bid", order_kind="limit",
+                               order_price=90, quantity=5, ticker="TEST",
+                               time_in_force="GTD", expire_ns=time.time_ns() + 10 ** 9))
+    order_book.add_order(Order(order_id="day", portfolio_id="TEST", side="ask", order_kind="limit",
+                               order_price=110, quantity=5, ticker="TEST", time_in_force="DAY", post_only=True))
+
+    restored = loads(dumps(order_book))
+
+    assert book_state(restored) == book_state(order_book)
+    assert restored.sequence == order_book.sequence
+    assert restored.trades.last(10)["buyer_order_id"].tolist() == order_book.trades.last(10)["buyer_order_id"].tolist()
+    assert restored.trades.last_price == order_book.trades.last_price
+    assert sorted(restored.expiries.timer_map) == sorted(order_book.expiries.timer_map)
+    assert dict(restored.portfolio_orders) == dict(order_book.portfolio_orders)
+
+    # Price-time priority is kept within each level
+    for order_id, price_node in order_book.order_id_map.items():
+        assert list(restored.order_id_map[order_id].values) == list(price_node.values)
+
+    day = restored.order_id_map["day"].values["day"]
+    assert day.post_only and day.expire_ns == order_book.session_close_ns
+
+    # The restored book keeps matching where the original left off
+    engine = MatchingEngine()
+    for book in (order_book, restored):
+        engine.process_order(Order(order_id="sweep", portfolio_id="TEST", side="bid", order_kind="market",
+                                   order_price=None, quantity=200, ticker="TEST"), book)
+    assert book_state(restored) == book_state(order_book)
+
+
+def test_portfolio_snapshot_round_trip():
+    portfolio = Portfolio(portfolio_id="TEST")
+    portfolio.cash = 1000.5
+    portfolio.request_trade(ticker="AAPL", position_type="long", close_open="open", quantity=10, price=150,
+                            commission=1.5)
+    portfolio.request_trade(ticker="MSFT", position_type="short", close_open="close", quantity=2.5, price=300,
+                            commission=0)
+    portfolio.trade_requests.popleft()
+
+    restored = loads(dumps(portfolio))
+
+    assert restored.cash == portfolio.cash
+    assert [request.trade_id for request in restored.position_trade_history] == ["T1", "T2"]
+    assert restored.position_trade_history[0].timestamp == portfolio.position_trade_history[0].timestamp
+    assert len(restored.trade_requests) == 1
+    assert restored.trade_requests[0] is restored.position_trade_history[1]
+    assert restored.trade_requests[0].side == "bid"
+
+
+def test_snapshot_rejects_unknown_version():
+    data = bytearray(dumps(Portfolio(portfolio_id="TEST")))
+    data[len(MAGIC)] = 99
+
+    with pytest.raises(ValueError):
+        SnapshotReader(bytes(data))
+
+    assert HEADER.size == 12
+    assert loads(pickle.dumps({"a": 1})) == {"a": 1}
+
+
+def test_loads_pickles_from_before_snapshots():
+    # Pickled by the code before __slots__, sequences and snapshots existed
+    data = Path(__file__).parent / "data"
+    order_book = loads((data / "baseline_order_book.pickle").read_bytes())
+    portfolio = loads((data / "baseline_portfolio.pickle").read_bytes())
+
+    assert book_state(order_book) == ([("ask_3", 100.5, 7, 7), ("ask_4", 101.0, 3, 3),
+                                       ("bid_1", 99.0, 20, 20), ("bid_2", 99.5, 3, 3)], [], [10, 2])
+    assert order_book.trades.last(2)["buyer_order_id"].tolist() == ["bid_0", "bid_2"]
+    assert order_book.sequence == 6
+    assert order_book.order_id_map["bid_2"].values["bid_2"].timestamp is not None
+    assert dict(order_book.portfolio_orders) == {"P1": dict.fromkeys(["bid_1", "bid_2", "ask_3", "ask_4"])}
+    assert order_book.bids.node_count == 2
+
+    # The migrated book matches and takes new snapshots
+    MatchingEngine().process_order(Order(order_id="sell", portfolio_id="P2", side="ask", order_kind="limit",
+                                         order_price=99, quantity=10, ticker="TEST"), order_book)
+    assert order_book.trades.last(2)["buyer_order_id"].tolist() == ["bid_2", "bid_1"]
+    assert book_state(loads(dumps(order_book))) == book_state(order_book)
+
+    assert portfolio.version == 0
+    assert portfolio.cash == 1000
+    assert portfolio.positions["TEST"].entry_price == 99.5
+    assert portfolio.trade_requests[0].trade_id == "T1"
+    assert loads(dumps(portfolio)).positions["TEST"].quantity == 10
@@ -0,0 +1,50 @@
+from trading_system.timer_wheel import TimerWheel
+import random
+import pytest
+
+
+@pytest.mark.parametrize("levels", [1, 2, 3])
+def test_timer_wheel_matches_sorted_expiries(levels):
+    random.seed(7)
+    wheel = TimerWheel(resolution_ns=1, slots=16, levels=levels, start_ns=0)
+    expiries = {}
+
+    # Spans every level and past the top level of a 16 x 16 x 16 tick wheel
+    for i in range(2000):
+        expiries[i] = random.randint(1, 10000)
+        wheel.schedule(i, expiries[i])
+
+    for i in range(0, 2000, 5):
+        wheel.cancel(i)
+        del expiries[i]
+
+    now = 0
+    while expiries:
+        now += random.randint(1, 500)
+        expired = wheel.advance(now)
+        due = [key for key, expire in expiries.items() if expire <= now]
+
+        assert sorted(expired) == sorted(due)
+        assert [expiries[key] for key in expired] == sorted(expiries[key] for key in expired)
+
+        for key in expired:
+            del expiries[key]
+
+    assert len(wheel) == 0
+    assert sum(wheel.level_counts) == 0
+
+
+def test_timer_wheel_reschedule_and_past_expiry():
+    wheel = TimerWheel(resolution_ns=1000, start_ns=1000000)
+    wheel.schedule("a", 5000000)
+    wheel.schedule("a", 2000000)
+    wheel.schedule("b", 0)
+
+    assert wheel.advance(1001000) == ["b"]
+    assert wheel.advance(1999000) == []
+    assert wheel.advance(2000000) == ["a"]
+
+
+def test_timer_wheel_slots_power_of_two():
+    with pytest.raises(ValueError):
+        TimerWheel(slots=100)
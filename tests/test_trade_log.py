@@ -0,0 +1,83 @@
+import pickle
+import numpy as np
+import pytest
+from trading_system.trade_log import TradeLog, INITIAL_SIZE
+
+
+def fill_log(trade_log, count):
+    for i in range(count):
+        trade_log.record(buyer_order_id=f"buy_{i}",
+                         seller_order_id=f"sell_{i}",
+                         price=100 + i,
+                         quantity=i + 1,
+                         sequence=2 * i + 1)
+
+
+def test_ring_buffer_keeps_latest_trades():
+    trade_log = TradeLog(capacity=8, price_dtype=np.int64)
+    fill_log(trade_log, 20)
+
+    assert len(trade_log) == 20
+    assert trade_log.live_count == 8
+    assert [trade.trade_id for trade in trade_log] == [str(i) for i in range(12, 20)]
+    assert trade_log[-1].buyer_order_id == "buy_19"
+    assert trade_log[12].price == 112
+
+    with pytest.raises(IndexError):
+        trade_log[11]
+
+
+def test_last_and_since():
+    trade_log = TradeLog(capacity=8, price_dtype=np.int64)
+    fill_log(trade_log, 13)
+
+    last = trade_log.last(3)
+    assert last["trade_id"].tolist() == [10, 11, 12]
+    assert last["quantity"].tolist() == [11, 12, 13]
+    assert trade_log.last(100)["trade_id"].tolist() == list(range(5, 13))
+
+    since = trade_log.since(sequence=19)
+    assert since["sequence"].tolist() == [21, 23, 25]
+    assert since["seller_order_id"].tolist() == ["sell_10", "sell_11", "sell_12"]
+    assert len(trade_log.since(sequence=25)["price"]) == 0
+
+
+def test_spill_to_disk(tmp_path):
+    trade_log = TradeLog(capacity=4, price_dtype=np.int64, spill_dir=tmp_path, name="TEST")
+    fill_log(trade_log, 10)
+
+    assert len(trade_log.spilled_chunks) == 2
+    chunk = np.load(trade_log.spilled_chunks[1])
+    assert chunk["buyer_order_id"].tolist() == ["buy_4", "buy_5", "buy_6", "buy_7"]
+    assert chunk["sequence"].tolist() == [9, 11, 13, 15]
+
+
+def test_pickle_keeps_live_trades():
+    trade_log = TradeLog(capacity=8, price_dtype=np.int64)
+    fill_log(trade_log, 11)
+
+    loaded = pickle.loads(pickle.dumps(trade_log))
+
+    assert len(loaded) == 11
+    assert [(trade.trade_id, trade.price, trade.sequence) for trade in loaded] == \
+           [(trade.trade_id, trade.price, trade.sequence) for trade in trade_log]
+
+    loaded.record(buyer_order_id="buy_11", seller_order_id="sell_11", price=111, quantity=12, sequence=23)
+    assert loaded.last(2)["buyer_order_id"].tolist() == ["buy_10", "buy_11"]
+
+
+def test_columns_grow_to_capacity(tmp_path):
+    trade_log = TradeLog(capacity=1000, price_dtype=np.int64, spill_dir=tmp_path, name="TEST")
+    assert len(trade_log.prices) == INITIAL_SIZE
+
+    fill_log(trade_log, 600)
+    assert trade_log.size == len(trade_log.prices) == 1000
+    assert trade_log.last(600)["buyer_order_id"].tolist() == [f"buy_{i}" for i in range(600)]
+
+    # A partly filled log is restored at its size, a full one at its capacity
+    assert len(pickle.loads(pickle.dumps(trade_log)).prices) == 600
+
+    fill_log(trade_log, 1500)
+    assert len(trade_log.spilled_chunks) == 2
+    assert trade_log.last(1)["sequence"].tolist() == [2999]
+    assert len(pickle.loads(pickle.dumps(trade_log)).prices) == 1000
@@ -0,0 +1,92 @@
+from trading_system.matching_engine import MatchingEngine
+from trading_system.order_book import OrderBook
+from trading_system.trigger_book import TriggerBook
+from tests.conftest import make_order
+import pytest
+
+
+def test_stop_requires_stop_price():
+    with pytest.raises(ValueError):
+        make_order("stop", "bid", None, 10, order_kind="stop")
+
+
+def test_release_only_triggered_stops():
+    stops = TriggerBook()
+
+    for i, stop_price in enumerate([99, 95, 97, 97]):
+        order = make_order(f"sell_{i}", "ask", None, 10, order_kind="stop", stop_price=stop_price)
+        stops.add_order(order)
+
+    stops.add_order(make_order("buy", "bid", 105, 10, order_kind="stop_limit", stop_price=101))
+
+    assert stops.release(100) == []
+
+    triggered = stops.release(97)
+
+    assert [order.order_id for order in triggered] == ["sell_0", "sell_2", "sell_3"]
+    assert all(order.order_kind == "market" for order in triggered)
+    assert len(stops) == 2
+
+    triggered = stops.release(101)
+
+    assert [order.order_id for order in triggered] == ["buy"]
+    assert triggered[0].order_kind == "limit"
+    assert list(stops.order_id_map) == ["sell_1"]
+
+
+def test_trade_triggers_stops():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", tick_size=0.01)
+
+    order_book.add_orders([make_order("ask_100", "ask", 100, 10),
+                           make_order("ask_101", "ask", 101, 10),
+                           make_order("ask_102", "ask", 102, 10)])
+
+    # The trade at 100 triggers the first stop, which fills at 101 and triggers the second
+    engine.process_order(make_order("stop_1", "bid", None, 10, order_kind="stop", stop_price=100), order_book)
+    engine.process_order(make_order("stop_2", "bid", 101.5, 5, order_kind="stop_limit", stop_price=101), order_book)
+    assert len(order_book.trades) == 0
+    assert len(order_book.stops) == 2
+
+    engine.process_order(make_order("buy", "bid", 100, 10), order_book)
+
+    trades = order_book.trades.last(3)
+    assert trades["buyer_order_id"].tolist() == ["buy", "stop_1"]
+    assert trades["price"].tolist() == [10000, 10100]
+    assert len(order_book.stops) == 0
+    assert order_book.get_best_bid().order_id == "stop_2"
+    assert order_book.from_ticks(order_book.get_best_bid().order_price) == 101.5
+
+
+def test_cancel_stop_order():
+    order_book = OrderBook(ticker="TEST")
+    order_book.add_order(make_order("stop", "ask", 95, 10, order_kind="stop_limit", stop_price=96))
+
+    assert "stop" in order_book.stops.order_id_map
+
+    order_book.cancel_order("stop")
+
+    assert len(order_book.stops) == 0
+    assert order_book.stops.sell_stops.root is None
+
+
+def test_partly_filled_stop_does_not_rest():
+    engine = MatchingEngine()
+    order_book = OrderBook(ticker="TEST", tick_size=0.01)
+
+    order_book.add_orders([make_order("bid_100", "bid", 100, 10),
+                           make_order("bid_99", "bid", 99, 5)])
+    engine.process_order(make_order("stop", "ask", None, 20, order_kind="stop", stop_price=100), order_book)
+
+    # The trade at 100 triggers the stop, which fills 5 at 100 and 5 at 99 then cancels the other 10
+    engine.process_order(make_order("sell", "ask", 100, 5), order_book)
+
+    assert order_book.trades.last(3)["seller_order_id"].tolist() == ["sell", "stop", "stop"]
+    assert "stop" not in order_book.order_id_map
+    assert order_book.get_best_bid() is None
+
+    # A later ask far above the stop price does not trade
+    engine.process_order(make_order("ask_150", "ask", 150, 10), order_book)
+
+    assert len(order_book.trades) == 3
+    assert order_book.get_best_ask().order_id == "ask_150"
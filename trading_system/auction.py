@@ -0,0 +1,158 @@
+import time
+import logging
+from itertools import takewhile
+import numpy as np
+from trading_system.matching_engine import MatchingEngine
+
+
+class CallAuction:
+    def __init__(self, interval: float = 1.0, engine: MatchingEngine = None):
+        """
+        Periodic call auction. Orders rest in the book without matching while they collect,
+        then a single uncross fills every crossing order at one clearing price.
+        :param interval: Seconds between uncrosses
+        :param engine: Matches the stops triggered by the clearing price
+        """
+        self.interval = interval
+        self.engine = engine or MatchingEngine()
+        self.last_uncross = time.monotonic()
+        self.logger = logging.getLogger(__name__)
+
+    def submit(self, order, order_book):
+        """
+        Adds an order to the book without matching
+        Uncrosses the book if the interval has passed
+        :return: The uncross result if an uncross ran, otherwise None
+        """
+        order_book.add_order(order)
+
+        if time.monotonic() - self.last_uncross >= self.interval:
+            return self.uncross(order_book)
+
+        return None
+
+    def submit_orders(self, orders, order_book):
+        """
+        Adds a batch of orders to the book without matching
+        Uncrosses the book if the interval has passed
+        """
+        order_book.add_orders(orders)
+
+        if time.monotonic() - self.last_uncross >= self.interval:
+            return self.uncross(order_book)
+
+        return None
+
+    def crossing_levels(self, order_book):
+        """
+        Return the price levels that can take part in an uncross
+        Bids priced at or above the best ask and asks priced at or below the best bid
+        """
+        best_bid = order_book.get_best_bid()
+        best_ask = order_book.get_best_ask()
+
+        if best_bid is None or best_ask is None or best_bid.order_price < best_ask.order_price:
+            return [], []
+
+        bid_levels = list(takewhile(lambda level: level[0] >= best_ask.order_price, order_book.bids.best_levels()))
+        ask_levels = list(takewhile(lambda level: level[0] <= best_bid.order_price, order_book.asks.best_levels()))
+
+        return bid_levels, ask_levels
+
+    def clearing_price(self, order_book, reference_price=None):
+        """
+        Find the price that executes the most volume
+        Uses cumulative demand and supply over the crossing price levels
+        Ties go to the smallest imbalance, then the price closest to the reference price,
+        then the lowest price
+        :return: (clearing price, executable volume), or (None, 0) if the book does not cross
+        """
+        bid_levels, ask_levels = self.crossing_levels(order_book)
+
+        if not bid_levels:
+            return None, 0
+
+        # Bid levels are in descending price order, ask levels in ascending price order
+        bid_prices = np.array([price for price, _ in bid_levels])
+        bid_quantities = np.array([level.quantity for _, level in bid_levels])
+        ask_prices = np.array([price for price, _ in ask_levels])
+        ask_quantities = np.array([level.quantity for _, level in ask_levels])
+
+        candidates = np.unique(np.concatenate([bid_prices, ask_prices]))
+
+        # Demand at a price is every bid at or above it
+        cumulative_demand = np.concatenate([[0], np.cumsum(bid_quantities)])
+        demand = cumulative_demand[np.searchsorted(-bid_prices, -candidates, side="right")]
+
+        # Supply at a price is every ask at or below it
+        cumulative_supply = np.concatenate([[0], np.cumsum(ask_quantities)])
+        supply = cumulative_supply[np.searchsorted(ask_prices, candidates, side="right")]
+
+        executable = np.minimum(demand, supply)
+        imbalance = np.abs(demand - supply)
+
+        if reference_price is None:
+            distance = np.zeros(len(candidates))
+        else:
+            distance = np.abs(candidates - order_book.to_ticks(reference_price))
+
+        # np.lexsort sorts by the last key first
+        best = np.lexsort((candidates, distance, imbalance, -executable))[0]
+
+        return candidates[best].item(), int(executable[best])
+
+    def uncross(self, order_book, reference_price=None):
+        """
+        Fills all crossing orders at the clearing price in price-time priority
+        Stops triggered by the clearing price are then released and matched against the book
+        :return: Clearing price, executed volume and the number of uncross trades
+        """
+        self.last_uncross = time.monotonic()
+
+        if order_book.journal is not None:
+            order_book.journal_lsn = order_book.journal.uncross(reference_price)
+
+        price, volume = self.clearing_price(order_book, reference_price=reference_price)
+
+        if volume == 0:
+            return {"price": None, "volume": 0, "trades": 0}
+
+        bid_levels, ask_levels = self.crossing_levels(order_book)
+
+        # Collect orders first, filling them removes levels from the book
+        bids = [order for level_price, level in bid_levels if level_price >= price for order in level.values.values()]
+        asks = [order for level_price, level in ask_levels if level_price <= price for order in level.values.values()]
+
+        remaining = volume
+        trade_count = 0
+        bid_index = 0
+        ask_index = 0
+
+        while remaining > 0:
+            bid = bids[bid_index]
+            ask = asks[ask_index]
+            trade_quantity = min(bid.quantity, ask.quantity, remaining)
+
+            order_book.trades.record(buyer_order_id=bid.order_id,
+                                     seller_order_id=ask.order_id,
+                                     price=price,
+                                     quantity=trade_quantity,
+                                     sequence=order_book.next_sequence(),
+                                     created_ns=time.time_ns() if order_book.record_time else None)
+
+            order_book.fill_order(order=bid, quantity=trade_quantity)
+            order_book.fill_order(order=ask, quantity=trade_quantity)
+            remaining -= trade_quantity
+            trade_count += 1
+
+            if bid.quantity == 0:
+                bid_index += 1
+            if ask.quantity == 0:
+                ask_index += 1
+
+        self.logger.info(f"UNCROSSED {order_book.ticker} AT {order_book.from_ticks(price)} FOR {volume}")
+
+        if order_book.stops.order_id_map:
+            self.engine.release_stops(order_book=order_book)
+
+        return {"price": order_book.from_ticks(price), "volume": volume, "trades": trade_count}
@@ -0,0 +1,448 @@
+import os
+import time
+import struct
+import logging
+import threading
+import weakref
+from pathlib import Path
+import numpy as np
+from trading_system.order_book import Order, TIME_IN_FORCE
+from trading_system.matching_engine import MatchingEngine
+from trading_system.auction import CallAuction
+
+EVENT_ADD = 1  # Order rested without matching through OrderBook.add_order or add_orders
+EVENT_SUBMIT = 2  # Order matched through MatchingEngine.process_order
+EVENT_CANCEL = 3
+EVENT_MODIFY = 4
+EVENT_TRADE = 5  # Audit only, trades are rebuilt by replay
+EVENT_UNCROSS = 6
+EVENT_LONG_ID = 7  # Part of an id too long for its field, applied to the next record that is not a part
+EVENT_BATCH = 8  # Header of the quantity submits matched in one MatchingEngine.process_orders call
+
+SIDES = ("bid", "ask")
+ORDER_KINDS = ("market", "limit", "stop", "stop_limit")
+
+# lsn, created_ns, event, side, order_kind, time_in_force, post_only, price, stop_price, quantity, expire_ns,
+# order_id, other_id, portfolio_id
+RECORD = struct.Struct("<qqBBBBB3xddqq32s32s32s")
+RECORD_DTYPE = np.dtype([("lsn", "<i8"),
+                         ("created_ns", "<i8"),
+                         ("event", "u1"),
+                         ("side", "u1"),
+                         ("order_kind", "u1"),
+                         ("time_in_force", "u1"),
+                         ("post_only", "u1"),
+                         ("padding", "V3"),
+                         ("price", "<f8"),
+                         ("stop_price", "<f8"),
+                         ("quantity", "<i8"),
+                         ("expire_ns", "<i8"),
+                         ("order_id", "S32"),
+                         ("other_id", "S32"),
+                         ("portfolio_id", "S32")])
+
+SIDE_CODES = dict((side, code) for code, side in enumerate(SIDES))
+KIND_CODES = dict((kind, code) for code, kind in enumerate(ORDER_KINDS))
+TIME_IN_FORCE_CODES = dict((time_in_force, code) for code, time_in_force in enumerate(TIME_IN_FORCE))
+NAN = float("nan")
+ID_SIZE = 32  # Bytes of each id field, order_id, other_id then portfolio_id
+
+
+def encode_id(value):
+    """
+    Encode an id for a journal field
+    Ids longer than ID_SIZE bytes are written with EVENT_LONG_ID records before their record
+    """
+    return value.encode()
+
+
+class Journal:
+    def __init__(self, path, group_size: int = 1000, sync_interval: float = 0.01, sync: bool = True):
+        """
+        Append-only journal of order book events in fixed size binary records
+        Records are buffered and written with one fsync per group commit
+        :param path: Journal file, one per order book
+        :param group_size: Records buffered before a commit
+        :param sync_interval: Seconds after which buffered records are committed, by the next write
+                              or by the shared JournalFlusher if no write comes
+        :param sync: fsync on every commit. Without it records only reach the OS page cache
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.group_size = group_size
+        self.sync_interval = sync_interval
+        self.sync = sync
+        self.logger = logging.getLogger(__name__)
+
+        # Drop a partly written last record left by a crash
+        self.file = open(self.path, "ab")
+        size = self.file.tell()
+
+        if size % RECORD.size:
+            self.file.truncate(size - size % RECORD.size)
+            self.logger.warning(f"TRUNCATED PARTIAL RECORD IN {self.path}")
+
+        self.count = size // RECORD.size  # lsn of the last record
+        self.buffer = bytearray()
+        self.pending = 0
+        self.last_commit = time.monotonic()
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def write(self, event, side=0, order_kind=0, time_in_force=0, post_only=0, price=NAN, stop_price=NAN,
+              quantity=0, expire_ns=0, order_id=b"", other_id=b"", portfolio_id=b""):
+        """
+        Appends a record to the buffer and commits the group if it is full or old enough
+        :return: lsn of the record
+        """
+        records = bytearray()
+
+        with self.lock:
+            self.pack(records, event, side, order_kind, time_in_force, post_only, price, stop_price, quantity,
+                      expire_ns, order_id, other_id, portfolio_id)
+            self.append(records)
+
+            if self.pending >= self.group_size or time.monotonic() - self.last_commit >= self.sync_interval:
+                self.commit_buffer()
+
+            return self.count
+
+    def pack(self, records, event, side=0, order_kind=0, time_in_force=0, post_only=0, price=NAN, stop_price=NAN,
+             quantity=0, expire_ns=0, order_id=b"", other_id=b"", portfolio_id=b""):
+        """
+        Packs a record onto a bytearray of records not yet in the buffer, after the EVENT_LONG_ID
+        records of its long ids. Records take the lsns following the buffer
+        """
+        if len(order_id) > ID_SIZE or len(other_id) > ID_SIZE or len(portfolio_id) > ID_SIZE:
+            self.pack_long_ids(records, order_id, other_id, portfolio_id)
+
+        records += RECORD.pack(self.count + len(records) // RECORD.size + 1, time.time_ns(), event, side, order_kind,
+                               time_in_force, post_only, price, stop_price, quantity, expire_ns, order_id, other_id,
+                               portfolio_id)
+
+    def append(self, records):
+        """
+        Appends packed records to the buffer, without taking the lock or committing
+        Records are packed first so one that fails to pack uses up no lsn
+        """
+        was_empty = not self.pending
+        count = len(records) // RECORD.size
+        self.buffer += records
+        self.count += count
+        self.pending += count
+
+        if was_empty and count:
+            FLUSHER.notify(self)
+
+    def pack_long_ids(self, records, *ids):
+        """
+        Packs EVENT_LONG_ID records holding every id longer than ID_SIZE bytes
+        Each record carries the field in side, the full length in quantity and up to
+        3 * ID_SIZE bytes of the id spread over the id fields
+        """
+        chunk_size = 3 * ID_SIZE
+
+        for field, value in enumerate(ids):
+            if len(value) <= ID_SIZE:
+                continue
+
+            for start in range(0, len(value), chunk_size):
+                chunk = value[start:start + chunk_size]
+                records += RECORD.pack(self.count + len(records) // RECORD.size + 1, time.time_ns(), EVENT_LONG_ID,
+                                       field, 0, 0, 0, NAN, NAN, len(value), 0, chunk[:ID_SIZE],
+                                       chunk[ID_SIZE:2 * ID_SIZE], chunk[2 * ID_SIZE:])
+
+    def write_order(self, event, order):
+        """
+        Appends an arriving order, prices in the units the order was submitted in
+        """
+        return self.write(event, **self.order_fields(order))
+
+    @staticmethod
+    def order_fields(order):
+        return dict(side=SIDE_CODES[order.side],
+                    order_kind=KIND_CODES[order.order_kind],
+                    time_in_force=TIME_IN_FORCE_CODES[order.time_in_force],
+                    post_only=order.post_only,
+                    price=NAN if order.order_price is None else order.order_price,
+                    stop_price=NAN if order.stop_price is None else order.stop_price,
+                    quantity=order.quantity,
+                    expire_ns=order.expire_ns or 0,
+                    order_id=encode_id(order.order_id),
+                    portfolio_id=encode_id(order.portfolio_id))
+
+    def add(self, order):
+        return self.write_order(EVENT_ADD, order)
+
+    def submit(self, order):
+        return self.write_order(EVENT_SUBMIT, order)
+
+    def submit_batch(self, orders):
+        """
+        Appends an EVENT_BATCH header and a submit for each order under one lock,
+        then checks for a group commit once for the whole batch
+        :return: lsn of the last record
+        """
+        records = bytearray()
+
+        with self.lock:
+            self.pack(records, EVENT_BATCH, quantity=len(orders))
+
+            for order in orders:
+                self.pack(records, EVENT_SUBMIT, **self.order_fields(order))
+
+            self.append(records)
+
+            if self.pending >= self.group_size or time.monotonic() - self.last_commit >= self.sync_interval:
+                self.commit_buffer()
+
+            return self.count
+
+    def cancel(self, order_id):
+        return self.write(event=EVENT_CANCEL, order_id=encode_id(order_id))
+
+    def modify(self, order_id, new_qty=None, new_price=None):
+        return self.write(event=EVENT_MODIFY,
+                          quantity=new_qty or 0,
+                          price=NAN if new_price is None else new_price,
+                          order_id=encode_id(order_id))
+
+    def trade(self, buyer_order_id, seller_order_id, price, quantity):
+        """
+        Appends a trade, price in the units of the book
+        """
+        return self.write(event=EVENT_TRADE,
+                          price=price,
+                          quantity=quantity,
+                          order_id=encode_id(buyer_order_id),
+                          other_id=encode_id(seller_order_id))
+
+    def uncross(self, reference_price=None):
+        return self.write(event=EVENT_UNCROSS, price=NAN if reference_price is None else reference_price)
+
+    def commit(self):
+        """
+        Writes the buffered records and fsyncs the file
+        """
+        with self.lock:
+            self.commit_buffer()
+
+    def commit_buffer(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.file.flush()
+
+            if self.sync:
+                os.fsync(self.file.fileno())
+
+            self.buffer = bytearray()
+            self.pending = 0
+
+        self.last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self.file.close()
+
+
+class JournalFlusher:
+    def __init__(self):
+        """
+        One background thread that commits the buffered records of every journal once they are
+        sync_interval old, when no further write comes to commit them
+        It sleeps until the oldest buffered group is due, and without a timeout while no journal
+        has buffered records. Journals are only weakly referenced so unclosed ones can be collected
+        """
+        self.condition = threading.Condition()
+        self.journals = weakref.WeakSet()  # Journals whose buffer held records when last seen
+        self.thread = None
+        self.logger = logging.getLogger(__name__)
+
+    def notify(self, journal):
+        """
+        Called by a journal when records enter its empty buffer
+        """
+        with self.condition:
+            self.journals.add(journal)
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="journal-flusher", daemon=True)
+                self.thread.start()
+
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                due = []
+                timeout = None
+                now = time.monotonic()
+
+                # Read without the journal locks, a journal is never locked while the condition is held
+                for journal in list(self.journals):
+                    if not journal.pending:
+                        self.journals.discard(journal)
+                    elif now - journal.last_commit >= journal.sync_interval:
+                        self.journals.discard(journal)
+                        due.append(journal)
+                    else:
+                        wait = journal.last_commit + journal.sync_interval - now
+                        timeout = wait if timeout is None else min(timeout, wait)
+
+                journal = None  # No strong reference is kept while waiting
+
+                if not due:
+                    self.condition.wait(timeout)
+                    continue
+
+            for journal in due:
+                try:
+                    if not journal.file.closed:
+                        journal.commit()
+                except Exception as e:
+                    self.logger.error(f"FAILED TO COMMIT {journal.path}: {e}")
+
+            due = journal = None
+
+
+FLUSHER = JournalFlusher()
+
+
+def read_journal(path, start_lsn: int = 0):
+    """
+    Memory maps the records of a journal after a given lsn
+    """
+    path = Path(path)
+
+    if not path.exists():
+        return np.zeros(0, dtype=RECORD_DTYPE)
+
+    count = path.stat().st_size // RECORD.size
+
+    if count <= start_lsn:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))[start_lsn:]
+
+
+def replay(order_book, records, engine: MatchingEngine = None, chunk_size: int = 100000):
+    """
+    Applies journal records to an order book
+    Runs of consecutive adds and cancels are applied in one add_orders or cancel_orders call,
+    submits and modifies go through MatchingEngine and the submits after an EVENT_BATCH header
+    are matched in one process_orders call. Trade records are skipped as matching rebuilds them.
+    :return: Number of records applied
+    """
+    engine = engine or MatchingEngine()
+    process_order = engine.process_order
+    ticker = order_book.ticker
+    journal = order_book.journal
+    order_book.detach_journal()
+
+    batch_event = None
+    batch = []
+    long_ids = {}  # field: id of the EVENT_LONG_ID records read so far
+    remaining = 0  # Submits still to read for the current EVENT_BATCH
+
+    def apply_batch():
+        if batch_event == EVENT_ADD:
+            if len(batch) == 1:
+                order_book.add_order(batch[0])
+            else:
+                order_book.add_orders(batch)
+        elif batch_event == EVENT_CANCEL:
+            if len(batch) == 1:
+                order_book.cancel_order(batch[0])
+            else:
+                order_book.cancel_orders(batch)
+        elif batch_event == EVENT_BATCH:
+            engine.process_orders(batch, order_book)
+
+    try:
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+
+            # Decode column by column, reading single numpy records is slow
+            for (event, side, order_kind, time_in_force, post_only, price, stop_price, quantity, expire_ns,
+                 order_id, other_id, portfolio_id) in zip(chunk["event"].tolist(),
+                                                chunk["side"].tolist(),
+                                                chunk["order_kind"].tolist(),
+                                                chunk["time_in_force"].tolist(),
+                                                chunk["post_only"].tolist(),
+                                                chunk["price"].tolist(),
+                                                chunk["stop_price"].tolist(),
+                                                chunk["quantity"].tolist(),
+                                                chunk["expire_ns"].tolist(),
+                                                chunk["order_id"].tolist(),
+                                                chunk["other_id"].tolist(),
+                                                chunk["portfolio_id"].tolist()):
+                if event == EVENT_LONG_ID:
+                    long_ids[side] = (long_ids.get(side, b"") + order_id + other_id + portfolio_id)[:quantity]
+                    continue
+
+                if long_ids:
+                    order_id = long_ids.get(0, order_id)
+                    portfolio_id = long_ids.get(2, portfolio_id)
+                    long_ids = {}
+
+                if event == EVENT_TRADE:
+                    continue
+
+                if event == EVENT_BATCH:
+                    if batch:
+                        apply_batch()
+                        batch = []
+                    batch_event = EVENT_BATCH
+                    remaining = quantity
+                    continue
+
+                if remaining:
+                    remaining -= 1
+                elif event != batch_event:
+                    if batch:
+                        apply_batch()
+                        batch = []
+                    batch_event = event
+
+                # Missing prices are stored as NaN, the only value not equal to itself
+                if event == EVENT_ADD or event == EVENT_SUBMIT:
+                    order = Order(order_id=order_id.decode(),
+                                  portfolio_id=portfolio_id.decode(),
+                                  side=SIDES[side],
+                                  order_kind=ORDER_KINDS[order_kind],
+                                  order_price=None if price != price else price,
+                                  quantity=quantity,
+                                  ticker=ticker,
+                                  stop_price=None if stop_price != stop_price else stop_price,
+                                  time_in_force=TIME_IN_FORCE[time_in_force],
+                                  post_only=bool(post_only),
+                                  expire_ns=expire_ns or None)
+
+                    if event == EVENT_ADD or batch_event == EVENT_BATCH:
+                        batch.append(order)
+                    else:
+                        process_order(order, order_book)
+                elif event == EVENT_CANCEL:
+                    batch.append(order_id.decode())
+                elif event == EVENT_MODIFY:
+                    engine.modify_order(order_id=order_id.decode(),
+                                        order_book=order_book,
+                                        new_qty=quantity or None,
+                                        new_price=None if price != price else price)
+                elif event == EVENT_UNCROSS:
+                    CallAuction(interval=0, engine=engine).uncross(order_book,
+                                                                   reference_price=None if price != price else price)
+
+        if batch:
+            apply_batch()
+    finally:
+        if journal is not None:
+            order_book.attach_journal(journal)
+
+    if len(records):
+        order_book.journal_lsn = int(records["lsn"][-1])
+
+    return len(records)
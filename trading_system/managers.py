@@ -1,14 +1,25 @@
 import logging
-from trading_system.redis import RedisRepository
+from pathlib import Path
+from trading_system.repository import Repository
 from trading_system.order_book import OrderBook
 from trading_system.portfolio import Portfolio
 from trading_system.market_data_fetcher import MarketDataFetcher
+from trading_system.journal import Journal, read_journal, replay
 
 
 class OrderBookManager:
-    def __init__(self, redis_repository: RedisRepository):
-        self.repository = redis_repository
+    def __init__(self, repository: Repository, tick_sizes: dict = None, journal_dir: str = None):
+        """
+        :param repository: Store order books are saved to and loaded from
+        :param tick_sizes: Optional tick size per ticker used when creating new order books
+        :param journal_dir: Optional directory of per ticker journals. Loaded books replay the
+                            journal records after their snapshot, then keep journaling
+        """
+        self.repository = repository
         self.order_books = {}
+        self.tick_sizes = tick_sizes or {}
+        self.journal_dir = Path(journal_dir) if journal_dir else None
+        self.saved_versions = {}  # ticker: version of the order book last loaded from or saved to redis
         self.logger = logging.getLogger(__name__)
 
     def load_order_book(self, ticker: str):
@@ -19,20 +30,59 @@ class OrderBookManager:
             return self.order_books[ticker]
 
         # Load order book from Redis
-        order_book = self.repository.load(key=f"orderbook:{ticker}")
+        return self.register_order_book(ticker=ticker, order_book=self.repository.load(key=f"orderbook:{ticker}"))
+
+    def load_order_books(self, tickers: list = None):
+        """
+        Loads many order books from redis in one batch, books already in memory are kept
+        :param tickers: Defaults to every order book saved in redis
+        :return: The loaded order books by ticker
+        """
+        if tickers is None:
+            tickers = [key.split(":", 1)[1] for key in self.repository.keys(prefix="orderbook:")]
+
+        missing = [ticker for ticker in tickers if ticker not in self.order_books]
+        loaded = self.repository.load_many(keys=[f"orderbook:{ticker}" for ticker in missing])
+
+        for ticker in missing:
+            self.register_order_book(ticker=ticker, order_book=loaded[f"orderbook:{ticker}"])
 
+        return dict((ticker, self.order_books[ticker]) for ticker in tickers)
+
+    def register_order_book(self, ticker: str, order_book: OrderBook = None):
+        """
+        Adds an order book loaded from redis to memory, recovering it from its journal
+        Creates a new order book if none was loaded
+        """
         # Create new order book if not loaded from redis
         if order_book is None:
-            order_book = OrderBook(ticker=ticker)
+            order_book = OrderBook(ticker=ticker, tick_size=self.tick_sizes.get(ticker))
             self.logger.info(f"NEW {ticker} ORDER BOOK CREATED")
         else:
+            self.saved_versions[ticker] = order_book.version
             self.logger.info(f"LOADED {ticker} ORDER BOOK FROM REDIS")
 
+        if self.journal_dir is not None:
+            self.recover_order_book(order_book=order_book)
+
         # Add to order book storage
         self.order_books[ticker] = order_book
 
         return order_book
 
+    def recover_order_book(self, order_book):
+        """
+        Replays the journal records written after the order book snapshot, then attaches the journal
+        """
+        path = self.journal_dir / f"{order_book.ticker}.journal"
+        records = read_journal(path, start_lsn=order_book.journal_lsn)
+
+        if len(records):
+            replay(order_book=order_book, records=records)
+            self.logger.info(f"REPLAYED {len(records)} JOURNAL RECORDS INTO {order_book.ticker} ORDER BOOK")
+
+        order_book.attach_journal(Journal(path))
+
     def save_order_book(self, ticker: str):
         """
         Save an order book to redis
@@ -43,22 +93,77 @@ class OrderBookManager:
 
         order_book = self.order_books[ticker]
 
+        if order_book.journal is not None:
+            order_book.journal.commit()
+
         # Save order book to redis
-        self.repository.save(key=f"orderbook:{ticker}", data=order_book)
+        if self.repository.save(key=f"orderbook:{ticker}", data=order_book):
+            self.saved_versions[ticker] = order_book.version
+
+    def is_dirty(self, ticker: str):
+        """
+        Check if a loaded order book changed since it was last loaded or saved
+        """
+        return self.saved_versions.get(ticker) != self.order_books[ticker].version
+
+    def save_all(self):
+        """
+        Saves the order books that changed since they were last loaded or saved in one batch
+        :return: Tickers of the saved order books
+        """
+        dirty = [ticker for ticker in self.order_books if self.is_dirty(ticker)]
+
+        for ticker in dirty:
+            if self.order_books[ticker].journal is not None:
+                self.order_books[ticker].journal.commit()
+
+        saved = self.repository.save_many(items=dict((f"orderbook:{ticker}", self.order_books[ticker])
+                                                     for ticker in dirty))
+        saved = [key.split(":", 1)[1] for key in saved]
+
+        for ticker in saved:
+            self.saved_versions[ticker] = self.order_books[ticker].version
+
+        return saved
+
+    def cancel_all(self, portfolio_id: str, ticker: str = None):
+        """
+        Cancels every resting and stop order of a portfolio in the loaded order books
+        Only the given ticker's book if a ticker is given
+        :return: The ids of the cancelled orders by ticker
+        """
+        if ticker is not None:
+            order_books = {ticker: self.load_order_book(ticker=ticker)}
+        else:
+            order_books = self.order_books
+
+        cancelled = {}
+
+        for book_ticker, order_book in order_books.items():
+            if portfolio_id in order_book.portfolio_orders:
+                cancelled[book_ticker] = order_book.cancel_portfolio_orders(portfolio_id=portfolio_id)
+
+        self.logger.info(f"CANCELLED {sum(map(len, cancelled.values()))} ORDERS FOR PORTFOLIO {portfolio_id}")
+
+        return cancelled
 
     def remove_order_book(self, ticker: str):
         """
         Remove an order book from memory
         """
-        self.save_order_book(ticker=ticker)
+        if self.is_dirty(ticker):
+            self.save_order_book(ticker=ticker)
+
         del self.order_books[ticker]
+        self.saved_versions.pop(ticker, None)
 
 
 class PortfolioManager:
-    def __init__(self, redis_repository: RedisRepository):
-        self.repository = redis_repository
+    def __init__(self, repository: Repository):
+        self.repository = repository
         self.logger = logging.getLogger(__name__)
         self.portfolios = {}
+        self.saved_versions = {}  # portfolio_id: version of the portfolio last loaded from or saved to redis
 
     def load_portfolio(self, portfolio_id: str):
         """
@@ -68,13 +173,37 @@ class PortfolioManager:
             return self.portfolios[portfolio_id]
 
         # Load portfolio from redis
-        portfolio = self.repository.load(key=f"portfolio:{portfolio_id}")
+        return self.register_portfolio(portfolio_id=portfolio_id,
+                                       portfolio=self.repository.load(key=f"portfolio:{portfolio_id}"))
+
+    def load_portfolios(self, portfolio_ids: list = None):
+        """
+        Loads many portfolios from redis in one batch, portfolios already in memory are kept
+        :param portfolio_ids: Defaults to every portfolio saved in redis
+        :return: The loaded portfolios by id
+        """
+        if portfolio_ids is None:
+            portfolio_ids = [key.split(":", 1)[1] for key in self.repository.keys(prefix="portfolio:")]
 
+        missing = [portfolio_id for portfolio_id in portfolio_ids if portfolio_id not in self.portfolios]
+        loaded = self.repository.load_many(keys=[f"portfolio:{portfolio_id}" for portfolio_id in missing])
+
+        for portfolio_id in missing:
+            self.register_portfolio(portfolio_id=portfolio_id, portfolio=loaded[f"portfolio:{portfolio_id}"])
+
+        return dict((portfolio_id, self.portfolios[portfolio_id]) for portfolio_id in portfolio_ids)
+
+    def register_portfolio(self, portfolio_id: str, portfolio: Portfolio = None):
+        """
+        Adds a portfolio loaded from redis to memory
+        Creates a new portfolio if none was loaded
+        """
         # Create new portfolio if not in redis
         if portfolio is None:
             portfolio = Portfolio(portfolio_id=portfolio_id)
             self.logger.info(f"CREATED PORTFOLIO {portfolio_id}")
         else:
+            self.saved_versions[portfolio_id] = portfolio.version
             self.logger.info(f"LOADED PORTFOLIO {portfolio_id} FROM REDIS")
 
         self.portfolios[portfolio_id] = portfolio
@@ -92,7 +221,29 @@ class PortfolioManager:
         portfolio = self.portfolios[portfolio_id]
 
         # Save portfolio to redis
-        self.repository.save(key=f"portfolio:{portfolio_id}", data=portfolio)
+        if self.repository.save(key=f"portfolio:{portfolio_id}", data=portfolio):
+            self.saved_versions[portfolio_id] = portfolio.version
+
+    def is_dirty(self, portfolio_id: str):
+        """
+        Check if a loaded portfolio changed since it was last loaded or saved
+        """
+        return self.saved_versions.get(portfolio_id) != self.portfolios[portfolio_id].version
+
+    def save_all(self):
+        """
+        Saves the portfolios that changed since they were last loaded or saved in one batch
+        :return: Ids of the saved portfolios
+        """
+        dirty = [portfolio_id for portfolio_id in self.portfolios if self.is_dirty(portfolio_id)]
+        saved = self.repository.save_many(items=dict((f"portfolio:{portfolio_id}", self.portfolios[portfolio_id])
+                                                     for portfolio_id in dirty))
+        saved = [key.split(":", 1)[1] for key in saved]
+
+        for portfolio_id in saved:
+            self.saved_versions[portfolio_id] = self.portfolios[portfolio_id].version
+
+        return saved
 
 
 class MarketDataManager:
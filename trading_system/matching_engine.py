@@ -1,37 +1,279 @@
 from typing import Literal
+import time
+import logging
 from datetime import datetime
+import numpy as np
+from trading_system.trigger_book import STOP_KINDS
 
 
 class OrderBookTrade:
+    __slots__ = ("trade_id", "buyer_order_id", "seller_order_id", "quantity", "price", "instrument", "sequence",
+                 "created_ns")
+
     def __init__(self, trade_id: str,
                  buyer_order_id: str,
                  seller_order_id: str,
                  price: float,
                  quantity: int,
-                 instrument: Literal["option", "future", "stock", "swap"]):
+                 instrument: Literal["option", "future", "stock", "swap"],
+                 sequence: int = None,
+                 created_ns: int = None):
         self.trade_id = trade_id
         self.buyer_order_id = buyer_order_id
         self.seller_order_id = seller_order_id
         self.quantity = quantity
         self.price = price
         self.instrument = instrument
-        self.timestamp = datetime.now()
+        self.sequence = sequence
+        self.created_ns = created_ns
+
+    @property
+    def timestamp(self):
+        """
+        Time of the trade, only built when requested
+        """
+        if self.created_ns is None:
+            return None
+        return datetime.fromtimestamp(self.created_ns / 1e9)
+
+    def __setstate__(self, state):
+        """
+        Restores the slots, also from a trade pickled before __slots__ whose state is its __dict__
+        The old datetime timestamp becomes created_ns
+        """
+        if isinstance(state, tuple):
+            state = state[1]
+        else:
+            timestamp = state.pop("timestamp", None)
+            state = dict(sequence=None, created_ns=None, **state)
+
+            if timestamp is not None:
+                state["created_ns"] = int(timestamp.timestamp() * 1e9)
+
+        for name, value in state.items():
+            setattr(self, name, value)
 
 
 class MatchingEngine:
 
-    def __init__(self):
+    def __init__(self, sweep: bool = True):
+        """
+        :param sweep: Fill through a whole price level per iteration instead of one resting order
+        """
         self.previous_trade_occurred = False
+        self.sweep = sweep
+        self.logger = logging.getLogger(__name__)
 
     def process_order(self, order, order_book):
         """
         Matches the order with another order and executes the trade
+        Stop orders rest in the trigger book until the last trade price reaches their stop price
+        Stops triggered by the resulting trades are then matched
+        :return: False if the order was rejected by its post-only or FOK condition
+        """
+        if order.sequence is None:
+            order_book.validate_order(order)
+
+            if order_book.journal is not None:
+                order_book.journal_lsn = order_book.journal.submit(order)
+
+        order_book.prepare_order(order)
+
+        if order.order_kind in STOP_KINDS:
+            if not order_book.stops.is_triggered(order, order_book.trades.last_price):
+                order_book.insert_stop(order)
+                return True
+
+            order_book.stops.activate(order)
+
+        accepted = self.match_order(order=order, order_book=order_book)
+
+        if order_book.stops.order_id_map:
+            self.release_stops(order_book=order_book)
+
+        return accepted
+
+    def modify_order(self, order_id, order_book, new_qty: int = None, new_price: float = None):
+        """
+        Amends a resting order like OrderBook.modify_order, but a new price that crosses the spread
+        is matched like an arriving order and only the remainder rests
+        Post-only orders may not cross
+        :return: The modified order, its quantity is what is left after matching
+        """
+        price_node = order_book.order_id_map.get(order_id)
+
+        if price_node is None or order_id not in price_node.values:
+            raise ValueError(f"ORDER {order_id} NOT FOUND")
+
+        order = price_node.values[order_id]
+        price = None if new_price is None else order_book.to_ticks(new_price, order.side)
+
+        if price is None or price == order.order_price or not order_book.crosses(order.side, price):
+            return order_book.modify_order(order_id, new_qty=new_qty, new_price=new_price)
+
+        if new_qty is not None and new_qty <= 0:
+            raise ValueError("INVALID ORDER QUANTITY")
+
+        if order.post_only:
+            raise ValueError(f"POST ONLY ORDER {order_id} WOULD CROSS THE SPREAD")
+
+        if order_book.journal is not None:
+            order_book.journal_lsn = order_book.journal.modify(order_id, new_qty=new_qty, new_price=new_price)
+
+        # The order leaves the book and comes back as a new arrival at its new price
+        order_book.remove_order(order_id)
+        order.order_price = price
+        order.quantity = order.quantity if new_qty is None else new_qty
+        order.sequence = order_book.next_sequence()
+
+        if order_book.record_time:
+            order.created_ns = time.time_ns()
+
+        self.match_order(order=order, order_book=order_book)
+
+        if order.expire_ns is not None and order_id in order_book.order_id_map:
+            order_book.expiries.schedule(order_id, order.expire_ns)
+
+        if order_book.stops.order_id_map:
+            self.release_stops(order_book=order_book)
+
+        return order
+
+    def match_order(self, order, order_book):
+        """
+        Matches a prepared order against the book and rests any remainder
+        Post-only orders that would trade and FOK orders that cannot fill completely are
+        rejected before the book is touched
+        :return: False if the order was rejected
         """
-        if order.side == "ask":
+        if order.post_only and self.would_cross(order=order, order_book=order_book):
+            self.logger.info(f"REJECTED POST ONLY ORDER {order.order_id}")
+            return False
+
+        if order.time_in_force == "FOK" and self.available_quantity(order, order_book) < order.quantity:
+            self.logger.info(f"REJECTED FOK ORDER {order.order_id}")
+            return False
+
+        if self.sweep:
+            self.sweep_order(order=order, order_book=order_book)
+        elif order.side == "ask":
             self.process_sell_order(order=order, order_book=order_book)
         else:
             self.process_buy_order(order=order, order_book=order_book)
 
+        return True
+
+    def would_cross(self, order, order_book):
+        """
+        Check if an order would trade with the best resting order on arrival
+        """
+        if order.side == "bid":
+            best_ask = order_book.get_best_ask()
+            return best_ask is not None and self.match_possible(buy_order=order, sell_order=best_ask)
+
+        best_bid = order_book.get_best_bid()
+        return best_bid is not None and self.match_possible(buy_order=best_bid, sell_order=order)
+
+    def available_quantity(self, order, order_book):
+        """
+        Quantity an order could fill on arrival, read from the level totals without changing the book
+        Stops counting once the order's quantity is reached
+        """
+        side = order_book.asks if order.side == "bid" else order_book.bids
+        available = 0
+
+        for price, level in side.best_levels():
+            if order.order_kind != "market":
+                if order.side == "bid" and price > order.order_price:
+                    break
+                if order.side == "ask" and price < order.order_price:
+                    break
+
+            available += level.quantity
+
+            if available >= order.quantity:
+                break
+
+        return available
+
+    def rest_order(self, order, order_book):
+        """
+        Adds the unfilled quantity of an order to the book
+        Market, IOC and FOK remainders are cancelled instead, a resting market order would match any price
+        """
+        if order.order_kind == "market" or order.time_in_force == "IOC" or order.time_in_force == "FOK":
+            return
+
+        order_book.insert_order(order)
+
+    def process_orders(self, orders, order_book):
+        """
+        Matches a batch of incoming orders for one order book in arrival order, with the same
+        results as calling process_order for each order
+        The batch is validated before any order is journaled or matched, so an invalid order
+        rejects the whole batch, and is journaled in one group
+        :return: Columns of the trades made by the batch, the quantity filled for each order,
+                 counting stops filled when a later order of the batch triggered them, and
+                 whether each order was accepted or rejected by its post-only or FOK condition
+                 Only trades still held in the book's trade log are returned
+        """
+        orders = list(orders)
+        new_orders = [order for order in orders if order.sequence is None]
+
+        for order in new_orders:
+            order_book.validate_order(order)
+
+        if new_orders and order_book.journal is not None:
+            order_book.journal_lsn = order_book.journal.submit_batch(new_orders)
+
+        first_trade = len(order_book.trades)
+        quantities = np.array([order.quantity for order in orders], dtype=np.int64)
+        accepted = np.ones(len(orders), dtype=bool)
+        prepare_order = order_book.prepare_order
+        match_order = self.match_order
+        stops = order_book.stops
+
+        for i, order in enumerate(orders):
+            prepare_order(order)
+
+            if order.order_kind in STOP_KINDS:
+                if not stops.is_triggered(order, order_book.trades.last_price):
+                    order_book.insert_stop(order)
+                    continue
+
+                stops.activate(order)
+
+            accepted[i] = match_order(order=order, order_book=order_book)
+
+            if stops.order_id_map:
+                self.release_stops(order_book=order_book)
+
+        return {
+            "trades": order_book.trades.last(len(order_book.trades) - first_trade),
+            "filled": quantities - np.array([order.quantity for order in orders], dtype=np.int64),
+            "accepted": accepted
+        }
+
+    def release_stops(self, order_book):
+        """
+        Matches the stops triggered by the last trade price until no more stops trigger
+        Triggered stops enter the book with a new sequence, in trigger book order
+        """
+        while True:
+            triggered = order_book.stops.release(order_book.trades.last_price)
+
+            if not triggered:
+                break
+
+            for order in triggered:
+                order_book.unindex_order(order)
+
+                if order_book.changed_orders is not None:
+                    order_book.changed_orders[order.order_id] = None
+
+                order.sequence = order_book.next_sequence()
+                self.match_order(order=order, order_book=order_book)
+
     def process_buy_order(self, order, order_book):
         """
         Constantly performs trades until all instruments required are bought or
@@ -52,7 +294,7 @@ class MatchingEngine:
                 order_book.trades.append(trade)
 
         if order.quantity > 0:
-            order_book.add_order(order)
+            self.rest_order(order=order, order_book=order_book)
 
     def process_sell_order(self, order, order_book):
         """
@@ -74,7 +316,81 @@ class MatchingEngine:
                 order_book.trades.append(trade)
 
         if order.quantity > 0:
-            order_book.add_order(order)
+            self.rest_order(order=order, order_book=order_book)
+
+    def sweep_order(self, order, order_book):
+        """
+        Fills an order against the best price level until the level is exhausted, then moves
+        to the next level. Filled resting orders are removed from each level in one batch.
+        Produces the same trades as matching one resting order at a time.
+        """
+        if order.side == "bid":
+            side = order_book.asks
+        else:
+            side = order_book.bids
+
+        is_buy = order.side == "bid"
+        trades = order_book.trades
+        order_id_map = order_book.order_id_map
+
+        for price, level in side.best_levels():
+            if order.quantity == 0:
+                break
+
+            filled_order_ids = []
+            level_quantity = 0
+            blocked = True
+
+            for resting_order in level.values.values():
+                if is_buy:
+                    buy_order, sell_order = order, resting_order
+                else:
+                    buy_order, sell_order = resting_order, order
+
+                if not self.match_possible(buy_order=buy_order, sell_order=sell_order):
+                    break
+
+                trade_quantity = min(order.quantity, resting_order.quantity)
+                trade_price = self.get_trade_price(buy_order=buy_order, sell_order=sell_order)
+
+                order.quantity -= trade_quantity
+                resting_order.quantity -= trade_quantity
+                level_quantity += trade_quantity
+
+                trades.record(buyer_order_id=buy_order.order_id,
+                              seller_order_id=sell_order.order_id,
+                              price=trade_price,
+                              quantity=trade_quantity,
+                              sequence=order_book.next_sequence(),
+                              created_ns=time.time_ns() if order_book.record_time else None)
+
+                if resting_order.quantity == 0:
+                    filled_order_ids.append(resting_order.order_id)
+
+                if order.quantity == 0:
+                    break
+            else:
+                # Every resting order at the level was filled, move to the next level
+                blocked = False
+
+            # Batch remove filled resting orders from the level
+            for order_id in filled_order_ids:
+                filled_order = level.values.pop(order_id)
+                if filled_order.expire_ns is not None:
+                    order_book.expiries.cancel(order_id)
+                order_book.unindex_order(filled_order)
+                del order_id_map[order_id]
+
+            if not level.values:
+                side.remove_node(level)
+            elif level_quantity:
+                side.adjust_quantity(level, -level_quantity)
+
+            if blocked:
+                break
+
+        if order.quantity > 0:
+            self.rest_order(order=order, order_book=order_book)
 
     def match_possible(self, buy_order=None, sell_order=None):
         """
@@ -84,7 +400,7 @@ class MatchingEngine:
         if sell_order is None or buy_order is None:
             raise ValueError("BUY OR SELL ORDER NOT SPECIFIED")
 
-        if sell_order.order_kind == "market" or buy_order == "market":
+        if sell_order.order_kind == "market" or buy_order.order_kind == "market":
             return True
 
         return buy_order.order_price >= sell_order.order_price
@@ -102,20 +418,21 @@ class MatchingEngine:
 
         trade_price = self.get_trade_price(buy_order=buy_order, sell_order=sell_order)
 
-        buy_order.quantity -= trade_quantity
-        sell_order.quantity -= trade_quantity
-
-        if buy_order.quantity == 0 and buy_order.order_id in order_book.order_id_map:
-            order_book.cancel_order(order_id=buy_order.order_id)
-        if sell_order.quantity == 0 and sell_order.order_id in order_book.order_id_map:
-            order_book.cancel_order(order_id=sell_order.order_id)
+        # Resting orders are filled through the book so level quantities stay correct
+        for order in (buy_order, sell_order):
+            if order.order_id in order_book.order_id_map:
+                order_book.fill_order(order=order, quantity=trade_quantity)
+            else:
+                order.quantity -= trade_quantity
 
         trade = OrderBookTrade(trade_id=str(len(order_book.trades)),
                                buyer_order_id=buy_order.order_id,
                                seller_order_id=sell_order.order_id,
                                price=trade_price,
                                quantity=trade_quantity,
-                               instrument="stock")
+                               instrument="stock",
+                               sequence=order_book.next_sequence(),
+                               created_ns=time.time_ns() if order_book.record_time else None)
 
         return trade
 
@@ -128,7 +445,8 @@ class MatchingEngine:
         if sell_order.order_kind == "market":
             return buy_order.order_price
 
-        if buy_order.timestamp > sell_order.timestamp:
+        # The order that arrived first sets the price
+        if buy_order.sequence > sell_order.sequence:
             return sell_order.order_price
         else:
             return buy_order.order_price
@@ -1,25 +1,56 @@
+import math
+import time
 from datetime import datetime
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+from operator import attrgetter
 from typing import Literal
+import numpy as np
 from trading_system.red_black_tree import RedBlackTree, EmptyBookError
+from trading_system.price_ladder import PriceLadder
+from trading_system.trade_log import TradeLog
+from trading_system.trigger_book import TriggerBook, STOP_KINDS
+from trading_system.timer_wheel import TimerWheel
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 ORDER_BOOK_DIR = BASE_DIR / "order_books"
+TIME_IN_FORCE = ("GTC", "IOC", "FOK", "GTD", "DAY")
+EXPIRING = ("GTD", "DAY")
+TICK_TOLERANCE = 1e-6  # Distance in ticks from the grid taken as float error rather than an off tick price
 
 
 class Order:
+    __slots__ = ("order_id", "order_price", "quantity", "sequence", "created_ns", "ticker", "portfolio_id", "side",
+                 "order_kind", "stop_price", "time_in_force", "post_only", "expire_ns")
+
     def __init__(self, order_id: str,
                  portfolio_id: str,
                  side: Literal["ask", "bid"],
-                 order_kind: Literal["market", "limit"],
+                 order_kind: Literal["market", "limit", "stop", "stop_limit"],
                  order_price: float,
                  quantity: int,
-                 ticker: str):
+                 ticker: str,
+                 stop_price: float = None,
+                 time_in_force: Literal["GTC", "IOC", "FOK", "GTD", "DAY"] = "GTC",
+                 post_only: bool = False,
+                 expire_ns: int = None):
+        """
+        :param order_price: Limit price. For a stop-limit order, the limit price used once triggered
+        :param stop_price: Last trade price that triggers a stop or stop-limit order
+        :param time_in_force: GTC rests until filled or cancelled, IOC cancels whatever does not fill
+                              on arrival, FOK fills completely on arrival or not at all,
+                              GTD rests until expire_ns and DAY until the book's session close
+        :param post_only: Reject the order instead of matching if it would trade on arrival
+        :param expire_ns: Expiry time of a GTD order in nanoseconds since the epoch
+        """
 
         self.order_id = order_id
         self.order_price = order_price
         self.quantity = quantity
-        self.timestamp = datetime.now()
+        self.sequence = None  # Arrival sequence assigned by the order book
+        self.created_ns = None  # Arrival time in nanoseconds since the epoch, assigned by the order book
         self.ticker = ticker
         self.portfolio_id = portfolio_id
 
@@ -28,52 +59,594 @@ class Order:
         else:
             self.side = side
 
-        if order_kind != "market" and order_kind != "limit":
+        if order_kind != "market" and order_kind != "limit" and order_kind not in STOP_KINDS:
             raise ValueError("INVALID ORDER KIND")
         else:
             self.order_kind = order_kind
 
+        if order_kind in STOP_KINDS and stop_price is None:
+            raise ValueError("STOP ORDER REQUIRES A STOP PRICE")
+
+        self.stop_price = stop_price
+
+        if time_in_force not in TIME_IN_FORCE:
+            raise ValueError("INVALID TIME IN FORCE")
+
+        if time_in_force == "GTD" and expire_ns is None:
+            raise ValueError("GTD ORDER REQUIRES AN EXPIRY TIME")
+
+        self.time_in_force = time_in_force
+        self.post_only = post_only
+        self.expire_ns = expire_ns
+
+    @property
+    def timestamp(self):
+        """
+        Arrival time of the order, only built when requested
+        """
+        if self.created_ns is None:
+            return None
+        return datetime.fromtimestamp(self.created_ns / 1e9)
+
+    def __setstate__(self, state):
+        """
+        Restores the slots, also from an order pickled before __slots__ whose state is its __dict__
+        The old datetime timestamp becomes created_ns and the fields added since take their defaults
+        """
+        if isinstance(state, tuple):
+            state = state[1]
+        else:
+            timestamp = state.pop("timestamp", None)
+            state = dict(sequence=None, created_ns=None, stop_price=None, time_in_force="GTC", post_only=False,
+                         expire_ns=None, **state)
+
+            if timestamp is not None:
+                state["created_ns"] = int(timestamp.timestamp() * 1e9)
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
 class OrderBook:
-    def __init__(self, ticker: str):
+    def __init__(self, ticker: str,
+                 tick_size: float = None,
+                 backend: Literal["tree", "ladder"] = "tree",
+                 record_time: bool = True,
+                 trade_capacity: int = 100000,
+                 trade_spill_dir: str = None,
+                 session_close_ns: int = None):
+        """
+        :param tick_size: Optional minimum price increment. When set, order prices inside the
+                          book are integer ticks and only converted back to prices at the edge
+        :param backend: "tree" stores each side in a RedBlackTree, "ladder" in a tick indexed
+                        PriceLadder. The ladder needs a tick size.
+        :param record_time: Stamp orders and trades with time.time_ns() as they enter the book
+        :param trade_capacity: Number of recent trades kept in the trade log
+        :param trade_spill_dir: Optional directory older trades are written to instead of being dropped
+        :param session_close_ns: Time DAY orders expire at, in nanoseconds since the epoch
+        """
+        if tick_size is not None and tick_size <= 0:
+            raise ValueError("INVALID TICK SIZE")
+
+        if backend == "tree":
+            self.asks = RedBlackTree(type="asks")
+            self.bids = RedBlackTree(type="bids")
+        elif backend == "ladder":
+            if tick_size is None:
+                raise ValueError("LADDER BACKEND REQUIRES A TICK SIZE")
+            self.asks = PriceLadder(type="asks")
+            self.bids = PriceLadder(type="bids")
+        else:
+            raise ValueError("INVALID ORDER BOOK BACKEND")
+
         self.ticker = ticker
-        self.asks = RedBlackTree(type="asks")
-        self.bids = RedBlackTree(type="bids")
+        self.tick_size = tick_size
+        self.price_decimals = max(0, -Decimal(str(tick_size)).as_tuple().exponent) if tick_size else None
+        self.backend = backend
+        self.record_time = record_time
+        self.sequence = 0  # Last sequence number given to an order or trade
+        self.mutations = 0  # Changes that take no sequence number: cancels, expiries and modifies
+        self.changed_orders = None  # {order_id: None} added, removed or modified since the last incremental save
         self.order_id_map = {}  # order_id: price_node
-        self.trades = []
+        self.portfolio_orders = defaultdict(dict)  # portfolio_id: {order_id: None} of resting and stop orders
+        self.stops = TriggerBook()  # Untriggered stop and stop-limit orders
+        self.session_close_ns = session_close_ns
+        self.expiries = TimerWheel()  # Expiry timers of GTD and DAY orders keyed by order_id
+        self.journal = None  # Optional Journal that arriving orders, cancels and modifies are written to
+        self.journal_lsn = 0  # lsn of the last journal record reflected in the book
+        self.trades = TradeLog(capacity=trade_capacity,
+                               price_dtype=np.int64 if tick_size else np.float64,
+                               spill_dir=trade_spill_dir,
+                               name=f"{ticker}_trades")
+
+    def __getstate__(self):
+        """
+        The journal is not pickled, journal_lsn records how far the pickled book got
+        """
+        state = self.__dict__.copy()
+        state["journal"] = None
+        state["changed_orders"] = None
+        return state
+
+    def __setstate__(self, state):
+        """
+        Books pickled before sequence numbers existed only hold ticker, asks, bids, order_id_map
+        and a list of trades. They are rebuilt as a new book: trades are recorded first, then the
+        resting orders are inserted in arrival order, each taking the next sequence
+        """
+        if "sequence" in state:
+            self.__dict__.update(state)
+            return
+
+        self.__init__(ticker=state["ticker"])
+
+        for trade in state["trades"]:
+            self.trades.record(buyer_order_id=trade.buyer_order_id,
+                               seller_order_id=trade.seller_order_id,
+                               price=trade.price,
+                               quantity=trade.quantity,
+                               sequence=self.next_sequence(),
+                               created_ns=trade.created_ns)
+
+        orders = [price_node.values[order_id] for order_id, price_node in state["order_id_map"].items()
+                  if order_id in price_node.values]
+
+        for order in sorted(orders, key=lambda order: order.created_ns or 0):
+            order.sequence = self.next_sequence()
+            self.insert_order(order)
+
+    def track_changes(self):
+        """
+        Starts recording the ids of orders that are added, removed or modified
+        Filled orders are not recorded, the trades name them
+        """
+        self.changed_orders = {}
+
+    @property
+    def version(self):
+        """
+        Grows with every change to the book, used to tell if the book changed since it was saved
+        """
+        return self.sequence + self.mutations
+
+    def attach_journal(self, journal):
+        """
+        Writes arriving orders, cancels, modifies and trades to a journal
+        Every record already in the journal is taken as reflected in the book
+        """
+        self.journal = journal
+        self.trades.journal = journal
+        self.journal_lsn = journal.count
+
+    def detach_journal(self):
+        self.journal = None
+        self.trades.journal = None
+
+    def to_ticks(self, price, side: Literal["bid", "ask"] = None):
+        """
+        Convert a price to integer ticks
+        Prices off the tick grid are rounded down for a bid and up for an ask, so an order is
+        never given a worse price than its limit. Without a side they are rounded to the nearest tick
+        Returns the price unchanged if the book has no tick size
+        """
+        if self.tick_size is None or price is None:
+            return price
+
+        ticks = price / self.tick_size
+        nearest = round(ticks)
+
+        if side is None or abs(ticks - nearest) <= TICK_TOLERANCE:
+            return int(nearest)
+
+        return math.floor(ticks) if side == "bid" else math.ceil(ticks)
+
+    def from_ticks(self, ticks):
+        """
+        Convert integer ticks back to a price
+        Returns the value unchanged if the book has no tick size
+        """
+        if self.tick_size is None or ticks is None:
+            return ticks
+
+        return round(ticks * self.tick_size, self.price_decimals)
+
+    def to_stop_ticks(self, order):
+        """
+        Convert the stop price of an order to integer ticks
+        Off tick stop prices are rounded away from the market so the stop never triggers early
+        """
+        return self.to_ticks(order.stop_price, "ask" if order.side == "bid" else "bid")
+
+    def next_sequence(self):
+        """
+        Returns the next arrival sequence number of the book
+        """
+        self.sequence += 1
+        return self.sequence
+
+    def validate_order(self, order):
+        """
+        Raises if the book cannot take an incoming order
+        Called before the order is journaled, so a rejected order leaves no journal record
+        """
+        if order.time_in_force == "DAY" and self.session_close_ns is None:
+            raise ValueError("DAY ORDER REQUIRES A SESSION CLOSE")
+
+    def prepare_order(self, order):
+        """
+        Prepares an incoming order for the book
+        Assigns the arrival sequence and converts the order price to ticks
+        Orders that already have a sequence are left unchanged
+        """
+        if order.sequence is not None:
+            return
+
+        self.sequence += 1
+        order.sequence = self.sequence
+        order.order_price = self.to_ticks(order.order_price, order.side)
+        order.stop_price = self.to_stop_ticks(order)
+
+        if self.record_time:
+            order.created_ns = time.time_ns()
+
+        if order.time_in_force in EXPIRING:
+            self.schedule_expiry(order)
+
+    def schedule_expiry(self, order):
+        """
+        Schedules the expiry of a GTD or DAY order
+        DAY orders expire at the session close
+        """
+        if order.time_in_force == "DAY":
+            if self.session_close_ns is None:
+                raise ValueError("DAY ORDER REQUIRES A SESSION CLOSE")
+            order.expire_ns = self.session_close_ns
+
+        self.expiries.schedule(order.order_id, order.expire_ns)
+
+    def expire_orders(self, now_ns: int = None):
+        """
+        Cancels every GTD and DAY order that has expired by a given time
+        Only the due timer wheel slots are visited, orders that already left the book are skipped
+        :param now_ns: Time in nanoseconds since the epoch, defaults to now
+        :return: The ids of the expired orders
+        """
+        expired = [order_id for order_id in self.expiries.advance(time.time_ns() if now_ns is None else now_ns)
+                   if order_id in self.order_id_map or order_id in self.stops.order_id_map]
+
+        self.cancel_orders(expired)
+
+        return expired
 
     def add_order(self, order):
         """
-        Adds order to either bids or asks
-        Adds order to order_id_map
+        Prepares an incoming order then adds it to the book
+        Stop orders are added to the trigger book
         :param order
         :return:
         """
+        if order.sequence is None:
+            self.validate_order(order)
+
+            if self.journal is not None:
+                self.journal_lsn = self.journal.add(order)
+
+        self.prepare_order(order)
+
+        if order.order_kind in STOP_KINDS:
+            self.insert_stop(order)
+        else:
+            self.insert_order(order)
+
+    def add_orders(self, orders):
+        """
+        Prepares and adds many orders at once
+        Orders are grouped by side and price so each price node is found once,
+        then each node and order_id_map are filled in a single update
+        Orders keep their arrival order within a price node and share one arrival time
+        Nothing is added if any new order is rejected by validate_order
+        """
+        orders = list(orders)
+
+        for order in orders:
+            if order.sequence is None:
+                self.validate_order(order)
+
+        levels = defaultdict(dict)  # (side, price): {order_id: Order}
+        portfolio_orders = self.portfolio_orders
+        changed_orders = self.changed_orders
+        sequence = self.sequence
+        tick_size = self.tick_size
+        created_ns = time.time_ns() if self.record_time else None
+
+        # Same as prepare_order, inlined for speed
+        for order in orders:
+            if order.sequence is None:
+                if self.journal is not None:
+                    self.journal_lsn = self.journal.add(order)
+
+                sequence += 1
+                order.sequence = sequence
+                order.created_ns = created_ns
+
+                if tick_size is not None and order.order_price is not None:
+                    ticks = order.order_price / tick_size
+                    price = round(ticks)
+
+                    if abs(ticks - price) > TICK_TOLERANCE:
+                        price = math.floor(ticks) if order.side == "bid" else math.ceil(ticks)
+
+                    order.order_price = int(price)
+
+                if order.stop_price is not None:
+                    order.stop_price = self.to_stop_ticks(order)
+
+                if order.time_in_force in EXPIRING:
+                    self.schedule_expiry(order)
+
+            if order.order_kind in STOP_KINDS:
+                self.insert_stop(order)
+                continue
+
+            levels[(order.side, order.order_price)][order.order_id] = order
+            portfolio_orders[order.portfolio_id][order.order_id] = None
+
+            if changed_orders is not None:
+                changed_orders[order.order_id] = None
+
+        self.sequence = sequence
+
+        for (side_name, price), batch in levels.items():
+            side = self.asks if side_name == "ask" else self.bids
+            price_node = side.add_price(price)
+
+            if price_node.values:
+                price_node.values.update(batch)
+            else:
+                price_node.values = batch
+
+            side.adjust_quantity(price_node, sum(map(attrgetter("quantity"), batch.values())))
+            self.order_id_map.update(dict.fromkeys(batch, price_node))
+
+    def insert_order(self, order):
+        """
+        Adds an already prepared order to either bids or asks
+        Adds order to order_id_map and portfolio_orders
+        """
+        self.portfolio_orders[order.portfolio_id][order.order_id] = None
+
+        if self.changed_orders is not None:
+            self.changed_orders[order.order_id] = None
+
         if order.side == "ask":
             price_node = self.asks.add_price(order.order_price)  # Add new price node
             price_node.values[order.order_id] = order
+            self.asks.adjust_quantity(price_node, order.quantity)
             self.order_id_map[order.order_id] = price_node
 
         elif order.side == "bid":
             price_node = self.bids.add_price(order.order_price)  # Add new price node
             price_node.values[order.order_id] = order
+            self.bids.adjust_quantity(price_node, order.quantity)
             self.order_id_map[order.order_id] = price_node
 
+    def insert_stop(self, order):
+        """
+        Adds an already prepared stop order to the trigger book
+        """
+        self.stops.add_order(order)
+        self.portfolio_orders[order.portfolio_id][order.order_id] = None
+
+        if self.changed_orders is not None:
+            self.changed_orders[order.order_id] = None
+
+    def unindex_order(self, order):
+        """
+        Removes an order that left the book or the trigger book from portfolio_orders
+        """
+        orders = self.portfolio_orders.get(order.portfolio_id)
+
+        if orders is not None:
+            orders.pop(order.order_id, None)
+
+            if not orders:
+                del self.portfolio_orders[order.portfolio_id]
+
     def cancel_order(self, order_id):
+        """
+        Cancels an order in the book or the trigger book
+        """
+        if self.journal is not None and (order_id in self.order_id_map or order_id in self.stops.order_id_map):
+            self.journal_lsn = self.journal.cancel(order_id)
+
+        self.remove_order(order_id)
+
+    def remove_order(self, order_id):
         """
         Deletes order from bids or asks
         Deletes order from order_id_map
+        Deletes the price node if it has no orders left
+        Raises before changing anything if the order is not found
         """
         price_node = self.order_id_map.get(order_id)
+        is_stop = price_node is None and order_id in self.stops.order_id_map
 
-        if price_node is None:
+        if not is_stop and (price_node is None or order_id not in price_node.values):
             raise ValueError(f"ORDER {order_id} NOT FOUND")
 
-        if order_id not in price_node.values:
+        self.mutations += 1
+
+        if self.changed_orders is not None:
+            self.changed_orders[order_id] = None
+
+        if is_stop:
+            self.unindex_order(self.stops.cancel_order(order_id))
+            self.expiries.cancel(order_id)
+            return
+
+        order = price_node.values.pop(order_id)
+        del self.order_id_map[order_id]
+
+        if order.expire_ns is not None:
+            self.expiries.cancel(order_id)
+
+        self.unindex_order(order)
+        side = self.asks if order.side == "ask" else self.bids
+
+        # Remove the price level once its last order leaves
+        if not price_node.values:
+            side.remove_node(price_node)
+        else:
+            side.adjust_quantity(price_node, -order.quantity)
+
+    def cancel_orders(self, order_ids):
+        """
+        Deletes many orders at once
+        Each price node is updated once and removed if it has no orders left
+        Nothing is deleted if any order is not found, repeated ids are cancelled once
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+        order_id_map = self.order_id_map
+        stop_map = self.stops.order_id_map
+
+        for order_id in order_ids:
+            if order_id not in order_id_map and order_id not in stop_map:
+                raise ValueError(f"ORDER {order_id} NOT FOUND")
+
+        if self.journal is not None:
+            for order_id in order_ids:
+                self.journal_lsn = self.journal.cancel(order_id)
+
+        if self.changed_orders is not None:
+            self.changed_orders.update(dict.fromkeys(order_ids))
+
+        self.mutations += 1
+
+        timer_map = self.expiries.timer_map
+        removed = {}  # price_node: [side, quantity]
+
+        for order_id in order_ids:
+            price_node = order_id_map.pop(order_id, None)
+
+            if price_node is None:
+                self.unindex_order(self.stops.cancel_order(order_id))
+                self.expiries.cancel(order_id)
+                continue
+
+            order = price_node.values.pop(order_id)
+
+            if order_id in timer_map:
+                self.expiries.cancel(order_id)
+
+            self.unindex_order(order)
+
+            entry = removed.get(price_node)
+
+            if entry is None:
+                removed[price_node] = [self.asks if order.side == "ask" else self.bids, order.quantity]
+            else:
+                entry[1] += order.quantity
+
+        for price_node, (side, quantity) in removed.items():
+            if not price_node.values:
+                side.remove_node(price_node)
+            else:
+                side.adjust_quantity(price_node, -quantity)
+
+    def cancel_portfolio_orders(self, portfolio_id: str):
+        """
+        Deletes every resting and stop order of a portfolio using portfolio_orders
+        :return: The ids of the cancelled orders
+        """
+        order_ids = list(self.portfolio_orders.get(portfolio_id, ()))
+        self.cancel_orders(order_ids)
+        return order_ids
+
+    def modify_order(self, order_id, new_qty: int = None, new_price: float = None):
+        """
+        Amends a resting order in place
+        Reducing the quantity keeps the order's place in the queue
+        Increasing the quantity moves the order to the back of its price node
+        Changing the price moves the order to the back of the new price node
+        A price that crosses the spread is rejected, MatchingEngine.modify_order matches it instead
+        :return: The modified order
+        """
+        price_node = self.order_id_map.get(order_id)
+
+        if price_node is None or order_id not in price_node.values:
             raise ValueError(f"ORDER {order_id} NOT FOUND")
+
+        if new_qty is not None and new_qty <= 0:
+            raise ValueError("INVALID ORDER QUANTITY")
+
+        order = price_node.values[order_id]
+        side = self.asks if order.side == "ask" else self.bids
+        price = order.order_price if new_price is None else self.to_ticks(new_price, order.side)
+
+        if price != order.order_price and self.crosses(order.side, price):
+            raise ValueError(f"ORDER {order_id} PRICE CROSSES THE SPREAD")
+
+        if self.journal is not None:
+            self.journal_lsn = self.journal.modify(order_id, new_qty=new_qty, new_price=new_price)
+
+        if self.changed_orders is not None:
+            self.changed_orders[order_id] = None
+
+        self.mutations += 1
+
+        new_qty = order.quantity if new_qty is None else new_qty
+        new_price = price
+
+        if new_price == order.order_price and new_qty <= order.quantity:
+            side.adjust_quantity(price_node, new_qty - order.quantity)
+            order.quantity = new_qty
+            return order
+
+        # Order loses priority so it is moved to the back of its new price node
+        del price_node.values[order_id]
+
+        if not price_node.values:
+            side.remove_node(price_node)
         else:
-            del price_node.values[order_id]
-            del self.order_id_map[order_id]
+            side.adjust_quantity(price_node, -order.quantity)
+
+        order.order_price = new_price
+        order.quantity = new_qty
+        order.sequence = self.next_sequence()
+
+        if self.record_time:
+            order.created_ns = time.time_ns()
+
+        price_node = side.add_price(new_price)
+        price_node.values[order_id] = order
+        side.adjust_quantity(price_node, new_qty)
+        self.order_id_map[order_id] = price_node
+
+        return order
+
+    def crosses(self, side: Literal["bid", "ask"], price):
+        """
+        Check if a limit price in ticks would trade with the best resting order of the other side
+        """
+        if side == "bid":
+            best_ask = self.get_best_ask()
+            return best_ask is not None and price >= best_ask.order_price
+
+        best_bid = self.get_best_bid()
+        return best_bid is not None and price <= best_bid.order_price
+
+    def fill_order(self, order, quantity):
+        """
+        Reduces the quantity of a resting order after a trade
+        Deletes the order from the book once it is completely filled
+        """
+        price_node = self.order_id_map[order.order_id]
+        side = self.asks if order.side == "ask" else self.bids
+        side.adjust_quantity(price_node, -quantity)
+        order.quantity -= quantity
+
+        if order.quantity == 0:
+            self.remove_order(order_id=order.order_id)
 
     def get_best_bid(self):
         """
@@ -94,6 +667,81 @@ class OrderBook:
         except EmptyBookError:
             return None
 
+    def get_depth(self, levels: int = 10):
+        """
+        Get the aggregate quantity and order count of the best price levels on each side
+        """
+        depth = {"bids": [], "asks": []}
+
+        for name, side in (("bids", self.bids), ("asks", self.asks)):
+            for price, price_node in islice(side.best_levels(), levels):
+                depth[name].append({"price": self.from_ticks(price),
+                                    "quantity": price_node.quantity,
+                                    "orders": len(price_node.values)})
+
+        return depth
+
+    def estimate_fill(self, side: Literal["bid", "ask"], quantity: int, limit_price: float = None):
+        """
+        Estimate the fill of an incoming order without changing the book
+        Walks the opposite side from the best price using the level totals, O(levels touched)
+        :param side: Side of the incoming order, a bid fills against the asks
+        :param limit_price: Only count levels at or better than this price
+        :return: Fillable quantity, VWAP, best and worst price filled and the slippage of the
+                 VWAP from the best price. Prices are None if nothing can fill
+        """
+        if side != "ask" and side != "bid":
+            raise ValueError("INVALID ORDER TYPE")
+
+        if quantity <= 0:
+            raise ValueError("INVALID ORDER QUANTITY")
+
+        opposite = self.asks if side == "bid" else self.bids
+        limit = self.to_ticks(limit_price, side)
+        filled = 0
+        notional = 0
+        best_price = None
+        worst_price = None
+        levels = 0
+
+        for price, price_node in opposite.best_levels():
+            if limit is not None and (price > limit if side == "bid" else price < limit):
+                break
+
+            take = min(price_node.quantity, quantity - filled)
+            filled += take
+            notional += price * take
+            worst_price = price
+            levels += 1
+
+            if best_price is None:
+                best_price = price
+
+            if filled == quantity:
+                break
+
+        vwap = None
+        slippage = None
+
+        if filled:
+            vwap = notional / filled
+            slippage = abs(vwap - best_price)
+
+            if self.tick_size is not None:
+                vwap *= self.tick_size
+                slippage *= self.tick_size
+
+        return {
+            "side": side,
+            "quantity": quantity,
+            "fillable_quantity": filled,
+            "vwap": vwap,
+            "best_price": self.from_ticks(best_price),
+            "worst_price": self.from_ticks(worst_price),
+            "slippage": slippage,
+            "levels": levels
+        }
+
     def get_spread(self):
         """
         Get the spread
@@ -104,4 +752,4 @@ class OrderBook:
         if best_bid is None or best_ask is None:
             return None
 
-        return best_ask.order_price - best_bid.order_price
+        return self.from_ticks(best_ask.order_price - best_bid.order_price)
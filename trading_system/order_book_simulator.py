@@ -17,6 +17,7 @@ class OrderGenerator:
         quantity_range: The range of quantities per order
         """
         base_price, spread = self.fetcher.get_data()
+        orders = []
 
         for i in range(batch_size):
             bid_order = Order(ticker=ticker,
@@ -28,7 +29,7 @@ class OrderGenerator:
                               order_price=base_price - np.random.uniform(0, spread / 2)
                               )
 
-            self.order_book.add_order(order=bid_order)
+            orders.append(bid_order)
 
         for i in range(batch_size):
             ask_order = Order(ticker=ticker,
@@ -40,7 +41,9 @@ class OrderGenerator:
                               order_price=base_price + np.random.uniform(0, spread / 2)
                               )
 
-            self.order_book.add_order(order=ask_order)
+            orders.append(ask_order)
+
+        self.order_book.add_orders(orders=orders)
 
 
 class OrderBookSimulator:
@@ -124,8 +127,8 @@ class OrderBookSimulator:
             spread = self.order_book.get_spread()
 
             print({"ticker": self.ticker,
-                   "best_ask": best_ask.order_price,
-                   "best_bid": best_bid.order_price,
+                   "best_ask": self.order_book.from_ticks(best_ask.order_price),
+                   "best_bid": self.order_book.from_ticks(best_bid.order_price),
                    "spread": spread})
 
         except Exception as e:
@@ -5,6 +5,8 @@ import logging
 
 
 class Position:
+    __slots__ = ("ticker", "position_type", "entry_price", "quantity", "take_profit")
+
     def __init__(self,
                  ticker: str,
                  position_type: Literal["short", "long"],
@@ -17,8 +19,20 @@ class Position:
         self.quantity = quantity
         self.take_profit = take_profit
 
+    def __setstate__(self, state):
+        """
+        Restores the slots, also from a position pickled before __slots__ whose state is its __dict__
+        """
+        if isinstance(state, tuple):
+            state = state[1]
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
 class PositionRequest:
+    __slots__ = ("trade_id", "ticker", "side", "quantity", "price", "timestamp", "commission", "close_open")
+
     def __init__(self,
                  trade_id: str,
                  ticker: str,
@@ -38,11 +52,22 @@ class PositionRequest:
         self.commission = commission
         self.close_open = close_open
 
+    def __setstate__(self, state):
+        """
+        Restores the slots, also from a request pickled before __slots__ whose state is its __dict__
+        """
+        if isinstance(state, tuple):
+            state = state[1]
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
 class Portfolio:
 
     def __init__(self, portfolio_id):
         self.portfolio_id = portfolio_id
+        self.version = 0  # Incremented on every change, used to tell if the portfolio changed since it was saved
         self.cash = 0
         self.commission_rate = 0.001
         self.positions = {}  # ticker : Position
@@ -51,6 +76,13 @@ class Portfolio:
         self.trade_requests = deque([])  # Stores positions needed to be fulfilled by trading system
         self.logger = logging.getLogger(__name__)
 
+    def __setstate__(self, state):
+        """
+        Portfolios pickled before versions existed start at version 0
+        """
+        self.__dict__.update(state)
+        self.__dict__.setdefault("version", 0)
+
     @property
     def buying_power(self):
         return max(0, self.cash)
@@ -93,6 +125,7 @@ class Portfolio:
             commission=commission
         )
         self.position_trade_history.append(request)
+        self.version += 1
 
         return request
 
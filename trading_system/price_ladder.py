@@ -0,0 +1,397 @@
+import heapq
+from operator import itemgetter
+import numpy as np
+from trading_system.red_black_tree import RedBlackTree, EmptyBookError
+
+
+class PriceLevel:
+    __slots__ = ("price", "values", "quantity")
+
+    def __init__(self, price):
+        """
+        :param price: The price of the level in integer ticks
+        values: dict storing Order objects in insertion order in the form "order_id" : Order
+        quantity: Total quantity resting at the level
+        """
+        self.price = price
+        self.values = {}
+        self.quantity = 0
+
+
+class PriceLadder:
+    def __init__(self, type, size: int = 1024, max_size: int = 1 << 18):
+        """
+        Tick indexed book side. Prices must be integer ticks.
+        :param type: "bids" or "asks"
+        :param size: Number of ticks the ladder covers before it has to recenter
+        :param max_size: Number of ticks the ladder may grow to. Levels that do not fit in the
+                         window are kept in the overflow tree instead
+        sizes: Aggregate quantity at each tick, used to find the next best level
+        levels: PriceLevel at each tick or None
+        """
+        self.type = type
+        self.size = size
+        self.max_size = max_size
+        self.base = None  # Tick price at index 0
+        self.sizes = np.zeros(size, dtype=np.int64)
+        self.levels = [None] * size
+        self.best_index = None
+        self.low_index = None  # Lowest occupied index, may be loose after removals until recenter
+        self.high_index = None  # Highest occupied index, may be loose after removals until recenter
+        self.node_count = 0  # Levels in the window and the overflow tree
+        self.overflow = RedBlackTree(type=type)  # Levels outside the window, usually far from the market
+
+    @property
+    def best_node(self):
+        level = None if self.best_index is None else self.levels[self.best_index]
+
+        if self.overflow.root is None:
+            return level
+
+        overflow_node = self.overflow.get_best_node()
+
+        if level is None or (overflow_node is not None and self.is_better(overflow_node.price, level.price)):
+            return overflow_node
+
+        return level
+
+    def in_window(self, level):
+        """
+        Check if a level is stored in the window rather than the overflow tree
+        """
+        index = level.price - self.base
+        return 0 <= index < self.size and self.levels[index] is level
+
+    def add_price(self, price):
+        """
+        Adds a price level to the ladder
+        Recenters the ladder if the price is outside the current window,
+        or adds the level to the overflow tree if the window cannot grow to cover it
+        """
+        if self.base is None:
+            self.base = price - self.size // 2
+
+        index = price - self.base
+
+        if index < 0 or index >= self.size:
+            if not self.recenter(price):
+                count = self.overflow.node_count
+                level = self.overflow.add_price(price)
+                self.node_count += self.overflow.node_count - count
+                return level
+
+            index = price - self.base
+
+        level = self.levels[index]
+
+        if level is None:
+            level = PriceLevel(price=price)
+            self.levels[index] = level
+            self.node_count += 1
+            self.widen_bounds(index)
+
+        if self.best_index is None or self.is_better(index, self.best_index):
+            self.best_index = index
+
+        return level
+
+    def remove_node(self, level):
+        """
+        Removes a price level from the ladder
+        Moves the best index to the next level with quantity if the best level was removed
+        """
+        if not self.in_window(level):
+            self.overflow.remove_node(level)
+            self.node_count -= 1
+            return
+
+        index = level.price - self.base
+        self.levels[index] = None
+        self.sizes[index] = 0
+        self.node_count -= 1
+
+        if index == self.best_index:
+            self.best_index = self.find_best_index(index)
+
+    def remove_price(self, price):
+        """
+        Removes the price level of a given price if it exists
+        """
+        level = self.search_price(price)
+
+        if level is not None:
+            self.remove_node(level)
+
+        return level
+
+    def adjust_quantity(self, level, quantity):
+        """
+        Adds quantity to the aggregate size of a level
+        """
+        level.quantity += quantity
+
+        if self.overflow.root is None or self.in_window(level):
+            self.sizes[level.price - self.base] = level.quantity
+
+    def search_price(self, price):
+        """
+        Search for a price level of a given price
+        """
+        if self.base is None:
+            return None
+
+        index = price - self.base
+
+        if index < 0 or index >= self.size:
+            return self.overflow.search_price(price)
+
+        return self.levels[index]
+
+    def is_better(self, index, other_index):
+        """
+        Check if a ladder index or price is a better price than another for this side of the book
+        """
+        if self.type == "bids":
+            return index > other_index
+        return index < other_index
+
+    def merge_levels(self, levels, overflow_levels, descending):
+        """
+        Merges the levels of the window and the overflow tree into one walk in price order
+        """
+        return heapq.merge(levels, overflow_levels, key=itemgetter(0), reverse=descending)
+
+    def find_best_index(self, start=None):
+        """
+        Find the index of the best level with quantity, searching from start towards worse prices
+        """
+        if self.type == "bids":
+            filled = np.flatnonzero(self.sizes[:start])
+            return int(filled[-1]) if len(filled) else None
+
+        offset = 0 if start is None else start + 1
+        filled = np.flatnonzero(self.sizes[offset:])
+        return int(filled[0]) + offset if len(filled) else None
+
+    def best_levels(self):
+        """
+        Yields (price, level) for every price level with orders, starting from the best price
+        and moving towards worse prices
+        """
+        ascending = self.type == "asks"
+        levels = iter(()) if self.best_index is None else self.walk_levels(self.best_index, ascending=ascending)
+
+        if self.overflow.root is None:
+            return levels
+
+        return self.merge_levels(levels, self.overflow.best_levels(), descending=not ascending)
+
+    def ascending_levels(self, start_price=None):
+        """
+        Yields (price, level) for every price level with orders in ascending price order
+        :param start_price: Start from the lowest price level at or above this price
+        """
+        if self.base is None:
+            return iter(())
+
+        start = 0 if start_price is None else max(0, start_price - self.base)
+        levels = self.walk_levels(start, ascending=True)
+
+        if self.overflow.root is None:
+            return levels
+
+        return self.merge_levels(levels, self.overflow.ascending_levels(start_price), descending=False)
+
+    def descending_levels(self, start_price=None):
+        """
+        Yields (price, level) for every price level with orders in descending price order
+        :param start_price: Start from the highest price level at or below this price
+        """
+        if self.base is None:
+            return iter(())
+
+        start = self.size - 1 if start_price is None else min(self.size - 1, start_price - self.base)
+        levels = self.walk_levels(start, ascending=False)
+
+        if self.overflow.root is None:
+            return levels
+
+        return self.merge_levels(levels, self.overflow.descending_levels(start_price), descending=True)
+
+    def walk_levels(self, start, ascending, chunk_size=64):
+        """
+        Lazily walks the ladder from an index, skipping empty ticks a chunk at a time
+        """
+        if ascending:
+            for chunk_start in range(start, self.size, chunk_size):
+                for i in np.flatnonzero(self.sizes[chunk_start:chunk_start + chunk_size]):
+                    level = self.levels[chunk_start + i]
+                    if level is not None and level.values:
+                        yield level.price, level
+        else:
+            for chunk_end in range(start + 1, 0, -chunk_size):
+                chunk_start = max(0, chunk_end - chunk_size)
+                for i in np.flatnonzero(self.sizes[chunk_start:chunk_end])[::-1]:
+                    level = self.levels[chunk_start + i]
+                    if level is not None and level.values:
+                        yield level.price, level
+
+    def find_best_node(self):
+        """
+        Find the best level with quantity by scanning the aggregate sizes and the overflow tree
+        """
+        index = self.find_best_index()
+        level = None if index is None else self.levels[index]
+        overflow_node = self.overflow.find_best_node()
+
+        if level is None or (overflow_node is not None and self.is_better(overflow_node.price, level.price)):
+            return overflow_node
+
+        return level
+
+    def widen_bounds(self, index):
+        if self.low_index is None or index < self.low_index:
+            self.low_index = index
+        if self.high_index is None or index > self.high_index:
+            self.high_index = index
+
+    def tighten_bounds(self):
+        """
+        Moves the occupied index bounds inwards past levels removed since they were set
+        """
+        levels = self.levels
+
+        while self.low_index is not None and levels[self.low_index] is None:
+            if self.low_index == self.high_index:
+                self.low_index = self.high_index = None
+            else:
+                self.low_index += 1
+
+        while self.high_index is not None and levels[self.high_index] is None:
+            self.high_index -= 1
+
+    def span_with(self, price):
+        """
+        Lowest and highest tick price of the occupied bounds and a new price
+        """
+        if self.low_index is None:
+            return price, price
+
+        return min(price, self.low_index + self.base), max(price, self.high_index + self.base)
+
+    def recenter(self, price):
+        """
+        Moves the ladder window so that it covers every live level in the window and the new price
+        Grows the ladder if the levels no longer fit, up to max_size
+        Overflow levels the new window covers are moved into it
+        Prices are checked against the occupied bounds, so a price sent to the overflow tree costs
+        no scan of the window, only the removals since the bounds were last tightened
+        :return: False if the levels cannot fit in max_size, the window is then left unchanged
+        """
+        self.tighten_bounds()
+        low, high = self.span_with(price)
+
+        if high - low + 1 > self.max_size // 2:
+            return False
+
+        occupied = [] if self.low_index is None else \
+            [i for i in range(self.low_index, self.high_index + 1) if self.levels[i] is not None]
+
+        size = self.size
+        while high - low + 1 > size // 2:
+            size *= 2
+
+        new_base = (low + high) // 2 - size // 2
+        sizes = np.zeros(size, dtype=np.int64)
+        levels = [None] * size
+
+        for i in occupied:
+            new_index = i + self.base - new_base
+            sizes[new_index] = self.sizes[i]
+            levels[new_index] = self.levels[i]
+
+        if self.best_index is not None:
+            self.best_index += self.base - new_base
+
+        if self.low_index is not None:
+            self.low_index += self.base - new_base
+            self.high_index += self.base - new_base
+
+        self.size = size
+        self.base = new_base
+        self.sizes = sizes
+        self.levels = levels
+
+        if self.overflow.root is not None:
+            self.take_overflow()
+
+        return True
+
+    def take_overflow(self):
+        """
+        Moves the overflow levels inside the window into it, keeping the level objects
+        """
+        moved = []
+        node = self.overflow.ceiling_node(self.base)
+
+        while node is not None and node.price < self.base + self.size:
+            moved.append(node)
+            node = self.overflow.successor(node)
+
+        for node in moved:
+            self.overflow.remove_node(node)
+            index = node.price - self.base
+            self.levels[index] = node
+            self.sizes[index] = node.quantity
+            self.widen_bounds(index)
+
+            if node.values and (self.best_index is None or self.is_better(index, self.best_index)):
+                self.best_index = index
+
+    def get_best_bid(self):
+        """
+        Return the order with the best bid
+        :return: Order
+        """
+        if self.type != "bids":
+            raise ValueError("INVALID: THIS IS FOR BIDS")
+
+        if self.node_count == 0:
+            raise EmptyBookError("CURRENTLY NO BIDS IN BOOK")
+
+        return self.get_best_order()
+
+    def get_best_ask(self):
+        """
+        Return the order with the best ask
+        :return: Order
+        """
+        if self.type != "asks":
+            raise ValueError("INVALID: THIS IS FOR ASKS")
+
+        if self.node_count == 0:
+            raise EmptyBookError("CURRENTLY NO ASKS IN BOOK")
+
+        return self.get_best_order()
+
+    def get_best_node(self):
+        """
+        Return the best price level with orders
+        """
+        level = self.best_node
+
+        if level is None or not level.values:
+            return None
+
+        return level
+
+    def get_best_order(self):
+        """
+        Return the first order at the best price level
+        """
+        level = self.get_best_node()
+
+        if level is None:
+            return None
+
+        return level.values[next(iter(level.values))]
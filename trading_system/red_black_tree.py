@@ -1,18 +1,34 @@
-from collections import OrderedDict
-
 class Node:
+    __slots__ = ("parent", "left", "right", "price", "values", "quantity", "colour")
+
     def __init__(self, price, parent=None, left=None, right=None):
         """
         :param price: The price of the node
-        values: OrderedDict storing Order objects in the form "order_id" : Order
+        values: dict storing Order objects in insertion order in the form "order_id" : Order
+        quantity: Total quantity resting at the node
         """
         self.parent = parent
         self.left = left
         self.right = right
         self.price = price
-        self.values = OrderedDict()
+        self.values = {}
+        self.quantity = 0
         self.colour = None
 
+    def __setstate__(self, state):
+        """
+        Restores the slots, also from a node pickled before __slots__ whose state is its __dict__
+        and that had no level quantity
+        """
+        if isinstance(state, tuple):
+            state = state[1]
+        else:
+            state = dict(state, values=dict(state["values"]))
+            state.setdefault("quantity", sum(order.quantity for order in state["values"].values()))
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
 class RedBlackTree:
     def __init__(self, type):
@@ -22,6 +38,7 @@ class RedBlackTree:
         self.type = type
         self.node_count = 0
         self.levels = None
+        self.best_node = None  # Best price node, kept up to date on insert and lazily on removal
 
     def add_price(self, price):
         """
@@ -33,6 +50,7 @@ class RedBlackTree:
             self.root = Node(price=price)
             self.root.colour = "black"
             self.node_count += 1
+            self.update_best(self.root)
             return self.root
 
         current = self.root
@@ -42,6 +60,7 @@ class RedBlackTree:
             parent = current
 
             if price == current.price:
+                self.update_best(current)
                 return current
             elif price < current.price:
                 current = current.left
@@ -58,8 +77,138 @@ class RedBlackTree:
 
         self.rebalance_red_black(new_node)
         self.node_count += 1
+        self.update_best(new_node)
         return new_node
 
+    def update_best(self, node):
+        """
+        Moves the best price pointer to a node if it is a better price than the current best
+        Called when an order is about to be placed on the node
+        """
+        if self.best_node is None or self.is_better(node.price, self.best_node.price):
+            self.best_node = node
+
+    def is_better(self, price, other_price):
+        """
+        Check if a price is better than another price for this side of the book
+        """
+        if self.type == "bids":
+            return price > other_price
+        return price < other_price
+
+    def successor(self, node):
+        """
+        Return the node with the next highest price
+        """
+        if node.right is not None:
+            node = node.right
+            while node.left is not None:
+                node = node.left
+            return node
+
+        parent = node.parent
+        while parent is not None and node == parent.right:
+            node = parent
+            parent = parent.parent
+        return parent
+
+    def predecessor(self, node):
+        """
+        Return the node with the next lowest price
+        """
+        if node.left is not None:
+            node = node.left
+            while node.right is not None:
+                node = node.right
+            return node
+
+        parent = node.parent
+        while parent is not None and node == parent.left:
+            node = parent
+            parent = parent.parent
+        return parent
+
+    def remove_node(self, node):
+        """
+        Removes a price node from the tree
+        Re-balances tree if a black node was removed
+        Moves the best price pointer to the next level if the best node was removed
+        """
+        if node is self.best_node:
+            if self.type == "bids":
+                self.best_node = self.predecessor(node)
+            else:
+                self.best_node = self.successor(node)
+
+        removed_colour = node.colour
+
+        if node.left is None:
+            child = node.right
+            child_parent = node.parent
+            self.transplant(node, node.right)
+        elif node.right is None:
+            child = node.left
+            child_parent = node.parent
+            self.transplant(node, node.left)
+        else:
+            # Replace node with its successor so other price nodes keep their identity
+            successor = node.right
+            while successor.left is not None:
+                successor = successor.left
+
+            removed_colour = successor.colour
+            child = successor.right
+
+            if successor.parent is node:
+                child_parent = successor
+            else:
+                child_parent = successor.parent
+                self.transplant(successor, successor.right)
+                successor.right = node.right
+                successor.right.parent = successor
+
+            self.transplant(node, successor)
+            successor.left = node.left
+            successor.left.parent = successor
+            successor.colour = node.colour
+
+        if removed_colour == "black":
+            self.rebalance_delete(child, child_parent)
+
+        node.parent = node.left = node.right = None
+        self.node_count -= 1
+
+    def remove_price(self, price):
+        """
+        Removes the price node of a given price if it exists
+        """
+        price_node = self.search_price(price)
+
+        if price_node is not None:
+            self.remove_node(price_node)
+
+        return price_node
+
+    def transplant(self, node, replacement):
+        """
+        Replaces the subtree rooted at node with the subtree rooted at replacement
+        """
+        if node.parent is None:
+            self.root = replacement
+        elif node is node.parent.left:
+            node.parent.left = replacement
+        else:
+            node.parent.right = replacement
+
+        if replacement is not None:
+            replacement.parent = node.parent
+
+    def adjust_quantity(self, node, quantity):
+        """
+        Adds quantity to the total quantity of a price node
+        """
+        node.quantity += quantity
+
     def rotate_left(self, node):
         right_child = node.right
         node.right = right_child.left
@@ -143,6 +292,73 @@ class RedBlackTree:
 
         self.root.colour = "black"
 
+    def rebalance_delete(self, node, parent):
+        """
+        Re-balances tree after a black node is removed
+        :param node: Node that replaced the removed node, can be None
+        :param parent: Parent of node, needed when node is None
+        """
+        while node is not self.root and (node is None or node.colour == "black"):
+            if node is parent.left:
+                sibling = parent.right
+
+                if sibling.colour == "red":
+                    sibling.colour = "black"
+                    parent.colour = "red"
+                    self.rotate_left(parent)
+                    sibling = parent.right
+
+                if self.is_black(sibling.left) and self.is_black(sibling.right):
+                    sibling.colour = "red"
+                    node = parent
+                    parent = node.parent
+                else:
+                    # Sibling's far child is black
+                    if self.is_black(sibling.right):
+                        sibling.left.colour = "black"
+                        sibling.colour = "red"
+                        self.rotate_right(sibling)
+                        sibling = parent.right
+
+                    sibling.colour = parent.colour
+                    parent.colour = "black"
+                    sibling.right.colour = "black"
+                    self.rotate_left(parent)
+                    node = self.root
+            else:
+                sibling = parent.left
+
+                if sibling.colour == "red":
+                    sibling.colour = "black"
+                    parent.colour = "red"
+                    self.rotate_right(parent)
+                    sibling = parent.left
+
+                if self.is_black(sibling.left) and self.is_black(sibling.right):
+                    sibling.colour = "red"
+                    node = parent
+                    parent = node.parent
+                else:
+                    # Sibling's far child is black
+                    if self.is_black(sibling.left):
+                        sibling.right.colour = "black"
+                        sibling.colour = "red"
+                        self.rotate_left(sibling)
+                        sibling = parent.left
+
+                    sibling.colour = parent.colour
+                    parent.colour = "black"
+                    sibling.left.colour = "black"
+                    self.rotate_right(parent)
+                    node = self.root
+
+        if node is not None:
+            node.colour = "black"
+
+    @staticmethod
+    def is_black(node):
+        return node is None or node.colour == "black"
+
     def search_price(self, price):
         """
         Search for a price node of a given price
@@ -173,30 +389,7 @@ class RedBlackTree:
         if self.root is None:
             raise EmptyBookError("CURRENTLY NO BIDS IN BOOK")
 
-        current_price_node = self.root
-
-        # Find node furthest to the right
-        while current_price_node.right is not None:
-            current_price_node = current_price_node.right
-
-        # Traverse backwards
-        while current_price_node is not None:
-            if len(current_price_node.values) > 0:
-                first_order_id = next(iter(current_price_node.values))
-                return current_price_node.values[first_order_id]
-
-            if current_price_node.left is not None:
-                current_price_node = current_price_node.left
-                while current_price_node.right is not None:
-                    current_price_node = current_price_node.right
-            else:
-                parent = current_price_node.parent
-                while parent is not None and current_price_node == parent.left:
-                    current_price_node = parent
-                    parent = parent.parent
-                current_price_node = parent
-
-        return None
+        return self.get_best_order()
 
     def get_best_ask(self):
         """
@@ -209,30 +402,148 @@ class RedBlackTree:
         if self.root is None:
             raise EmptyBookError("CURRENTLY NO ASKS IN BOOK")
 
+        return self.get_best_order()
+
+    def get_best_node(self):
+        """
+        Return the best price node with orders
+        Empty nodes are removed from the tree, so this only steps past a node that has
+        just been created and has no orders yet
+        """
+        current_price_node = self.best_node
+
+        while current_price_node is not None and not current_price_node.values:
+            if self.type == "bids":
+                current_price_node = self.predecessor(current_price_node)
+            else:
+                current_price_node = self.successor(current_price_node)
+
+        self.best_node = current_price_node
+        return current_price_node
+
+    def get_best_order(self):
+        """
+        Return the first order at the best price node
+        """
+        current_price_node = self.get_best_node()
+
+        if current_price_node is None:
+            return None
+
+        return current_price_node.values[next(iter(current_price_node.values))]
+
+    def best_levels(self):
+        """
+        Yields (price, node) for every price node with orders, starting from the best price
+        and moving towards worse prices
+        """
+        return self.walk_levels(self.get_best_node(), ascending=self.type == "asks")
+
+    def ascending_levels(self, start_price=None):
+        """
+        Yields (price, node) for every price node with orders in ascending price order
+        :param start_price: Start from the lowest price node at or above this price
+        """
+        if start_price is None:
+            start_node = self.root
+            while start_node is not None and start_node.left is not None:
+                start_node = start_node.left
+        else:
+            start_node = self.ceiling_node(start_price)
+
+        return self.walk_levels(start_node, ascending=True)
+
+    def descending_levels(self, start_price=None):
+        """
+        Yields (price, node) for every price node with orders in descending price order
+        :param start_price: Start from the highest price node at or below this price
+        """
+        if start_price is None:
+            start_node = self.root
+            while start_node is not None and start_node.right is not None:
+                start_node = start_node.right
+        else:
+            start_node = self.floor_node(start_price)
+
+        return self.walk_levels(start_node, ascending=False)
+
+    def walk_levels(self, node, ascending):
+        """
+        Lazily walks the tree in order from a node, skipping empty nodes
+        The next node is found before yielding, so the yielded node can be removed by the caller
+        """
+        while node is not None:
+            next_node = self.successor(node) if ascending else self.predecessor(node)
+
+            if node.values:
+                yield node.price, node
+
+            node = next_node
+
+    def ceiling_node(self, price):
+        """
+        Return the price node with the lowest price at or above a given price
+        """
         current_price_node = self.root
+        ceiling = None
 
-        # Find node furthest to the left
-        while current_price_node.left is not None:
-            current_price_node = current_price_node.left
+        while current_price_node is not None:
+            if current_price_node.price == price:
+                return current_price_node
+
+            if price < current_price_node.price:
+                ceiling = current_price_node
+                current_price_node = current_price_node.left
+            else:
+                current_price_node = current_price_node.right
+
+        return ceiling
+
+    def floor_node(self, price):
+        """
+        Return the price node with the highest price at or below a given price
+        """
+        current_price_node = self.root
+        floor = None
 
-        # Traverse forwards until we find orders
         while current_price_node is not None:
-            if len(current_price_node.values) > 0:
-                first_order_id = next(iter(current_price_node.values))
-                return current_price_node.values[first_order_id]
+            if current_price_node.price == price:
+                return current_price_node
 
-            if current_price_node.right is not None:
+            if price > current_price_node.price:
+                floor = current_price_node
                 current_price_node = current_price_node.right
-                while current_price_node.left is not None:
-                    current_price_node = current_price_node.left
             else:
-                parent = current_price_node.parent
-                while parent is not None and current_price_node == parent.right:
-                    current_price_node = parent
-                    parent = parent.parent
-                current_price_node = parent
+                current_price_node = current_price_node.left
+
+        return floor
+
+    def find_best_node(self):
+        """
+        Find the best non-empty price node by walking down from the root
+        Does not use the cached best node
+        """
+        current_price_node = self.root
+
+        if current_price_node is None:
+            return None
 
-        return None
+        # Find node furthest to the right for bids or furthest to the left for asks
+        if self.type == "bids":
+            while current_price_node.right is not None:
+                current_price_node = current_price_node.right
+        else:
+            while current_price_node.left is not None:
+                current_price_node = current_price_node.left
+
+        # Traverse backwards for bids and forwards for asks until we find orders
+        while current_price_node is not None and not current_price_node.values:
+            if self.type == "bids":
+                current_price_node = self.predecessor(current_price_node)
+            else:
+                current_price_node = self.successor(current_price_node)
+
+        return current_price_node
 
 class EmptyBookError(Exception):
     pass
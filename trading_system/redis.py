@@ -1,10 +1,28 @@
-import pickle
+import json
 import redis
 import logging
+from operator import attrgetter
+import numpy as np
+from trading_system import snapshot
+from trading_system.order_book import Order, OrderBook
+from trading_system.repository import Repository
 
-class RedisRepository:
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
-        self.redis = redis.from_url(redis_url, decode_responses=False)
+class RedisRepository(Repository):
+    def __init__(self, redis_url: str = "redis://localhost:6379",
+                 max_connections: int = 16,
+                 chunk_bytes: int = 8 * 1024 * 1024,
+                 chunk_keys: int = 1000):
+        """
+        :param max_connections: Size of the connection pool shared by every command
+        :param chunk_bytes: Payload size after which save_many sends the keys collected so far
+        :param chunk_keys: Keys fetched by each MGET of load_many
+        """
+        self.pool = redis.ConnectionPool.from_url(redis_url, max_connections=max_connections,
+                                                  decode_responses=False)
+        self.redis = redis.Redis(connection_pool=self.pool)
+        self.chunk_bytes = chunk_bytes
+        self.chunk_keys = chunk_keys
+        self.round_trips = 0
         self.logger = logging.getLogger(__name__)
 
         try:
@@ -17,23 +35,376 @@ class RedisRepository:
     def save(self, key: str, data: any):
         """
         Serialises object then saves data to redis
+        Order books and portfolios are saved as binary snapshots
+        :return: True if the data was saved
         """
         try:
-            serialized = pickle.dumps(data)
+            serialized = snapshot.dumps(data)
+            self.round_trips += 1
             self.redis.set(key, serialized)
             self.logger.info(f"SAVED {key} TO REDIS")
+            return True
         except Exception as e:
             self.logger.error(f"FAILED TO SAVE {key} TO REDIS: {e}")
+            return False
 
     def load(self, key: str):
         """
         Load data from redis then serialise into an object
+        Data saved as a pickle before snapshots existed is still loaded
         """
         try:
+            self.round_trips += 1
             data = self.redis.get(key)
             if data:
-                result = pickle.loads(data)
+                result = snapshot.loads(data)
                 self.logger.info(f"LOADED {key} FROM REDIS")
                 return result
         except Exception as e:
             self.logger.warning(f"CORRUPTED DATA FOR {key}, RETURNING NONE: {e}")
+
+    def save_many(self, items: dict):
+        """
+        Serialises many objects then saves them with one MSET per chunk of up to chunk_bytes
+        Each chunk is sent as one pipeline, a failed chunk does not stop the others
+        :param items: key: object
+        :return: Keys that were saved
+        """
+        saved = []
+        chunk = {}
+        chunk_size = 0
+
+        def flush():
+            try:
+                self.round_trips += 1
+                pipeline = self.redis.pipeline(transaction=False)
+                pipeline.mset(chunk)
+                pipeline.execute()
+                saved.extend(chunk)
+            except Exception as e:
+                self.logger.error(f"FAILED TO SAVE {len(chunk)} KEYS TO REDIS: {e}")
+
+        for key, data in items.items():
+            try:
+                serialized = snapshot.dumps(data)
+            except Exception as e:
+                self.logger.error(f"FAILED TO SAVE {key} TO REDIS: {e}")
+                continue
+
+            chunk[key] = serialized
+            chunk_size += len(serialized)
+
+            if chunk_size >= self.chunk_bytes:
+                flush()
+                chunk = {}
+                chunk_size = 0
+
+        if chunk:
+            flush()
+
+        self.logger.info(f"SAVED {len(saved)} KEYS TO REDIS")
+        return saved
+
+    def load_many(self, keys: list):
+        """
+        Loads many keys with one pipeline of MGETs of chunk_keys keys each
+        Payload sizes are unknown before loading, so loads are chunked by key count
+        :return: key: object, None for missing or corrupted keys
+        """
+        keys = list(keys)
+        results = dict.fromkeys(keys)
+
+        if not keys:
+            return results
+
+        try:
+            self.round_trips += 1
+            pipeline = self.redis.pipeline(transaction=False)
+
+            for start in range(0, len(keys), self.chunk_keys):
+                pipeline.mget(keys[start:start + self.chunk_keys])
+
+            values = [value for chunk in pipeline.execute() for value in chunk]
+        except Exception as e:
+            self.logger.error(f"FAILED TO LOAD {len(keys)} KEYS FROM REDIS: {e}")
+            return results
+
+        for key, data in zip(keys, values):
+            if data:
+                try:
+                    results[key] = snapshot.loads(data)
+                except Exception as e:
+                    self.logger.warning(f"CORRUPTED DATA FOR {key}, RETURNING NONE: {e}")
+
+        self.logger.info(f"LOADED {sum(value is not None for value in results.values())} KEYS FROM REDIS")
+        return results
+
+    def keys(self, prefix: str):
+        """
+        Keys starting with a prefix, found with SCAN so redis is never blocked
+        """
+        return [key.decode() for key in self.redis.scan_iter(match=f"{prefix}*", count=self.chunk_keys)]
+
+
+class IncrementalRedisRepository(RedisRepository):
+    """
+    Stores order books as Redis structures instead of one snapshot per book
+    orderbook:{ticker}:meta              JSON settings and counters of the book
+    orderbook:{ticker}:bids / :asks      Sorted set of resting order ids scored by price
+    orderbook:{ticker}:stops             Sorted set of stop order ids scored by stop price
+    orderbook:{ticker}:order:{order_id}  Hash of one order
+    orderbook:{ticker}:trades            Stream of trades capped near the trade log capacity
+    orderbooks                           Set of stored tickers
+    After the first save only the orders changed since the last save and the new trades are written,
+    in one transaction per book. Everything else is stored as snapshots like RedisRepository.
+    """
+
+    def __init__(self, redis_url: str = "redis://localhost:6379", **kwargs):
+        super().__init__(redis_url=redis_url, **kwargs)
+        self.saved_trades = {}  # ticker: trades.count of the order book when it was last saved
+
+    @staticmethod
+    def ticker(key: str):
+        return key.split(":", 1)[1]
+
+    @staticmethod
+    def order_fields(order):
+        """
+        Hash fields of an order, None is stored as an empty string
+        """
+        return {
+            "side": order.side,
+            "order_kind": order.order_kind,
+            "time_in_force": order.time_in_force,
+            "post_only": int(order.post_only),
+            "order_price": "" if order.order_price is None else order.order_price,
+            "stop_price": "" if order.stop_price is None else order.stop_price,
+            "quantity": order.quantity,
+            "sequence": order.sequence,
+            "created_ns": order.created_ns or 0,
+            "expire_ns": order.expire_ns or 0,
+            "portfolio_id": order.portfolio_id
+        }
+
+    @staticmethod
+    def order_from_fields(order_id, fields, ticker, price_type):
+        order = Order(order_id=order_id,
+                      portfolio_id=fields[b"portfolio_id"].decode(),
+                      side=fields[b"side"].decode(),
+                      order_kind=fields[b"order_kind"].decode(),
+                      order_price=price_type(fields[b"order_price"]) if fields[b"order_price"] else None,
+                      quantity=int(fields[b"quantity"]),
+                      ticker=ticker,
+                      stop_price=price_type(fields[b"stop_price"]) if fields[b"stop_price"] else None,
+                      time_in_force=fields[b"time_in_force"].decode(),
+                      post_only=fields[b"post_only"] == b"1",
+                      expire_ns=int(fields[b"expire_ns"]) or None)
+        order.sequence = int(fields[b"sequence"])
+        order.created_ns = int(fields[b"created_ns"]) or None
+        return order
+
+    @staticmethod
+    def add_trades(pipeline, key, trades, count):
+        """
+        Appends the latest count trades held in memory to the trade stream
+        """
+        columns = trades.last(count)
+
+        for price, quantity, buyer_order_id, seller_order_id, sequence, created_ns in zip(
+                columns["price"].tolist(), columns["quantity"].tolist(), columns["buyer_order_id"].tolist(),
+                columns["seller_order_id"].tolist(), columns["sequence"].tolist(), columns["created_ns"].tolist()):
+            pipeline.xadd(key, {"price": price,
+                                "quantity": quantity,
+                                "buyer_order_id": buyer_order_id,
+                                "seller_order_id": seller_order_id,
+                                "sequence": sequence,
+                                "created_ns": created_ns}, maxlen=trades.capacity, approximate=True)
+
+    def write_orders(self, pipeline, key, order_book, order_ids):
+        """
+        Queues the current state of each order: a hash and a sorted set entry if the order is in the book
+        or the trigger book, deleted otherwise
+        """
+        sides = {"bid": {}, "ask": {}}
+        stops = {}
+        removed = []
+
+        for order_id in order_ids:
+            price_node = order_book.order_id_map.get(order_id)
+
+            if price_node is not None:
+                order = price_node.values[order_id]
+                sides[order.side][order_id] = order.order_price
+            elif order_id in order_book.stops.order_id_map:
+                order = order_book.stops.order_id_map[order_id].values[order_id]
+                stops[order_id] = order.stop_price
+            else:
+                removed.append(order_id)
+                continue
+
+            pipeline.hset(f"{key}:order:{order_id}", mapping=self.order_fields(order))
+
+        if sides["bid"]:
+            pipeline.zadd(f"{key}:bids", sides["bid"])
+        if sides["ask"]:
+            pipeline.zadd(f"{key}:asks", sides["ask"])
+        if stops:
+            pipeline.zadd(f"{key}:stops", stops)
+
+        # Triggered stops move from the stop set to a side
+        triggered = list(sides["bid"]) + list(sides["ask"])
+        if triggered:
+            pipeline.zrem(f"{key}:stops", *triggered)
+
+        if removed:
+            pipeline.delete(*[f"{key}:order:{order_id}" for order_id in removed])
+            pipeline.zrem(f"{key}:bids", *removed)
+            pipeline.zrem(f"{key}:asks", *removed)
+            pipeline.zrem(f"{key}:stops", *removed)
+
+    def save_order_book(self, key: str, order_book):
+        """
+        Writes the orders changed since the last save and the new trades in one transaction
+        Books that were not loaded or saved by this repository are rewritten completely
+        """
+        ticker = self.ticker(key)
+        changed_orders = order_book.changed_orders
+        new_trades = order_book.trades.count - self.saved_trades.get(ticker, 0)
+        pipeline = self.redis.pipeline(transaction=True)
+
+        # Trades that already left memory can not name the orders they filled
+        if new_trades > order_book.trades.live_count and changed_orders is not None:
+            self.logger.warning(f"{new_trades - order_book.trades.live_count} TRADES LEFT MEMORY BEFORE {key} "
+                                f"WAS SAVED, REWRITING THE ORDER BOOK")
+            changed_orders = None
+
+        if changed_orders is None or ticker not in self.saved_trades:
+            # Drop whatever was stored before, including a snapshot saved by RedisRepository
+            self.round_trips += 1
+            read = self.redis.pipeline(transaction=False)
+            for name in ("bids", "asks", "stops"):
+                read.zrange(f"{key}:{name}", 0, -1)
+            stored = read.execute()
+            stale = [f"{key}:order:{order_id.decode()}" for order_ids in stored for order_id in order_ids]
+            pipeline.delete(key, f"{key}:bids", f"{key}:asks", f"{key}:stops", f"{key}:trades", *stale)
+
+            order_ids = list(order_book.order_id_map) + list(order_book.stops.order_id_map)
+            new_trades = order_book.trades.live_count
+        else:
+            order_ids = list(changed_orders)
+
+            # Filled orders are named by the trades that filled them
+            if new_trades:
+                columns = order_book.trades.last(new_trades)
+                order_ids.extend(columns["buyer_order_id"].tolist())
+                order_ids.extend(columns["seller_order_id"].tolist())
+
+        self.write_orders(pipeline, key, order_book, dict.fromkeys(order_ids))
+        self.add_trades(pipeline, f"{key}:trades", order_book.trades, new_trades)
+        pipeline.set(f"{key}:meta", json.dumps(snapshot.order_book_metadata(order_book)))
+        pipeline.sadd("orderbooks", ticker)
+
+        self.round_trips += 1
+        pipeline.execute()
+
+        order_book.track_changes()
+        self.saved_trades[ticker] = order_book.trades.count
+
+    def load_order_book(self, key: str):
+        """
+        Rebuilds an order book from its sorted sets, order hashes and trade stream
+        Falls back to a snapshot saved by RedisRepository
+        """
+        ticker = self.ticker(key)
+        self.round_trips += 1
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.get(f"{key}:meta")
+        for name in ("bids", "asks", "stops"):
+            pipeline.zrange(f"{key}:{name}", 0, -1)
+        metadata, bids, asks, stops = pipeline.execute()
+
+        if metadata is None:
+            return super().load(key)
+
+        metadata = json.loads(metadata)
+        price_type = int if np.dtype(metadata["price_dtype"]).kind == "i" else float
+        live_count = min(metadata["trades"]["count"], metadata["trades"]["capacity"])
+        order_ids = [order_id.decode() for order_id in bids + asks + stops]
+
+        self.round_trips += 1
+        pipeline = self.redis.pipeline(transaction=False)
+        for order_id in order_ids:
+            pipeline.hgetall(f"{key}:order:{order_id}")
+        if live_count:
+            pipeline.xrevrange(f"{key}:trades", count=live_count)
+        results = pipeline.execute()
+
+        orders = [self.order_from_fields(order_id, fields, ticker, price_type)
+                  for order_id, fields in zip(order_ids, results) if fields]
+        orders.sort(key=attrgetter("sequence"))
+        order_book = snapshot.restore_order_book(metadata, orders)
+
+        entries = [fields for _, fields in reversed(results[len(order_ids)])] if live_count else []
+        order_book.trades = snapshot.restore_trades(
+            metadata,
+            prices=[price_type(fields[b"price"]) for fields in entries],
+            quantities=[int(fields[b"quantity"]) for fields in entries],
+            sequences=[int(fields[b"sequence"]) for fields in entries],
+            created_ns=[int(fields[b"created_ns"]) for fields in entries],
+            buyer_order_ids=[fields[b"buyer_order_id"].decode() for fields in entries],
+            seller_order_ids=[fields[b"seller_order_id"].decode() for fields in entries])
+
+        order_book.track_changes()
+        self.saved_trades[ticker] = order_book.trades.count
+        self.logger.info(f"LOADED {key} FROM REDIS WITH {len(orders)} ORDERS")
+
+        return order_book
+
+    def save(self, key: str, data: any):
+        if not isinstance(data, OrderBook):
+            return super().save(key, data)
+
+        try:
+            self.save_order_book(key, data)
+            self.logger.info(f"SAVED {key} TO REDIS")
+            return True
+        except Exception as e:
+            self.logger.error(f"FAILED TO SAVE {key} TO REDIS: {e}")
+            return False
+
+    def load(self, key: str):
+        if not key.startswith("orderbook:"):
+            return super().load(key)
+
+        try:
+            return self.load_order_book(key)
+        except Exception as e:
+            self.logger.warning(f"CORRUPTED DATA FOR {key}, RETURNING NONE: {e}")
+
+    def save_many(self, items: dict):
+        """
+        Each order book is saved in its own transaction, everything else is batched like RedisRepository
+        """
+        order_books = [key for key, data in items.items() if isinstance(data, OrderBook)]
+        others = dict((key, data) for key, data in items.items() if not isinstance(data, OrderBook))
+
+        return [key for key in order_books if self.save(key, items[key])] + super().save_many(others)
+
+    def load_many(self, keys: list):
+        keys = list(keys)
+        results = super().load_many([key for key in keys if not key.startswith("orderbook:")])
+        results.update((key, self.load(key)) for key in keys if key.startswith("orderbook:"))
+
+        return dict((key, results[key]) for key in keys)
+
+    def keys(self, prefix: str):
+        """
+        Order book keys come from the set of stored tickers, their structures share the prefix
+        """
+        if prefix != "orderbook:":
+            return super().keys(prefix)
+
+        stored = set(self.ticker(key) for key in super().keys(prefix) if key.count(":") == 1)
+        stored.update(ticker.decode() for ticker in self.redis.smembers("orderbooks"))
+
+        return [f"orderbook:{ticker}" for ticker in sorted(stored)]
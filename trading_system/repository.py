@@ -0,0 +1,265 @@
+import os
+import mmap
+import struct
+import logging
+from pathlib import Path
+from trading_system import snapshot
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+# key length, value length
+RECORD_HEADER = struct.Struct("<II")
+
+
+class Repository:
+    """
+    Interface of the stores order books and portfolios are saved to and loaded from
+    Keys are "orderbook:{ticker}" and "portfolio:{portfolio_id}"
+    """
+
+    def save(self, key: str, data: any):
+        """
+        :return: True if the data was saved
+        """
+        raise NotImplementedError
+
+    def load(self, key: str):
+        """
+        :return: The saved object, None if the key is missing or its data is corrupted
+        """
+        raise NotImplementedError
+
+    def keys(self, prefix: str):
+        """
+        Saved keys starting with a prefix
+        """
+        raise NotImplementedError
+
+    def save_many(self, items: dict):
+        """
+        :param items: key: object
+        :return: Keys that were saved
+        """
+        return [key for key, data in items.items() if self.save(key, data)]
+
+    def load_many(self, keys: list):
+        """
+        :return: key: object, None for missing or corrupted keys
+        """
+        return dict((key, self.load(key)) for key in keys)
+
+
+class MemoryRepository(Repository):
+    def __init__(self):
+        """
+        Keeps snapshots in a dict of the running process, nothing outlives it
+        Objects are still encoded, so a loaded object never shares state with the saved one
+        """
+        self.data = {}  # key: snapshot
+        self.logger = logging.getLogger(__name__)
+
+    def save(self, key: str, data: any):
+        try:
+            self.data[key] = snapshot.dumps(data)
+            return True
+        except Exception as e:
+            self.logger.error(f"FAILED TO SAVE {key}: {e}")
+            return False
+
+    def load(self, key: str):
+        data = self.data.get(key)
+
+        if data is None:
+            return None
+
+        try:
+            return snapshot.loads(data)
+        except Exception as e:
+            self.logger.warning(f"CORRUPTED DATA FOR {key}, RETURNING NONE: {e}")
+
+    def keys(self, prefix: str):
+        return [key for key in self.data if key.startswith(prefix)]
+
+
+class FileRepository(Repository):
+    def __init__(self, path=None, sync: bool = True, compact_ratio: float = 4.0):
+        """
+        Appends snapshots to a single file and reads them back through a memory map
+        Each record is a header, the key and the snapshot. The latest record of a key wins,
+        an index of key: (offset, length) is rebuilt by scanning the file on open.
+        :param path: Data file, defaults to data/repository.dat
+        :param sync: fsync after every save or batch of saves
+        :param compact_ratio: Rewrite the file once superseded records take this many times the live bytes
+        """
+        self.path = Path(path) if path else DATA_DIR / "repository.dat"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sync = sync
+        self.compact_ratio = compact_ratio
+        self.logger = logging.getLogger(__name__)
+        self.open()
+
+    def open(self):
+        self.file = open(self.path, "a+b")
+        self.map = None
+        self.index = {}  # key: (offset of the snapshot, length of the snapshot)
+        self.size = self.file.seek(0, os.SEEK_END)
+        self.live_bytes = 0
+        self.scan()
+
+    def scan(self):
+        """
+        Rebuilds the index from the file, dropping a partly written last record left by a crash
+        """
+        offset = 0
+
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        while offset + RECORD_HEADER.size <= self.size:
+            key_length, value_length = RECORD_HEADER.unpack_from(self.map, offset)
+            start = offset + RECORD_HEADER.size + key_length
+
+            if start + value_length > self.size:
+                break
+
+            key = self.map[offset + RECORD_HEADER.size:start].decode()
+            self.replace(key, start, value_length)
+            offset = start + value_length
+
+        if offset < self.size:
+            self.close_map()
+            self.file.truncate(offset)
+            self.size = offset
+            self.logger.warning(f"TRUNCATED PARTIAL RECORD IN {self.path}")
+
+    def replace(self, key, start, length):
+        previous = self.index.get(key)
+
+        if previous is not None:
+            self.live_bytes -= previous[1]
+
+        self.index[key] = (start, length)
+        self.live_bytes += length
+
+    def close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def save(self, key: str, data: any):
+        return bool(self.save_many({key: data}))
+
+    def save_many(self, items: dict):
+        """
+        Appends every snapshot in one write followed by one fsync
+        """
+        buffer = bytearray()
+        written = []  # (key, offset in buffer, length)
+
+        for key, data in items.items():
+            try:
+                value = snapshot.dumps(data)
+            except Exception as e:
+                self.logger.error(f"FAILED TO SAVE {key}: {e}")
+                continue
+
+            encoded = key.encode()
+            buffer += RECORD_HEADER.pack(len(encoded), len(value))
+            buffer += encoded
+            written.append((key, len(buffer), len(value)))
+            buffer += value
+
+        if not written:
+            return []
+
+        try:
+            self.file.write(buffer)
+            self.file.flush()
+
+            if self.sync:
+                os.fsync(self.file.fileno())
+        except Exception as e:
+            self.logger.error(f"FAILED TO SAVE {len(written)} KEYS TO {self.path}: {e}")
+            return []
+
+        for key, offset, length in written:
+            self.replace(key, self.size + offset, length)
+
+        self.size += len(buffer)
+
+        if self.size - self.live_bytes > self.compact_ratio * self.live_bytes:
+            self.compact()
+
+        return [key for key, _, _ in written]
+
+    def load(self, key: str):
+        location = self.index.get(key)
+
+        if location is None:
+            return None
+
+        start, length = location
+
+        # Remap once the file has grown past the current mapping
+        if self.map is None or len(self.map) < start + length:
+            self.close_map()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            return snapshot.loads(self.map[start:start + length])
+        except Exception as e:
+            self.logger.warning(f"CORRUPTED DATA FOR {key}, RETURNING NONE: {e}")
+
+    def keys(self, prefix: str):
+        return [key for key in self.index if key.startswith(prefix)]
+
+    def compact(self):
+        """
+        Rewrites the latest record of every key to a new file, then swaps it in
+        """
+        if self.map is None or len(self.map) < self.size:
+            self.close_map()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        compacted = self.path.with_suffix(self.path.suffix + ".compact")
+
+        with open(compacted, "wb") as file:
+            for key, (start, length) in self.index.items():
+                encoded = key.encode()
+                file.write(RECORD_HEADER.pack(len(encoded), length))
+                file.write(encoded)
+                file.write(self.map[start:start + length])
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.close()
+        os.replace(compacted, self.path)
+        self.open()
+        self.logger.info(f"COMPACTED {self.path} TO {self.size} BYTES")
+
+    def close(self):
+        self.close_map()
+        self.file.close()
+
+
+def create_repository(name: str = "memory", **options):
+    """
+    Creates a repository by name: "redis", "redis_incremental", "memory" or "file"
+    :param options: Keyword arguments of the repository, e.g. redis_url or path
+    """
+    if name == "memory":
+        return MemoryRepository(**options)
+    if name == "file":
+        return FileRepository(**options)
+
+    # Imported here so the redis client is only loaded when it is used
+    from trading_system.redis import RedisRepository, IncrementalRedisRepository
+
+    if name == "redis":
+        return RedisRepository(**options)
+    if name == "redis_incremental":
+        return IncrementalRedisRepository(**options)
+
+    raise ValueError("INVALID REPOSITORY")
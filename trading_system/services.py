@@ -104,6 +104,8 @@ class PortfolioService:
         if delete_position:
             del portfolio.positions[position_trade.ticker]
 
+        portfolio.version += 1
+
         self.logger.info(f"POSITION REQUEST {position_trade.trade_id} COMPLETED")
         return True
 
@@ -146,6 +148,7 @@ class PortfolioService:
         else:
             portfolio.cash -= (proceeds + commission)
 
+        portfolio.version += 1
         self.logger.info(f"POSITION {ticker} UPDATED SUCCESSFULLY")
         return True
 
@@ -180,6 +183,24 @@ class TradeService:
 
         return quantity_traded
 
+    def match_orders(self, orders, order_book):
+        """
+        Matches a batch of orders for one order book.
+        Returns the quantity traded for each order
+        """
+        return self.matching_engine.process_orders(orders=orders, order_book=order_book)["filled"]
+
+    def estimate_trade_request(self, position_request: PositionRequest):
+        """
+        Estimates the fill of a trade request from the current order book without trading.
+        Returns the fillable quantity, VWAP, worst price and slippage
+        """
+        order_book = self.book_manager.load_order_book(ticker=position_request.ticker)
+
+        return order_book.estimate_fill(side=position_request.side,
+                                        quantity=position_request.quantity,
+                                        limit_price=position_request.price)
+
     def update_portfolio(self, ticker: str,  portfolio: Portfolio, position_request: PositionRequest):
         """
         Updates a portfolio based on a position request.
@@ -195,36 +216,48 @@ class TradeService:
         """
         Goes through all trade requests in the portfolio.
         An order is made based on the position of the trade request.
-        Matching engine matches with another order in the order book.
-        If a match is found, a position is closed or open in the portfolio.
+        Orders are matched in one batch per order book.
+        If a match is found, a position is closed or open in the portfolio, in request order.
         """
         try:
             # Load portfolio
             portfolio = self.portfolio_manager.load_portfolio(portfolio_id=portfolio_id)
 
-            # Process trade requests in portfolio
+            # Create an order for each trade request, grouped by ticker
+            position_requests = []
+            orders_by_ticker = {}  # ticker: [(request number, Order)]
+
+            if portfolio.trade_requests:
+                portfolio.version += 1
+
             for i in range(len(portfolio.trade_requests)):
                 position_request = portfolio.trade_requests.popleft()
-                ticker = position_request.ticker
-                order_book = self.book_manager.load_order_book(ticker=ticker)
+                position_requests.append(position_request)
 
-                # Get the side of the trade request
-                side = position_request.side
-
-                # Create new order
-                order = Order(order_id=f"{portfolio.portfolio_id}_{len(order_book.order_id_map)}",
+                order = Order(order_id=f"{portfolio.portfolio_id}_{position_request.trade_id}",
                               order_kind="limit",
                               order_price=position_request.price,
-                              side=side,
+                              side=position_request.side,
                               portfolio_id=portfolio.portfolio_id,
                               quantity=position_request.quantity,
                               ticker=position_request.ticker
                               )
+                orders_by_ticker.setdefault(position_request.ticker, []).append((i, order))
+
+            # Match orders
+            quantities_traded = [0] * len(position_requests)
 
-                # Match order
-                quantity_traded = self.match_order(order=order, order_book=order_book)
+            for ticker, batch in orders_by_ticker.items():
+                order_book = self.book_manager.load_order_book(ticker=ticker)
+                filled = self.match_orders(orders=[order for _, order in batch], order_book=order_book)
+
+                for (i, _), quantity_traded in zip(batch, filled):
+                    quantities_traded[i] = int(quantity_traded)
+
+            # Check if trade occurred in order book, then update portfolio
+            for position_request, quantity_traded in zip(position_requests, quantities_traded):
+                ticker = position_request.ticker
 
-                # Check if trade occurred in order book, then update portfolio
                 if quantity_traded > 0:
                     self.update_portfolio(ticker=ticker, portfolio=portfolio, position_request=position_request)
                 else:
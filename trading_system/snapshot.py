@@ -0,0 +1,436 @@
+import gc
+import json
+import pickle
+import struct
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+from trading_system.order_book import Order, OrderBook, TIME_IN_FORCE
+from trading_system.portfolio import Portfolio, Position, PositionRequest
+from trading_system.timer_wheel import TimerWheel
+from trading_system.trade_log import TradeLog
+
+MAGIC = b"TSNP"
+SNAPSHOT_VERSION = 1
+KIND_ORDER_BOOK = 1
+KIND_PORTFOLIO = 2
+
+# magic, version, kind, metadata length
+HEADER = struct.Struct("<4sHBxI")
+LENGTH = struct.Struct("<q")
+
+SIDES = ("bid", "ask")
+ORDER_KINDS = ("market", "limit", "stop", "stop_limit")
+POSITION_TYPES = ("long", "short")
+CLOSE_OPEN = ("close", "open")
+
+# Order flag bits
+POST_ONLY = 1
+HAS_PRICE = 2
+HAS_STOP_PRICE = 4
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class SnapshotWriter:
+    def __init__(self, kind, metadata):
+        """
+        Builds a snapshot: a fixed header, JSON metadata, then length prefixed columns in schema order
+        """
+        encoded = json.dumps(metadata, separators=(",", ":")).encode()
+        self.parts = [HEADER.pack(MAGIC, SNAPSHOT_VERSION, kind, len(encoded)), encoded]
+
+    def array(self, values, dtype):
+        data = np.ascontiguousarray(values, dtype=dtype).tobytes()
+        self.parts.append(LENGTH.pack(len(data)))
+        self.parts.append(data)
+
+    def strings(self, values):
+        """
+        Writes strings as their lengths followed by one utf-8 blob
+        """
+        self.array(list(map(len, values)), np.int32)
+        data = "".join(values).encode()
+        self.parts.append(LENGTH.pack(len(data)))
+        self.parts.append(data)
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+class SnapshotReader:
+    def __init__(self, data):
+        """
+        Reads a snapshot written by SnapshotWriter, columns are zero copy views of the data
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("SNAPSHOT TOO SHORT")
+
+        magic, version, kind, metadata_length = HEADER.unpack_from(data)
+
+        if magic != MAGIC:
+            raise ValueError("NOT A SNAPSHOT")
+
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"UNSUPPORTED SNAPSHOT VERSION {version}")
+
+        self.data = memoryview(data)
+        self.kind = kind
+        self.offset = HEADER.size + metadata_length
+        self.metadata = json.loads(bytes(self.data[HEADER.size:self.offset]))
+
+    def block(self):
+        (length,) = LENGTH.unpack_from(self.data, self.offset)
+        start = self.offset + LENGTH.size
+        self.offset = start + length
+        return self.data[start:self.offset]
+
+    def array(self, dtype):
+        return np.frombuffer(self.block(), dtype=dtype)
+
+    def strings(self):
+        """
+        Slices the decoded blob by character lengths
+        """
+        ends = np.cumsum(self.array(np.int32), dtype=np.int64).tolist()
+        text = str(self.block(), "utf-8")
+        starts = [0] + ends[:-1]
+        return [text[start:end] for start, end in zip(starts, ends)]
+
+
+def is_snapshot(data):
+    return data[:len(MAGIC)] == MAGIC
+
+
+def book_orders(order_book):
+    """
+    Resting orders in price-time order, bids then asks, then stop orders in arrival order
+    """
+    orders = []
+
+    for side in (order_book.bids, order_book.asks):
+        for price, price_node in side.best_levels():
+            orders.extend(price_node.values.values())
+
+    stops = [price_node.values[order_id] for order_id, price_node in order_book.stops.order_id_map.items()]
+    stops.sort(key=lambda order: order.sequence)
+    orders.extend(stops)
+
+    return orders
+
+
+def order_book_metadata(order_book):
+    """
+    Settings and counters of an order book, everything but its orders and trades
+    """
+    trades = order_book.trades
+    expiries = order_book.expiries
+
+    return {
+        "ticker": order_book.ticker,
+        "tick_size": order_book.tick_size,
+        "backend": order_book.backend,
+        "record_time": order_book.record_time,
+        "sequence": order_book.sequence,
+        "mutations": order_book.mutations,
+        "session_close_ns": order_book.session_close_ns,
+        "journal_lsn": order_book.journal_lsn,
+        "price_dtype": np.dtype(trades.price_dtype).str,
+        "expiries": [expiries.resolution_ns, expiries.slots, expiries.levels, expiries.current_tick],
+        "trades": {
+            "capacity": trades.capacity,
+            "count": trades.count,
+            "instrument": trades.instrument,
+            "name": trades.name,
+            "spill_dir": None if trades.spill_dir is None else str(trades.spill_dir),
+            "spilled_chunks": [str(path) for path in trades.spilled_chunks]
+        }
+    }
+
+
+def encode_order_book(order_book):
+    """
+    Encodes an order book as flat columns of its orders and live trades
+    The journal is not encoded, journal_lsn records how far the snapshot got
+    """
+    orders = book_orders(order_book)
+    trades = order_book.trades
+    metadata = order_book_metadata(order_book)
+    price_dtype = metadata["price_dtype"]
+    writer = SnapshotWriter(KIND_ORDER_BOOK, metadata)
+
+    side_codes = {"bid": 0, "ask": 1}
+    kind_codes = dict((kind, code) for code, kind in enumerate(ORDER_KINDS))
+    time_in_force_codes = dict((time_in_force, code) for code, time_in_force in enumerate(TIME_IN_FORCE))
+
+    writer.array([side_codes[order.side] for order in orders], np.uint8)
+    writer.array([kind_codes[order.order_kind] for order in orders], np.uint8)
+    writer.array([time_in_force_codes[order.time_in_force] for order in orders], np.uint8)
+    writer.array([(POST_ONLY if order.post_only else 0)
+                  | (0 if order.order_price is None else HAS_PRICE)
+                  | (0 if order.stop_price is None else HAS_STOP_PRICE) for order in orders], np.uint8)
+    writer.array([order.order_price or 0 for order in orders], price_dtype)
+    writer.array([order.stop_price or 0 for order in orders], price_dtype)
+    writer.array([order.sequence for order in orders], np.int64)
+    writer.array([order.quantity for order in orders], np.int64)
+    writer.array([order.created_ns or 0 for order in orders], np.int64)
+    writer.array([order.expire_ns or 0 for order in orders], np.int64)
+    writer.strings([order.order_id for order in orders])
+    writer.strings([order.portfolio_id for order in orders])
+
+    live = trades.last(trades.live_count)
+    writer.array(live["price"], price_dtype)
+    writer.array(live["quantity"], np.int64)
+    writer.array(live["sequence"], np.int64)
+    writer.array(live["created_ns"], np.int64)
+    writer.strings(live["buyer_order_id"].tolist())
+    writer.strings(live["seller_order_id"].tolist())
+
+    return writer.getvalue()
+
+
+def restore_order_book(metadata, orders):
+    """
+    Builds an order book from its metadata and its orders in arrival order with one bulk load
+    Orders must already carry their sequence, the trade log is left empty
+    """
+    trade_metadata = metadata["trades"]
+    order_book = OrderBook(ticker=metadata["ticker"],
+                           tick_size=metadata["tick_size"],
+                           backend=metadata["backend"],
+                           record_time=metadata["record_time"],
+                           trade_capacity=trade_metadata["capacity"],
+                           trade_spill_dir=trade_metadata["spill_dir"],
+                           session_close_ns=metadata["session_close_ns"])
+    order_book.sequence = metadata["sequence"]
+    order_book.mutations = metadata["mutations"]
+    order_book.journal_lsn = metadata["journal_lsn"]
+
+    resolution_ns, slots, levels, current_tick = metadata["expiries"]
+    order_book.expiries = TimerWheel(resolution_ns=resolution_ns, slots=slots, levels=levels,
+                                     start_ns=current_tick * resolution_ns)
+
+    # Orders already have a sequence, so add_orders inserts them unchanged
+    order_book.add_orders(orders)
+
+    for order in orders:
+        if order.expire_ns is not None:
+            order_book.expiries.schedule(order.order_id, order.expire_ns)
+
+    return order_book
+
+
+def restore_trades(metadata, prices, quantities, sequences, created_ns, buyer_order_ids, seller_order_ids):
+    """
+    Builds a trade log from its metadata and the columns of its latest trades, oldest first
+    Fewer trades than the log held leave the oldest live positions empty
+    """
+    trade_metadata = metadata["trades"]
+    trades = TradeLog(capacity=trade_metadata["capacity"],
+                      price_dtype=np.dtype(metadata["price_dtype"]).type,
+                      spill_dir=trade_metadata["spill_dir"],
+                      name=trade_metadata["name"])
+    trades.instrument = trade_metadata["instrument"]
+    trades.spilled_chunks = [Path(path) for path in trade_metadata["spilled_chunks"]]
+    trades.count = trade_metadata["count"]
+    trades.allocate(trades.live_count)
+    positions = trades.live_positions(start=trades.live_count - len(prices))
+
+    trades.prices[positions] = prices
+    trades.quantities[positions] = quantities
+    trades.sequences[positions] = sequences
+    trades.created_ns[positions] = created_ns
+    trades.buyer_order_ids[positions] = buyer_order_ids
+    trades.seller_order_ids[positions] = seller_order_ids
+
+    return trades
+
+
+def decode_order_book(reader):
+    """
+    Rebuilds an order book from its snapshot columns with one bulk load
+    """
+    metadata = reader.metadata
+    price_dtype = metadata["price_dtype"]
+    ticker = metadata["ticker"]
+    columns = (reader.array(np.uint8).tolist(),
+               reader.array(np.uint8).tolist(),
+               reader.array(np.uint8).tolist(),
+               reader.array(np.uint8).tolist(),
+               reader.array(price_dtype).tolist(),
+               reader.array(price_dtype).tolist(),
+               reader.array(np.int64).tolist(),
+               reader.array(np.int64).tolist(),
+               reader.array(np.int64).tolist(),
+               reader.array(np.int64).tolist(),
+               reader.strings(),
+               reader.strings())
+    orders = []
+
+    for (side, order_kind, time_in_force, flags, price, stop_price, sequence, quantity, created_ns, expire_ns,
+         order_id, portfolio_id) in zip(*columns):
+        order = Order(order_id=order_id,
+                      portfolio_id=portfolio_id,
+                      side=SIDES[side],
+                      order_kind=ORDER_KINDS[order_kind],
+                      order_price=price if flags & HAS_PRICE else None,
+                      quantity=quantity,
+                      ticker=ticker,
+                      stop_price=stop_price if flags & HAS_STOP_PRICE else None,
+                      time_in_force=TIME_IN_FORCE[time_in_force],
+                      post_only=bool(flags & POST_ONLY),
+                      expire_ns=expire_ns or None)
+        order.sequence = sequence
+        order.created_ns = created_ns or None
+        orders.append(order)
+
+    order_book = restore_order_book(metadata, orders)
+    order_book.trades = restore_trades(metadata,
+                                       prices=reader.array(price_dtype),
+                                       quantities=reader.array(np.int64),
+                                       sequences=reader.array(np.int64),
+                                       created_ns=reader.array(np.int64),
+                                       buyer_order_ids=reader.strings(),
+                                       seller_order_ids=reader.strings())
+
+    return order_book
+
+
+def to_microseconds(timestamp):
+    return (timestamp - EPOCH) // MICROSECOND
+
+
+def encode_requests(writer, requests):
+    writer.strings([request.trade_id for request in requests])
+    writer.strings([request.ticker for request in requests])
+    writer.array([SIDES.index(request.side) for request in requests], np.uint8)
+    writer.array([CLOSE_OPEN.index(request.close_open) for request in requests], np.uint8)
+    writer.array([request.quantity for request in requests], np.float64)
+    writer.array([request.price for request in requests], np.float64)
+    writer.array([request.commission for request in requests], np.float64)
+    writer.array([to_microseconds(request.timestamp) for request in requests], np.int64)
+
+
+def decode_requests(reader):
+    columns = (reader.strings(),
+               reader.strings(),
+               reader.array(np.uint8).tolist(),
+               reader.array(np.uint8).tolist(),
+               reader.array(np.float64).tolist(),
+               reader.array(np.float64).tolist(),
+               reader.array(np.float64).tolist(),
+               reader.array(np.int64).tolist())
+
+    return [PositionRequest(trade_id=trade_id,
+                            ticker=ticker,
+                            side=SIDES[side],
+                            quantity=quantity,
+                            price=price,
+                            timestamp=EPOCH + timedelta(microseconds=timestamp),
+                            commission=commission,
+                            close_open=CLOSE_OPEN[close_open])
+            for trade_id, ticker, side, close_open, quantity, price, commission, timestamp in zip(*columns)]
+
+
+def encode_portfolio(portfolio):
+    """
+    Encodes a portfolio as columns of its positions and trade history
+    Queued trade requests are stored as indexes into the history when they are part of it
+    """
+    positions = list(portfolio.positions.values())
+    history = portfolio.position_trade_history
+    history_index = dict((id(request), i) for i, request in enumerate(history))
+    queued = list(portfolio.trade_requests)
+
+    writer = SnapshotWriter(KIND_PORTFOLIO, {
+        "portfolio_id": portfolio.portfolio_id,
+        "version": portfolio.version,
+        "cash": portfolio.cash,
+        "commission_rate": portfolio.commission_rate,
+        "max_position_size": portfolio.max_position_size
+    })
+
+    writer.strings(list(portfolio.positions))
+    writer.strings([position.ticker for position in positions])
+    writer.array([POSITION_TYPES.index(position.position_type) for position in positions], np.uint8)
+    writer.array([position.entry_price for position in positions], np.float64)
+    writer.array([position.quantity for position in positions], np.float64)
+    writer.array([position.take_profit for position in positions], np.float64)
+
+    encode_requests(writer, history)
+    writer.array([history_index.get(id(request), -1) for request in queued], np.int64)
+    encode_requests(writer, [request for request in queued if id(request) not in history_index])
+
+    return writer.getvalue()
+
+
+def decode_portfolio(reader):
+    metadata = reader.metadata
+    portfolio = Portfolio(portfolio_id=metadata["portfolio_id"])
+    portfolio.version = metadata["version"]
+    portfolio.cash = metadata["cash"]
+    portfolio.commission_rate = metadata["commission_rate"]
+    portfolio.max_position_size = metadata["max_position_size"]
+
+    keys = reader.strings()
+    columns = (reader.strings(),
+               reader.array(np.uint8).tolist(),
+               reader.array(np.float64).tolist(),
+               reader.array(np.float64).tolist(),
+               reader.array(np.float64).tolist())
+    portfolio.positions = dict((key, Position(ticker=ticker,
+                                              position_type=POSITION_TYPES[position_type],
+                                              entry_price=entry_price,
+                                              quantity=quantity,
+                                              take_profit=take_profit))
+                               for key, (ticker, position_type, entry_price, quantity, take_profit)
+                               in zip(keys, zip(*columns)))
+
+    portfolio.position_trade_history = decode_requests(reader)
+    queued_index = reader.array(np.int64).tolist()
+    others = iter(decode_requests(reader))
+    portfolio.trade_requests = deque(portfolio.position_trade_history[i] if i >= 0 else next(others)
+                                     for i in queued_index)
+
+    return portfolio
+
+
+def dumps(data):
+    """
+    Encodes order books and portfolios as snapshots, anything else is pickled
+    """
+    if isinstance(data, OrderBook):
+        return encode_order_book(data)
+
+    if isinstance(data, Portfolio):
+        return encode_portfolio(data)
+
+    return pickle.dumps(data)
+
+
+def loads(data):
+    """
+    Decodes a snapshot, data saved before snapshots existed is unpickled
+    """
+    if not is_snapshot(data):
+        return pickle.loads(data)
+
+    reader = SnapshotReader(data)
+
+    if reader.kind == KIND_ORDER_BOOK:
+        # Collections triggered by millions of new orders would only find live objects
+        gc_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            return decode_order_book(reader)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    if reader.kind == KIND_PORTFOLIO:
+        return decode_portfolio(reader)
+
+    raise ValueError(f"UNKNOWN SNAPSHOT KIND {reader.kind}")
@@ -0,0 +1,151 @@
+import time
+
+
+class TimerWheel:
+    def __init__(self, resolution_ns: int = 1000000, slots: int = 256, levels: int = 4, start_ns: int = None):
+        """
+        Hierarchical timer wheel. Each level covers slots times the span of the level below it.
+        Timers due on the same tick share a group, so scheduling and cancelling are O(1) and
+        cascading moves whole groups. Advancing only visits due slots, jumping over empty stretches.
+        :param resolution_ns: Length of one tick in nanoseconds
+        :param slots: Slots per level, must be a power of two
+        :param levels: Number of levels. Timers beyond the top level are re-checked every rotation.
+        :param start_ns: Time the wheel starts at, defaults to now
+        """
+        if slots <= 0 or slots & (slots - 1):
+            raise ValueError("TIMER WHEEL SLOTS MUST BE A POWER OF TWO")
+
+        self.resolution_ns = resolution_ns
+        self.slots = slots
+        self.levels = levels
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.current_tick = (time.time_ns() if start_ns is None else start_ns) // resolution_ns
+        self.wheels = [[{} for _ in range(slots)] for _ in range(levels)]  # expiry tick: {key: None}
+        self.level_counts = [0] * levels  # Number of groups at each level
+        self.group_levels = {}  # expiry tick: level holding its group
+        self.timer_map = {}  # key: expiry tick
+
+    def __len__(self):
+        return len(self.timer_map)
+
+    def slot(self, level, expire_tick):
+        return self.wheels[level][(expire_tick >> (self.bits * level)) & self.mask]
+
+    def schedule(self, key, expire_ns):
+        """
+        Schedules a key to expire at a time in nanoseconds
+        Keys that are already due expire on the next advance
+        """
+        if key in self.timer_map:
+            self.cancel(key)
+
+        expire_tick = max(expire_ns // self.resolution_ns, self.current_tick + 1)
+        level = self.group_levels.get(expire_tick)
+
+        if level is None:
+            self.place(expire_tick, {key: None})
+        else:
+            self.slot(level, expire_tick)[expire_tick][key] = None
+
+        self.timer_map[key] = expire_tick
+
+    def place(self, expire_tick, group):
+        """
+        Puts a group of timers in the lowest level whose span covers its remaining time
+        """
+        delta = expire_tick - self.current_tick
+        level = 0
+
+        while level < self.levels - 1 and delta >= 1 << (self.bits * (level + 1)):
+            level += 1
+
+        self.slot(level, expire_tick)[expire_tick] = group
+        self.group_levels[expire_tick] = level
+        self.level_counts[level] += 1
+
+    def cancel(self, key):
+        """
+        Removes a timer if it is scheduled
+        """
+        expire_tick = self.timer_map.pop(key, None)
+
+        if expire_tick is None:
+            return
+
+        level = self.group_levels[expire_tick]
+        slot = self.slot(level, expire_tick)
+        group = slot[expire_tick]
+        del group[key]
+
+        if not group:
+            del slot[expire_tick]
+            del self.group_levels[expire_tick]
+            self.level_counts[level] -= 1
+
+    def advance(self, now_ns: int):
+        """
+        Moves the wheel forward to a time in nanoseconds
+        :return: Keys that expired, in expiry order
+        """
+        target = now_ns // self.resolution_ns
+        expired = []
+
+        while self.current_tick < target:
+            if self.level_counts[0] == 0:
+                # Nothing can expire before the next boundary of the lowest occupied level
+                level = next((level for level in range(1, self.levels) if self.level_counts[level]), None)
+
+                if level is None:
+                    self.current_tick = target
+                    break
+
+                span = 1 << (self.bits * level)
+                boundary = (self.current_tick // span + 1) * span
+
+                if boundary > target:
+                    self.current_tick = target
+                    break
+
+                self.current_tick = boundary - 1
+
+            self.current_tick += 1
+            tick = self.current_tick
+
+            # Cascade coarse slots whose span starts at this tick, highest level first
+            cascade_levels = []
+            for level in range(1, self.levels):
+                if tick & ((1 << (self.bits * level)) - 1):
+                    break
+                cascade_levels.append(level)
+
+            for level in reversed(cascade_levels):
+                index = (tick >> (self.bits * level)) & self.mask
+                slot = self.wheels[level][index]
+
+                if slot:
+                    self.wheels[level][index] = {}
+                    self.level_counts[level] -= len(slot)
+
+                    for expire_tick, group in slot.items():
+                        self.place(expire_tick, group)
+
+            index = tick & self.mask
+            slot = self.wheels[0][index]
+
+            if slot:
+                self.wheels[0][index] = {}
+                self.level_counts[0] -= len(slot)
+
+                # Groups beyond the top level's span share the slot with the group due on this tick
+                for expire_tick, group in slot.items():
+                    if expire_tick > tick:
+                        self.place(expire_tick, group)
+                        continue
+
+                    del self.group_levels[expire_tick]
+                    for key in group:
+                        del self.timer_map[key]
+                    expired.extend(group)
+
+        return expired
@@ -0,0 +1,213 @@
+import logging
+from pathlib import Path
+import numpy as np
+from trading_system.matching_engine import OrderBookTrade
+
+COLUMNS = ("prices", "quantities", "buyer_order_ids", "seller_order_ids", "sequences", "created_ns")
+INITIAL_SIZE = 256  # Trades the columns hold before they first grow
+
+
+class TradeLog:
+    def __init__(self, capacity: int = 100000, price_dtype=np.float64, spill_dir: str = None, name: str = "trades"):
+        """
+        Columnar ring buffer of executed trades
+        Columns start small and double as trades arrive until they hold capacity trades
+        :param capacity: Number of trades kept in memory. Older trades are overwritten or spilled
+        :param price_dtype: np.int64 for books priced in ticks, np.float64 otherwise
+        :param spill_dir: Directory that full buffers are written to before they are overwritten
+        :param name: Prefix of spilled chunk files
+        """
+        if capacity <= 0:
+            raise ValueError("INVALID TRADE LOG CAPACITY")
+
+        self.capacity = capacity
+        self.price_dtype = price_dtype
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.name = name
+        self.instrument = "stock"
+        self.count = 0  # Total trades ever recorded, also the id of the next trade
+        self.spilled_chunks = []
+        self.journal = None  # Optional Journal trades are also written to
+        self.logger = logging.getLogger(__name__)
+        self.allocate()
+
+    def allocate(self, size: int = 0):
+        """
+        Allocates empty columns for at least size trades, between INITIAL_SIZE and the capacity
+        """
+        size = min(self.capacity, max(size, INITIAL_SIZE))
+        self.size = size
+        self.prices = np.zeros(size, dtype=self.price_dtype)
+        self.quantities = np.zeros(size, dtype=np.int64)
+        self.buyer_order_ids = np.empty(size, dtype=object)
+        self.seller_order_ids = np.empty(size, dtype=object)
+        self.sequences = np.zeros(size, dtype=np.int64)
+        self.created_ns = np.zeros(size, dtype=np.int64)
+
+    def grow(self):
+        """
+        Doubles the columns up to the capacity, keeping the trades recorded so far
+        Only called before the buffer first wraps, so positions are unchanged
+        """
+        count = self.size
+        columns = dict((column, getattr(self, column)) for column in COLUMNS)
+        self.allocate(2 * count)
+
+        for column, values in columns.items():
+            getattr(self, column)[:count] = values
+
+    def __len__(self):
+        return self.count
+
+    def record(self, buyer_order_id, seller_order_id, price, quantity, sequence, created_ns=None):
+        """
+        Appends a trade to the ring buffer
+        Spills the buffer to disk first if it is full and a spill directory is set
+        """
+        index = self.count % self.capacity
+
+        if index >= self.size:
+            self.grow()
+        elif index == 0 and self.count and self.spill_dir is not None:
+            self.spill()
+
+        self.prices[index] = price
+        self.quantities[index] = quantity
+        self.buyer_order_ids[index] = buyer_order_id
+        self.seller_order_ids[index] = seller_order_id
+        self.sequences[index] = sequence
+        self.created_ns[index] = created_ns or 0
+        self.count += 1
+
+        if self.journal is not None:
+            self.journal.trade(buyer_order_id, seller_order_id, price, quantity)
+
+    def append(self, trade: OrderBookTrade):
+        """
+        Appends an OrderBookTrade to the ring buffer
+        """
+        self.record(buyer_order_id=trade.buyer_order_id,
+                    seller_order_id=trade.seller_order_id,
+                    price=trade.price,
+                    quantity=trade.quantity,
+                    sequence=trade.sequence,
+                    created_ns=trade.created_ns)
+
+    def spill(self):
+        """
+        Writes the full buffer to a numbered chunk file
+        """
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"{self.name}_{len(self.spilled_chunks):06d}.npz"
+
+        np.savez(path,
+                 price=self.prices,
+                 quantity=self.quantities,
+                 buyer_order_id=self.buyer_order_ids.astype(str),
+                 seller_order_id=self.seller_order_ids.astype(str),
+                 sequence=self.sequences,
+                 created_ns=self.created_ns)
+
+        self.spilled_chunks.append(path)
+        self.logger.info(f"SPILLED {self.capacity} TRADES TO {path}")
+
+    @property
+    def live_count(self):
+        """
+        Number of trades still held in memory
+        """
+        return min(self.count, self.capacity)
+
+    @property
+    def last_price(self):
+        """
+        Price of the latest trade, None if no trade has been recorded
+        """
+        if self.count == 0:
+            return None
+        return self.prices[(self.count - 1) % self.capacity].item()
+
+    def live_positions(self, start=0):
+        """
+        Buffer positions of live trades from the start-th oldest, in chronological order
+        """
+        first = self.count - self.live_count + start
+        return np.arange(first, self.count) % self.capacity
+
+    def columns(self, positions):
+        """
+        Gather the trade columns at buffer positions
+        """
+        return {
+            "trade_id": np.arange(self.count - len(positions), self.count),
+            "price": self.prices[positions],
+            "quantity": self.quantities[positions],
+            "buyer_order_id": self.buyer_order_ids[positions],
+            "seller_order_id": self.seller_order_ids[positions],
+            "sequence": self.sequences[positions],
+            "created_ns": self.created_ns[positions]
+        }
+
+    def last(self, n: int):
+        """
+        Return the columns of the last n trades held in memory, oldest first
+        """
+        n = max(0, min(n, self.live_count))
+        return self.columns(self.live_positions(start=self.live_count - n))
+
+    def since(self, sequence: int):
+        """
+        Return the columns of trades held in memory with a sequence after a given sequence
+        """
+        positions = self.live_positions()
+        start = int(np.searchsorted(self.sequences[positions], sequence, side="right"))
+        return self.columns(positions[start:])
+
+    def __getitem__(self, trade_id):
+        """
+        Materialise a single trade as an OrderBookTrade
+        Negative ids count back from the latest trade
+        """
+        if trade_id < 0:
+            trade_id += self.count
+
+        if trade_id < self.count - self.live_count or trade_id >= self.count:
+            raise IndexError(f"TRADE {trade_id} NOT IN MEMORY")
+
+        index = trade_id % self.capacity
+        return OrderBookTrade(trade_id=str(trade_id),
+                              buyer_order_id=self.buyer_order_ids[index],
+                              seller_order_id=self.seller_order_ids[index],
+                              price=self.prices[index].item(),
+                              quantity=int(self.quantities[index]),
+                              instrument=self.instrument,
+                              sequence=int(self.sequences[index]),
+                              created_ns=int(self.created_ns[index]) or None)
+
+    def __iter__(self):
+        for trade_id in range(self.count - self.live_count, self.count):
+            yield self[trade_id]
+
+    def __getstate__(self):
+        """
+        Only the live trades are pickled, in chronological order
+        """
+        state = self.__dict__.copy()
+        del state["logger"]
+        state["journal"] = None
+        positions = self.live_positions()
+
+        for column in COLUMNS:
+            state[column] = state[column][positions]
+
+        return state
+
+    def __setstate__(self, state):
+        live = dict((column, state.pop(column)) for column in COLUMNS)
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(__name__)
+        self.allocate(self.live_count)
+
+        positions = self.live_positions()
+        for column, values in live.items():
+            getattr(self, column)[positions] = values
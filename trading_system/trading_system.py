@@ -1,6 +1,6 @@
 import logging
 from trading_system.order_book_simulator import OrderBookSimulator
-from trading_system.redis import RedisRepository
+from trading_system.repository import Repository, create_repository
 from trading_system.managers import OrderBookManager, PortfolioManager
 from trading_system.services import TradeService
 
@@ -10,9 +10,23 @@ class TradingSystem:
     Main system that coordinates managers and simulators
     """
 
-    def __init__(self):
-        self.repository = RedisRepository()
-        self.order_book_manager = OrderBookManager(self.repository)
+    def __init__(self, tick_sizes: dict = None, journal_dir: str = None, repository: Repository | str = "memory",
+                 repository_options: dict = None, warm_load: bool = False):
+        """
+        :param tick_sizes: Optional tick size per ticker, prices in those books are stored as integer ticks
+        :param journal_dir: Optional directory order book events are journaled to and recovered from
+        :param repository: Repository instance, or the name of one: "memory", the default, keeps snapshots in
+                           this process so no redis server is needed, "redis" saves binary snapshots,
+                           "redis_incremental" keeps order books in redis structures and only writes what
+                           changed, "file" appends them to a local file
+        :param repository_options: Keyword arguments of a named repository, e.g. max_connections or path
+        :param warm_load: Load every saved order book and portfolio at startup in batches
+        """
+        if isinstance(repository, str):
+            repository = create_repository(repository, **(repository_options or {}))
+
+        self.repository = repository
+        self.order_book_manager = OrderBookManager(self.repository, tick_sizes=tick_sizes, journal_dir=journal_dir)
         self.portfolio_manager = PortfolioManager(self.repository)
 
         self.trade_processor = TradeService(
@@ -22,7 +36,22 @@ class TradingSystem:
 
         self.logger = logging.getLogger(__name__)
 
+        if warm_load:
+            self.warm_load()
+
+    def warm_load(self):
+        """
+        Loads every saved order book and portfolio into memory in batches
+        """
+        order_books = self.order_book_manager.load_order_books()
+        portfolios = self.portfolio_manager.load_portfolios()
+        self.logger.info(f"WARM LOADED {len(order_books)} ORDER BOOKS AND {len(portfolios)} PORTFOLIOS")
+
     def __del__(self):
+        # __init__ may have failed before the managers were created, e.g. on an unknown repository
+        if getattr(self, "portfolio_manager", None) is None:
+            return
+
         self.save_all()
 
     def create_order_book_simulator(self, ticker: str):
@@ -39,10 +68,10 @@ class TradingSystem:
 
     def save_all(self):
         """
-        Save all order books and portfolios from memory into redis
+        Save the order books and portfolios that changed since they were last saved
+        :return: Tickers and portfolio ids that were saved
         """
-        for ticker in self.order_book_manager.order_books:
-            self.order_book_manager.save_order_book(ticker=ticker)
-
-        for portfolio_id in self.portfolio_manager.portfolios:
-            self.portfolio_manager.save_portfolio(portfolio_id=portfolio_id)
\ No newline at end of file
+        return {
+            "order_books": self.order_book_manager.save_all(),
+            "portfolios": self.portfolio_manager.save_all()
+        }
\ No newline at end of file
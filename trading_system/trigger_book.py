@@ -0,0 +1,99 @@
+from trading_system.red_black_tree import RedBlackTree
+
+STOP_KINDS = ("stop", "stop_limit")
+
+
+class TriggerBook:
+    def __init__(self):
+        """
+        Resting stop and stop-limit orders keyed by stop price
+        buy_stops: Buy stops trigger when the last trade price rises to the stop price,
+                   so the lowest stop price is the best node
+        sell_stops: Sell stops trigger when the last trade price falls to the stop price,
+                    so the highest stop price is the best node
+        """
+        self.buy_stops = RedBlackTree(type="asks")
+        self.sell_stops = RedBlackTree(type="bids")
+        self.order_id_map = {}  # order_id: stop price node
+
+    def __len__(self):
+        return len(self.order_id_map)
+
+    def add_order(self, order):
+        """
+        Adds a stop order to the trigger book
+        """
+        side = self.buy_stops if order.side == "bid" else self.sell_stops
+        price_node = side.add_price(order.stop_price)
+        price_node.values[order.order_id] = order
+        side.adjust_quantity(price_node, order.quantity)
+        self.order_id_map[order.order_id] = price_node
+
+    def cancel_order(self, order_id):
+        """
+        Deletes a stop order from the trigger book
+        Deletes the stop price node if it has no orders left
+        """
+        price_node = self.order_id_map.pop(order_id, None)
+
+        if price_node is None:
+            raise ValueError(f"ORDER {order_id} NOT FOUND")
+
+        order = price_node.values.pop(order_id)
+        side = self.buy_stops if order.side == "bid" else self.sell_stops
+
+        if not price_node.values:
+            side.remove_node(price_node)
+        else:
+            side.adjust_quantity(price_node, -order.quantity)
+
+        return order
+
+    def is_triggered(self, order, last_price):
+        """
+        Check if a stop order would trigger at the last trade price
+        """
+        if last_price is None:
+            return False
+
+        if order.side == "bid":
+            return last_price >= order.stop_price
+        return last_price <= order.stop_price
+
+    def release(self, last_price):
+        """
+        Removes and activates every stop triggered by the last trade price
+        Only the triggered stop price nodes are visited
+        :return: Triggered orders, buy stops from the lowest stop price then sell stops from the
+                 highest stop price, in arrival order within a stop price
+        """
+        triggered = []
+
+        if last_price is None:
+            return triggered
+
+        price_node = self.buy_stops.best_node
+        while price_node is not None and price_node.price <= last_price:
+            triggered.extend(price_node.values.values())
+            self.buy_stops.remove_node(price_node)
+            price_node = self.buy_stops.best_node
+
+        price_node = self.sell_stops.best_node
+        while price_node is not None and price_node.price >= last_price:
+            triggered.extend(price_node.values.values())
+            self.sell_stops.remove_node(price_node)
+            price_node = self.sell_stops.best_node
+
+        for order in triggered:
+            del self.order_id_map[order.order_id]
+            self.activate(order)
+
+        return triggered
+
+    @staticmethod
+    def activate(order):
+        """
+        Turns a triggered stop into a market order and a triggered stop-limit into a limit order
+        Like any market order, the unfilled quantity of a triggered stop is cancelled
+        """
+        order.order_kind = "market" if order.order_kind == "stop" else "limit"